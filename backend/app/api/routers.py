@@ -1,7 +1,10 @@
 
 from fastapi import APIRouter
-from app.api.v1 import chat, health
+from app.api.v1 import cache, chat, health, metrics, sessions
 
 api_router = APIRouter()
 api_router.include_router(chat.router, tags=["chat"])
+api_router.include_router(sessions.router, tags=["sessions"])
 api_router.include_router(health.router, tags=["health"])
+api_router.include_router(cache.router, tags=["cache"])
+api_router.include_router(metrics.router, tags=["metrics"])
@@ -0,0 +1,136 @@
+"""
+Chat responses in the Vercel AI SDK data stream protocol:
+    0:"text"\n        a piece of the answer
+    2:[{...}]\n       data (sources before the answer, timings after it)
+    3:"message"\n     an error after the response has started
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+logger = logging.getLogger("app.api.stream_writer")
+
+_encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+STREAM_ERROR_MESSAGE = "The answer could not be completed. Please try again."
+
+
+class ChatStreamWriter:
+    """
+    Writes a chat turn's tokens to the client as coalesced frames.
+
+    A producer task reads the token stream into a buffer. The first text is
+    sent as soon as it arrives; after that a text frame is cut when the buffer
+    holds `flush_chars` characters or its oldest token has waited
+    `flush_interval` seconds, and when the stream ends. While the client reads
+    slowly (the ASGI send waits), tokens keep collecting and go out as one
+    frame once it catches up. Data parts keep their place between the text.
+
+    Closing the frame iterator (the client disconnected) cancels the producer,
+    and with it the turn and its upstream generation.
+    """
+
+    def __init__(self, tokens: AsyncIterator[str], flush_interval: float = 0.05, flush_chars: int = 256):
+        self._tokens = tokens
+        self.flush_interval = flush_interval
+        self.flush_chars = flush_chars
+
+        self._frames: List[str] = []  # encoded frames waiting to be sent, in order
+        self._text: List[str] = []  # text not yet cut into a frame
+        self._text_chars = 0
+        self._text_since = 0.0
+        self._text_sent = False
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._pending = asyncio.Event()  # something to send
+        self._flush = asyncio.Event()  # send it now
+        self._started = asyncio.Event()  # first output, or the end
+        self._producer: Optional[asyncio.Task] = None
+
+    def data(self, part: Dict[str, Any]) -> None:
+        """Queue a data part after the text so far."""
+        self._cut_text()
+        self._frames.append(f"2:{_encode([part])}\n")
+        self._wake(flush=True)
+
+    def _write(self, token: str) -> None:
+        if not self._text:
+            self._text_since = time.perf_counter()
+        self._text.append(token)
+        self._text_chars += len(token)
+        # The first text goes out at once, so coalescing never delays the first token
+        self._wake(flush=self._text_chars >= self.flush_chars or not self._text_sent)
+
+    def _wake(self, flush: bool) -> None:
+        self._pending.set()
+        self._started.set()
+        if flush:
+            self._flush.set()
+
+    def _cut_text(self) -> None:
+        if self._text:
+            self._frames.append(f"0:{_encode(''.join(self._text))}\n")
+            self._text_sent = True
+            self._text.clear()
+            self._text_chars = 0
+
+    async def _produce(self) -> None:
+        try:
+            async for token in self._tokens:
+                if token:
+                    self._write(token)
+        except Exception as e:
+            self._error = e
+        finally:
+            self._done = True
+            self._wake(flush=True)
+
+    async def start(self) -> None:
+        """
+        Start the turn and wait for its first output. Raises the turn's error if
+        it failed before producing anything, so it can still become an HTTP error.
+        """
+        self._producer = asyncio.create_task(self._produce())
+        try:
+            await self._started.wait()
+        except asyncio.CancelledError:
+            self._producer.cancel()
+            raise
+        if self._error is not None and not self._frames and not self._text:
+            error, self._error = self._error, None
+            raise error
+
+    async def frames(self) -> AsyncIterator[str]:
+        try:
+            while True:
+                await self._pending.wait()
+                if not self._flush.is_set():
+                    remaining = self._text_since + self.flush_interval - time.perf_counter()
+                    if remaining > 0:
+                        try:
+                            await asyncio.wait_for(self._flush.wait(), timeout=remaining)
+                        except asyncio.TimeoutError:
+                            pass
+                self._pending.clear()
+                self._flush.clear()
+                self._cut_text()
+                if self._frames:
+                    chunk = "".join(self._frames)
+                    self._frames.clear()
+                    yield chunk
+                if self._done and not self._text:
+                    break
+            if self._error is not None:
+                logger.error(f"Streaming error: {self._error}")
+                yield f"3:{_encode(STREAM_ERROR_MESSAGE)}\n"
+        finally:
+            await self.aclose()
+
+    async def aclose(self) -> None:
+        """Stop the turn if it is still running (its token stream closes as the cancellation unwinds it)."""
+        if self._producer is not None and not self._producer.done():
+            self._producer.cancel()
+            await asyncio.wait({self._producer})
@@ -0,0 +1,12 @@
+
+from fastapi import APIRouter, Depends
+
+from app.services.warmup import get_ready_chat_service
+
+router = APIRouter()
+
+@router.get("/cache/stats")
+async def cache_stats(chat_service=Depends(get_ready_chat_service)):
+    if chat_service.response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **chat_service.response_cache.stats()}
@@ -1,10 +1,12 @@
 
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.responses import StreamingResponse
-from llama_index.core.llms import ChatMessage, MessageRole
 
+from app.api.stream_writer import ChatStreamWriter
+from app.core.config import settings
 from app.models.chat import ChatRequest
-from app.services.rag_engine import get_chat_service, ChatService
+from app.services.warmup import get_ready_chat_service
+from app.core.exceptions import ServiceOverloadedError
 from app.core.logging import logger
 
 router = APIRouter()
@@ -12,43 +14,68 @@ router = APIRouter()
 @router.post("/chat")
 async def chat_handler(
     request: ChatRequest,
-    chat_service: ChatService = Depends(get_chat_service)
+    chat_service=Depends(get_ready_chat_service)
 ):
     try:
         # Parse last message as the user query
         if not request.messages:
             raise HTTPException(status_code=400, detail="No messages provided")
-            
+
         last_message = request.messages[-1]
         if last_message.role != 'user':
              raise HTTPException(status_code=400, detail="Last message must be from user")
-        
+
         user_query = last_message.content
 
         # Convert previous messages to LlamaIndex ChatMessage history
+        # (imported here: llama_index loads in the background warm-up, not at app import)
+        from llama_index.core.llms import ChatMessage, MessageRole
+
         chat_history = []
         for msg in request.messages[:-1]:
             role = MessageRole.USER if msg.role == 'user' else MessageRole.ASSISTANT
             chat_history.append(ChatMessage(role=role, content=msg.content))
 
         logger.info(f"Processing chat request: {user_query[:50]}...")
-        
-        # Stream the response
-        chat_engine = chat_service.get_chat_engine()
-        response = chat_engine.stream_chat(user_query, chat_history=chat_history)
-        
-        # Generator function to yield text chunks
-        def event_generator():
-            try:
-                for token in response.response_gen:
-                    # Vercel AI SDK Data Stream Protocol: 0:{json_string_token}\n
-                    import json
-                    yield f"0:{json.dumps(token)}\n"
-            except Exception as e:
-                logger.error(f"Streaming error: {e}")
-                
-        return StreamingResponse(event_generator(), media_type="text/plain; charset=utf-8")
 
+        # Stream the response. Wait for the sources or the first token before
+        # returning, so that retrieval and upstream failures still surface as HTTP errors.
+        breakdown = {} if request.include_timings else None
+
+        def on_sources(sources):
+            # Data frame ahead of the answer: 2:[{"type": "sources", "sources": [{"file_name": ..., "page_label": ..., "score": ...}]}]\n
+            writer.data({"type": "sources", "sources": sources})
+
+        if request.session_id is not None:
+            # The history is kept on the server; the client only sends its new message
+            if chat_service.sessions is None:
+                raise HTTPException(status_code=400, detail="Sessions are disabled")
+            session = chat_service.sessions.get(request.session_id)
+            if session is None:
+                raise HTTPException(status_code=404, detail="Session not found or expired")
+            if not session.messages and chat_history:
+                chat_service.sessions.append(session, chat_history)
+            token_stream = chat_service.astream_session_chat(session, user_query, breakdown=breakdown, on_sources=on_sources)
+        else:
+            token_stream = chat_service.astream_chat(user_query, chat_history=chat_history, breakdown=breakdown, on_sources=on_sources)
+
+        async def turn():
+            async for token in token_stream:
+                yield token
+            if breakdown:
+                # Data frame after the answer: 2:[{"type": "timings", "route": ..., "stages_ms": {...}, "tokens": {...}}]\n
+                writer.data({"type": "timings", **breakdown})
+
+        writer = ChatStreamWriter(
+            turn(),
+            flush_interval=settings.STREAM_FLUSH_INTERVAL_MS / 1000,
+            flush_chars=settings.STREAM_FLUSH_CHARS,
+        )
+        await writer.start()
+        return StreamingResponse(writer.frames(), media_type="text/plain; charset=utf-8")
+
+    except (HTTPException, ServiceOverloadedError):
+        raise
     except Exception as e:
         logger.error(f"Error in chat endpoint: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
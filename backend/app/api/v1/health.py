@@ -1,8 +1,18 @@
-
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.services.warmup import readiness
 
 router = APIRouter()
 
 @router.get("/health")
+@router.get("/health/live")
 def health_check():
+    """Liveness: the process is up and serving requests (it may still be warming up)."""
     return {"status": "healthy"}
+
+@router.get("/health/ready")
+def readiness_check():
+    """Readiness: the chat pipeline is built and warmed; 503 until then."""
+    report = readiness.report()
+    return JSONResponse(status_code=200 if report["status"] == "ready" else 503, content=report)
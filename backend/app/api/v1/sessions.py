@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Depends, HTTPException, Response
+
+from app.models.chat import SessionResponse
+from app.services.warmup import get_ready_chat_service
+
+router = APIRouter()
+
+def get_session_store(chat_service=Depends(get_ready_chat_service)):
+    if chat_service.sessions is None:
+        raise HTTPException(status_code=400, detail="Sessions are disabled")
+    return chat_service.sessions
+
+@router.post("/sessions", response_model=SessionResponse, status_code=201)
+async def create_session(sessions=Depends(get_session_store)):
+    return SessionResponse(session_id=sessions.create().session_id)
+
+@router.delete("/sessions/{session_id}", status_code=204)
+async def delete_session(session_id: str, sessions=Depends(get_session_store)):
+    if not sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found or expired")
+    return Response(status_code=204)
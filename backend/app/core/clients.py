@@ -0,0 +1,152 @@
+"""
+Shared upstream clients (OpenAI, Pinecone, Cohere) with pooled keep-alive connections.
+
+Every entry point (the chat service, scripts/ingest.py, evals/evaluate.py) builds
+its provider clients here, so one process keeps one connection pool per
+provider instead of one per client object, and idle connections survive the gap
+between chat turns (HTTP_KEEPALIVE_SECONDS instead of httpx's 5 s). OpenAI and
+Cohere speak HTTP/2 when the `h2` package is installed.
+
+Retries are left to each SDK, bounded by UPSTREAM_MAX_RETRIES; all three back
+off exponentially with jitter. Provider SDKs are imported lazily so importing
+this module stays cheap (see app/services/warmup.py).
+"""
+
+import importlib.util
+import threading
+from functools import lru_cache
+from typing import Any, Dict
+
+import httpx
+
+from app.core.config import settings
+
+
+def _timeout(provider: str) -> httpx.Timeout:
+    seconds = {"openai": settings.OPENAI_TIMEOUT, "cohere": settings.COHERE_TIMEOUT}[provider]
+    return httpx.Timeout(seconds, connect=settings.HTTP_CONNECT_TIMEOUT)
+
+
+def _transport_options() -> Dict[str, Any]:
+    http2 = settings.HTTP2_ENABLED and importlib.util.find_spec("h2") is not None
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_SECONDS,
+    )
+    return {"http2": http2, "limits": limits}
+
+
+_clients: Dict[str, httpx.Client] = {}
+_async_clients: Dict[str, httpx.AsyncClient] = {}
+_lock = threading.Lock()
+
+
+def http_client(provider: str) -> httpx.Client:
+    """Pooled sync client for "openai" or "cohere" (thread-safe; shared by ingestion workers)."""
+    with _lock:
+        if provider not in _clients:
+            _clients[provider] = httpx.Client(timeout=_timeout(provider), **_transport_options())
+        return _clients[provider]
+
+
+def async_http_client(provider: str) -> httpx.AsyncClient:
+    """Pooled async client for "openai" or "cohere". Bound to the first event loop that uses it."""
+    with _lock:
+        if provider not in _async_clients:
+            _async_clients[provider] = httpx.AsyncClient(timeout=_timeout(provider), **_transport_options())
+        return _async_clients[provider]
+
+
+def _openai_defaults(kwargs: Dict[str, Any]) -> None:
+    kwargs.setdefault("api_key", settings.OPENAI_API_KEY)
+    if not kwargs["api_key"]:
+        raise ValueError("OPENAI_API_KEY not found in settings")
+    if settings.OPENAI_API_BASE:
+        kwargs.setdefault("api_base", settings.OPENAI_API_BASE)
+
+
+def openai_llm(model: str = "gpt-4o", **kwargs: Any):
+    """llama_index OpenAI LLM on the shared OpenAI pool."""
+    from llama_index.llms.openai import OpenAI
+
+    _openai_defaults(kwargs)
+    return OpenAI(
+        model=model,
+        timeout=settings.OPENAI_TIMEOUT,
+        max_retries=settings.UPSTREAM_MAX_RETRIES,
+        http_client=http_client("openai"),
+        async_http_client=async_http_client("openai"),
+        **kwargs,
+    )
+
+
+def openai_embedding(**kwargs: Any):
+    """llama_index OpenAIEmbedding on the shared OpenAI pool."""
+    from llama_index.embeddings.openai import OpenAIEmbedding
+
+    _openai_defaults(kwargs)
+    return OpenAIEmbedding(
+        timeout=settings.OPENAI_TIMEOUT,
+        max_retries=settings.UPSTREAM_MAX_RETRIES,
+        http_client=http_client("openai"),
+        async_http_client=async_http_client("openai"),
+        **kwargs,
+    )
+
+
+@lru_cache(maxsize=None)
+def pinecone_client():
+    """
+    The Pinecone client. Its transport is internal to the SDK (HTTP/1.1); we size
+    its pool and bound its retries (decorrelated jitter).
+    """
+    from pinecone import Pinecone, RetryConfig
+
+    if not settings.PINECONE_API_KEY:
+        raise ValueError("PINECONE_API_KEY not found in settings")
+    return Pinecone(
+        api_key=settings.PINECONE_API_KEY,
+        timeout=settings.PINECONE_TIMEOUT,
+        connection_pool_maxsize=settings.HTTP_MAX_CONNECTIONS,
+        retry_config=RetryConfig(max_retries=settings.UPSTREAM_MAX_RETRIES),
+    )
+
+
+@lru_cache(maxsize=None)
+def pinecone_index(name: str):
+    """Data-plane handle for `name`; one per process so its connection pool is reused."""
+    if settings.PINECONE_INDEX_HOST:
+        return pinecone_client().Index(host=settings.PINECONE_INDEX_HOST)
+    return pinecone_client().Index(name)
+
+
+def cohere_rerank(top_n: int = 10, **kwargs: Any):
+    """CohereRerank on the shared Cohere pool."""
+    from cohere import ClientV2
+    from llama_index.postprocessor.cohere_rerank import CohereRerank
+
+    kwargs.setdefault("api_key", settings.COHERE_API_KEY)
+    if settings.COHERE_BASE_URL:
+        kwargs.setdefault("base_url", settings.COHERE_BASE_URL)
+    reranker = CohereRerank(top_n=top_n, max_retries=settings.UPSTREAM_MAX_RETRIES, **kwargs)
+    # CohereRerank builds a ClientV2 with default transport; swap in the pooled one
+    reranker._client = ClientV2(
+        api_key=kwargs["api_key"],
+        base_url=kwargs.get("base_url"),
+        timeout=settings.COHERE_TIMEOUT,
+        httpx_client=http_client("cohere"),
+    )
+    return reranker
+
+
+async def aclose_clients() -> None:
+    """Close the pooled OpenAI/Cohere connections (app shutdown)."""
+    with _lock:
+        clients, async_clients = list(_clients.values()), list(_async_clients.values())
+        _clients.clear()
+        _async_clients.clear()
+    for client in async_clients:
+        await client.aclose()
+    for client in clients:
+        client.close()
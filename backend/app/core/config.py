@@ -1,5 +1,5 @@
 
-from typing import Optional, List
+from typing import Dict, Optional, List
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import AnyHttpUrl, validator, Field, AliasChoices
 
@@ -20,14 +20,136 @@ class Settings(BaseSettings):
         return ["*"]
 
     # External APIs
-    OPENAI_API_KEY: str
-    PINECONE_API_KEY: str = Field(validation_alias=AliasChoices('PINECONE_API_KEY', 'PINECONE-API-KEY'))
+    OPENAI_API_KEY: Optional[str] = None
+    PINECONE_API_KEY: Optional[str] = Field(default=None, validation_alias=AliasChoices('PINECONE_API_KEY', 'PINECONE-API-KEY'))
     COHERE_API_KEY: Optional[str] = None
+    # Other endpoints for the provider SDKs, e.g. the local stand-ins in benchmarks/stub_server.py
+    OPENAI_API_BASE: Optional[str] = None
+    PINECONE_INDEX_HOST: Optional[str] = None  # data-plane host; skips looking INDEX_NAME up
+    COHERE_BASE_URL: Optional[str] = None
     
     # RAG Config
     INDEX_NAME: str = "modern-sage"
+    VECTOR_BACKEND: str = "pinecone"  # "pinecone" or "local"
+    # In-process index used when VECTOR_BACKEND=local (built by scripts/ingest.py)
+    LOCAL_INDEX_DIR: str = ".cache/local_index/{index_name}"
+    # 0 = exact search; >0 clusters the index into this many IVF lists at ingest time
+    LOCAL_INDEX_IVF_LISTS: int = 0
+    LOCAL_INDEX_IVF_PROBES: int = 8  # IVF lists searched per query
+    # Per-index record of ingested files/chunks used by scripts/ingest.py
+    INGEST_MANIFEST_PATH: str = ".cache/ingest_manifest_{index_name}.json"
+    INGEST_WORKERS: int = 4  # processes parsing PDFs
+    INGEST_BATCH_SIZE: int = 100  # chunks per embedding request / upsert
+    INGEST_EMBED_CONCURRENCY: int = 4  # embedding requests in flight
+    INGEST_MAX_RETRIES: int = 5
+
+    # Retrieval: "dense" (vector search) or "hybrid" (vector search fused with the BM25 index)
+    RETRIEVAL_MODE: str = "hybrid"
+    RETRIEVAL_NUM_QUERIES: int = 3  # original query + generated ones; 1 skips query expansion
+    # BM25 index over the same chunks (built by scripts/ingest.py, memory-mapped by the API)
+    SPARSE_INDEX_DIR: str = ".cache/sparse_index/{index_name}"
+    SPARSE_TOP_K: int = 15  # BM25 hits per query
+    # Search the spiritual (Gita) and modern sources as separate partitions, concurrently,
+    # and rerank each on its own, so both halves of the answer get material (see perspectives.py)
+    RETRIEVAL_PARTITIONED: bool = True
+    PARTITION_TOP_K: int = 10  # vector and BM25 hits per query per partition
+    PARTITION_CANDIDATES: Dict[str, int] = {"spiritual": 8, "modern": 12}  # fused candidates reranked per partition
+    PARTITION_RERANK_TOP_N: Dict[str, int] = {"spiritual": 4, "modern": 6}  # chunks kept per partition after reranking
+
+    # Query Expansion (extra queries for the fusion retriever)
+    QUERY_EXPANSION_MODE: str = "cached"  # "off", "llm", "cached" or "local"
+    QUERY_EXPANSION_CACHE_SIZE: int = 1000  # entries kept in "cached" mode
+    # Answer small talk and out-of-scope questions without retrieval
+    QUERY_ROUTER_ENABLED: bool = True
+
+    # Reranking
+    RERANKER: str = "cohere"  # "cohere" (needs COHERE_API_KEY), "local" or "none"
+    # Cross-encoder used when RERANKER=local (requires sentence-transformers)
+    LOCAL_RERANK_MODEL: str = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    LOCAL_RERANK_MAX_LENGTH: int = 512  # tokens per (query, passage) pair
+    LOCAL_RERANK_BATCH_SIZE: int = 32
+    LOCAL_RERANK_CACHE_SIZE: int = 10000  # cached (query, node) scores
+
+    # Context packing: near-duplicate removal and a token budget for retrieved chunks
+    CONTEXT_PACKING_ENABLED: bool = True
+    CONTEXT_TOKEN_BUDGET: int = 2500  # retrieved-context tokens per prompt
+    CONTEXT_DEDUPE_THRESHOLD: float = 0.5  # estimated shingle Jaccard similarity that counts as a duplicate
+
+    # Upstream HTTP clients (see app/core/clients.py)
+    HTTP_MAX_CONNECTIONS: int = 100  # pooled connections per provider
+    HTTP_KEEPALIVE_SECONDS: float = 60.0  # idle time before a pooled connection is closed
+    HTTP2_ENABLED: bool = True  # OpenAI and Cohere; needs the h2 package
+    HTTP_CONNECT_TIMEOUT: float = 5.0
+    OPENAI_TIMEOUT: float = 60.0
+    PINECONE_TIMEOUT: float = 10.0
+    COHERE_TIMEOUT: float = 15.0
+    UPSTREAM_MAX_RETRIES: int = 3  # per call, exponential backoff with jitter (done by each SDK)
+
+    # Startup
+    # Build the pipeline and run a probe query at boot instead of on the first request
+    WARMUP_ON_STARTUP: bool = True
+    WARMUP_QUERY: str = "How do small habits change who I am?"
+
+    # Concurrency
+    # Max chat turns in flight per worker; extra requests queue for a slot.
+    CHAT_MAX_CONCURRENCY: int = 64
+    # Seconds a queued request waits for a slot before getting a 503.
+    CHAT_QUEUE_TIMEOUT: float = 30.0
+    # Requests waiting for a slot or upstream budget; more are rejected at once with a 429 (0 = no limit)
+    CHAT_QUEUE_MAX_DEPTH: int = 256
+
+    # Admission control (see app/services/admission.py): per-minute budgets of each upstream,
+    # set to the account's rate limits (0 = no limit). Under pressure turns skip query
+    # expansion, then reranking, then queue, and are rejected with a 429 and Retry-After last.
+    ADMISSION_CONTROL_ENABLED: bool = True
+    OPENAI_REQUESTS_PER_MINUTE: int = 5000  # chat completions
+    OPENAI_TOKENS_PER_MINUTE: int = 800000
+    EMBEDDING_REQUESTS_PER_MINUTE: int = 5000
+    PINECONE_REQUESTS_PER_MINUTE: int = 6000  # vector searches
+    COHERE_REQUESTS_PER_MINUTE: int = 1000  # rerank calls
+    # Budget that may be spent at once, in seconds of the per-minute rate (providers also limit shorter windows)
+    ADMISSION_BURST_SECONDS: float = 10.0
+    ADMISSION_ANSWER_TOKENS: int = 1000  # completion tokens reserved per answer (settled with the actual count)
+    ADMISSION_EXPANSION_TOKENS: int = 250  # tokens reserved for a query expansion call
+    # Share of CHAT_QUEUE_MAX_DEPTH waiting at which turns skip query expansion (twice this: reranking too)
+    ADMISSION_DEGRADE_QUEUE_FILL: float = 0.25
+
+    # Streaming: tokens are coalesced into frames of up to STREAM_FLUSH_CHARS characters,
+    # and no token waits longer than STREAM_FLUSH_INTERVAL_MS (0 = send tokens as they arrive)
+    STREAM_FLUSH_INTERVAL_MS: float = 50.0
+    STREAM_FLUSH_CHARS: int = 256
+
+    # Concurrent identical first-turn questions, embedding requests and searches share one upstream call
+    SINGLE_FLIGHT_ENABLED: bool = True
+
+    # Conversation history
+    CHAT_HISTORY_TOKEN_LIMIT: int = 4000  # history tokens sent with each turn (oldest dropped first)
+    # Server-side sessions: clients send a session_id and only their new message (see app/services/sessions.py)
+    SESSIONS_ENABLED: bool = True
+    SESSION_BACKEND: str = "memory"  # "memory" or "disk"
+    SESSION_STORE_PATH: str = ".cache/sessions.sqlite3"
+    SESSION_TTL_SECONDS: int = 86400  # idle time before a session expires
+    SESSION_MAX_ACTIVE: int = 10000  # sessions held in memory (LRU); the disk backend reloads evicted ones
+    # Older messages are folded into a running summary once the verbatim history exceeds this
+    SESSION_SUMMARY_TRIGGER_TOKENS: int = 3000
+    SESSION_SUMMARY_KEEP_TOKENS: int = 1000  # most recent history kept verbatim when summarizing
+
+    # Semantic Response Cache
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_BACKEND: str = "memory"  # "memory" or "disk"
+    RESPONSE_CACHE_PATH: str = ".cache/response_cache.sqlite3"
+    # Min cosine similarity between query embeddings to reuse an answer.
+    RESPONSE_CACHE_SIMILARITY_THRESHOLD: float = 0.98
+    RESPONSE_CACHE_TTL_SECONDS: int = 3600
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1000
+
+    # Embedding Cache (shared by the API, ingestion and evals)
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_DIR: str = ".cache/embeddings"
     
     # Observability
+    # Stage latency histograms and token/cache counters served on GET /api/v1/metrics
+    METRICS_ENABLED: bool = True
     LANGFUSE_SECRET_KEY: Optional[str] = None
     LANGFUSE_PUBLIC_KEY: Optional[str] = None
     LANGFUSE_HOST: Optional[str] = "https://cloud.langfuse.com"
@@ -5,6 +5,15 @@ import logging
 
 logger = logging.getLogger("app.core.exceptions")
 
+class ServiceOverloadedError(Exception):
+    """Raised when the service cannot take on more work right now (503, or 429 when shedding load)."""
+
+    def __init__(self, detail: str = "Service is busy. Please retry shortly.", retry_after: int = 1, status_code: int = 503):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+        self.status_code = status_code
+
 async def global_exception_handler(request: Request, exc: Exception):
     logger.error(f"Global exception: {exc}", exc_info=True)
     return JSONResponse(
@@ -17,3 +26,11 @@ async def http_exception_handler(request: Request, exc: HTTPException):
         status_code=exc.status_code,
         content={"detail": exc.detail},
     )
+
+async def overloaded_exception_handler(request: Request, exc: ServiceOverloadedError):
+    logger.warning(f"Rejecting request, service overloaded: {exc.detail}")
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
@@ -1,17 +1,35 @@
 
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import settings
 from app.core.logging import setup_logging
 from app.api.routers import api_router
-from app.core.exceptions import global_exception_handler, http_exception_handler
+from app.core.exceptions import (
+    global_exception_handler,
+    http_exception_handler,
+    overloaded_exception_handler,
+    ServiceOverloadedError,
+)
+from app.core.clients import aclose_clients
+from app.services.warmup import readiness
 from fastapi import HTTPException
 
 # Setup Logging
 setup_logging()
 
-app = FastAPI(title=settings.PROJECT_NAME, openapi_url=f"{settings.API_V1_STR}/openapi.json")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build and warm the chat pipeline in the background; /health/ready reports when it's done
+    if settings.WARMUP_ON_STARTUP:
+        readiness.start()
+    yield
+    await readiness.stop()
+    await aclose_clients()
+
+app = FastAPI(title=settings.PROJECT_NAME, openapi_url=f"{settings.API_V1_STR}/openapi.json", lifespan=lifespan)
 
 # CORS
 if settings.BACKEND_CORS_ORIGINS:
@@ -26,6 +44,7 @@ if settings.BACKEND_CORS_ORIGINS:
 # Exception Handlers
 app.add_exception_handler(Exception, global_exception_handler)
 app.add_exception_handler(HTTPException, http_exception_handler)
+app.add_exception_handler(ServiceOverloadedError, overloaded_exception_handler)
 
 # Routers
 app.include_router(api_router, prefix=settings.API_V1_STR)
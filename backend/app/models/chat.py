@@ -1,6 +1,6 @@
 
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 
 class Message(BaseModel):
     role: str
@@ -8,3 +8,11 @@ class Message(BaseModel):
 
 class ChatRequest(BaseModel):
     messages: List[Message]
+    # Server-side session (POST /sessions): only the last message is read, except on a
+    # session's first turn, where earlier messages seed its history
+    session_id: Optional[str] = None
+    # Append a data frame with the turn's stage timings and token counts to the stream
+    include_timings: bool = False
+
+class SessionResponse(BaseModel):
+    session_id: str
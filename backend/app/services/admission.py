@@ -0,0 +1,347 @@
+import asyncio
+import logging
+import math
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.exceptions import ServiceOverloadedError
+from app.core.metrics import ADMISSION_DECISIONS
+
+logger = logging.getLogger("app.services.admission")
+
+# Service levels, best first. Under pressure a turn drops query expansion (one
+# LLM call and a search per generated query), then reranking too.
+FULL, NO_EXPANSION, NO_RERANK = "full", "no_expansion", "no_rerank"
+LEVELS = (FULL, NO_EXPANSION, NO_RERANK)
+
+# Upstream budgets, and the upstreams whose 429s drain them (by the error's top-level module)
+OPENAI, OPENAI_EMBEDDING, PINECONE, COHERE = "openai", "openai_embedding", "pinecone", "cohere"
+ERROR_MODULES = {"openai": (OPENAI, OPENAI_EMBEDDING), "pinecone": (PINECONE,), "cohere": (COHERE,)}
+
+# (requests, tokens) a turn needs from each upstream
+Cost = Dict[str, Tuple[int, int]]
+
+
+def estimate_tokens(chars: int) -> int:
+    """Rough token count of `chars` characters of English text (about 4 per token)."""
+    return chars // 4 + 1
+
+
+class TokenBucket:
+    """
+    `per_minute` units a minute, refilled continuously, with at most
+    `burst_seconds` worth saved up (0 = no limit). `take` may overdraw the
+    bucket: later callers wait until the debt is refilled, so waiting callers
+    are served in order.
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = self.rate * burst_seconds
+        self._clock = clock
+        self._level = self.capacity
+        self._updated = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self) -> float:
+        if not self.rate:
+            return math.inf
+        self._refill()
+        return self._level
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if they are now)."""
+        if not self.rate or amount <= 0:
+            return 0.0
+        self._refill()
+        # A request larger than the whole bucket only needs it full
+        return max(0.0, (min(amount, self.capacity) - self._level) / self.rate)
+
+    def take(self, amount: float) -> None:
+        if self.rate:
+            self._refill()
+            self._level -= amount
+
+    def give_back(self, amount: float) -> None:
+        """Return units taken but not used (a negative amount takes more)."""
+        if self.rate:
+            self._refill()
+            self._level = min(self.capacity, self._level + amount)
+
+
+class UpstreamBudget:
+    """Requests and tokens per minute of one upstream provider."""
+
+    def __init__(self, name: str, requests_per_minute: float, tokens_per_minute: float = 0,
+                 burst_seconds: float = 60.0, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute, burst_seconds, clock)
+        self.tokens = TokenBucket(tokens_per_minute, burst_seconds, clock)
+        self._clock = clock
+        self._blocked_until = 0.0
+
+    def wait_time(self, requests: int, tokens: int) -> float:
+        if not requests and not tokens:
+            # A turn that doesn't call this upstream (e.g. NO_RERANK for Cohere) never waits for it
+            return 0.0
+        blocked = max(0.0, self._blocked_until - self._clock())
+        return max(blocked, self.requests.wait_time(requests), self.tokens.wait_time(tokens))
+
+    def take(self, requests: int, tokens: int) -> None:
+        self.requests.take(requests)
+        self.tokens.take(tokens)
+
+    def give_back(self, requests: int, tokens: int) -> None:
+        self.requests.give_back(requests)
+        self.tokens.give_back(tokens)
+
+    def block(self, seconds: float) -> None:
+        """The upstream rate-limited us: send it nothing for `seconds`."""
+        self._blocked_until = max(self._blocked_until, self._clock() + seconds)
+
+
+@dataclass
+class TurnPlan:
+    """What admission control lets a turn do, and what it reserved for it."""
+
+    level: str = FULL
+    cost: Cost = field(default_factory=dict)
+
+    @property
+    def expand_queries(self) -> bool:
+        return self.level == FULL
+
+    @property
+    def rerank(self) -> bool:
+        return self.level != NO_RERANK
+
+
+# Plan of the chat turn running in the current task (see stage_timer.py for the same pattern);
+# turns run outside admission control (evals, tools) get the full pipeline.
+_current: ContextVar[TurnPlan] = ContextVar("turn_plan", default=TurnPlan())
+
+
+def current_plan() -> TurnPlan:
+    return _current.get()
+
+
+def rate_limit_retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds to back off if `exc` is an upstream 429 (its Retry-After, else 1), otherwise None."""
+    status = getattr(exc, "status_code", None) or getattr(exc, "status", None)
+    if status != 429:
+        return None
+    headers = getattr(getattr(exc, "response", None), "headers", None) or getattr(exc, "headers", None) or {}
+    try:
+        return max(1.0, float(headers.get("retry-after", 1)))
+    except (TypeError, ValueError):
+        return 1.0
+
+
+class AdmissionController:
+    """
+    Admits chat turns against the upstream rate limits and a bounded queue.
+
+    Each turn is priced per upstream (requests and tokens, see `cost`) and
+    reserved from token buckets refilled at the configured per-minute limits.
+    A turn gets the best service level that the budgets cover right away (else
+    the best of those covered soonest), and while the queue fills past
+    `degrade_queue_fill` (then twice that) it gets at most NO_EXPANSION (then
+    NO_RERANK). If no level is covered yet, the turn waits for its budget in
+    order with the others; when that wait would outlast `queue_timeout`, or
+    `queue_depth` turns are already waiting, it is shed with a 429 and a
+    Retry-After instead. Admitted turns then wait up to the rest of
+    `queue_timeout` for one of `max_concurrency` slots (503 after that).
+
+    Query expansion is priced as an LLM request only when the turn's expander
+    would call the LLM (not for local expansion or a cached expansion).
+    Reservations are estimates; `settle` returns the unused requests and tokens
+    once the turn's actual LLM calls and token count are known. Without budgets
+    (admission control disabled) only the slots and the queue bound apply.
+    """
+
+    def __init__(
+        self,
+        budgets: Dict[str, UpstreamBudget],
+        max_concurrency: int,
+        queue_timeout: float,
+        queue_depth: int = 0,
+        degrade_queue_fill: float = 0.0,
+        num_queries: int = 1,
+        searches_per_query: int = 0,
+        rerank_calls: int = 0,
+        expansion_tokens: int = 250,
+        answer_tokens: int = 1000,
+    ):
+        self.budgets = budgets
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.queue_depth = queue_depth
+        self.degrade_queue_fill = degrade_queue_fill
+        self.num_queries = num_queries
+        self.searches_per_query = searches_per_query
+        self.rerank_calls = rerank_calls
+        self.expansion_tokens = expansion_tokens
+        self.answer_tokens = answer_tokens
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.in_flight = 0
+
+    def cost(self, level: str, retrieval: bool, prompt_tokens: int, expansion_llm: bool = True) -> Cost:
+        """Upstream requests and tokens of one turn at `level`; `expansion_llm`: query expansion calls the LLM."""
+        cost = {OPENAI: (1, prompt_tokens + self.answer_tokens)}
+        if retrieval:
+            expand = level == FULL and self.num_queries > 1
+            queries = self.num_queries if expand else 1
+            if expand and expansion_llm:
+                cost[OPENAI] = (2, cost[OPENAI][1] + self.expansion_tokens)
+            cost[OPENAI_EMBEDDING] = (1, 0)
+            cost[PINECONE] = (queries * self.searches_per_query, 0)
+            cost[COHERE] = (self.rerank_calls if level != NO_RERANK else 0, 0)
+        return cost
+
+    def _wait_time(self, cost: Cost) -> float:
+        return max((self.budgets[name].wait_time(*amounts) for name, amounts in cost.items() if name in self.budgets),
+                   default=0.0)
+
+    def _reserve(self, plan: TurnPlan) -> None:
+        for name, amounts in plan.cost.items():
+            if name in self.budgets:
+                self.budgets[name].take(*amounts)
+
+    def _release(self, plan: TurnPlan) -> None:
+        for name, amounts in plan.cost.items():
+            if name in self.budgets:
+                self.budgets[name].give_back(*amounts)
+
+    def _shed(self, detail: str, retry_after: float, decision: str) -> ServiceOverloadedError:
+        if settings.METRICS_ENABLED:
+            ADMISSION_DECISIONS.inc(1, decision)
+        return ServiceOverloadedError(detail, retry_after=max(1, math.ceil(retry_after)), status_code=429)
+
+    def plan(self, retrieval: bool, prompt_tokens: int, expansion_llm: bool = True) -> Tuple[TurnPlan, float]:
+        """The best level the budgets and the queue allow, and how long to wait for its budget."""
+        first = 0
+        if self.queue_depth and self.degrade_queue_fill:
+            first = min(len(LEVELS) - 1, int(self.waiting / self.queue_depth / self.degrade_queue_fill))
+        plans = [TurnPlan(level, self.cost(level, retrieval, prompt_tokens, expansion_llm)) for level in LEVELS[first:]]
+        waits = [self._wait_time(plan.cost) for plan in plans]
+        # The best level available now, else the best one of those available soonest
+        best = waits.index(min(waits))
+        return plans[best], waits[best]
+
+    @asynccontextmanager
+    async def admit(self, retrieval: bool, prompt_tokens: int, expansion_llm: bool = True) -> AsyncIterator[TurnPlan]:
+        """Hold a slot and the turn's upstream budget for the duration of the block."""
+        if self.queue_depth and self.waiting >= self.queue_depth:
+            # A full queue takes about half the queue timeout to turn over
+            raise self._shed("Too many requests queued. Please retry shortly.", self.queue_timeout / 2, "shed_queue_full")
+        deadline = time.monotonic() + self.queue_timeout
+        plan, wait = self.plan(retrieval, prompt_tokens, expansion_llm)
+        if wait > self.queue_timeout:
+            raise self._shed("Upstream rate limits reached. Please retry shortly.", wait, "shed_rate_limit")
+        self._reserve(plan)
+
+        self.waiting += 1
+        try:
+            if wait:
+                await asyncio.sleep(wait)
+            await asyncio.wait_for(self._slots.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            self._release(plan)
+            if settings.METRICS_ENABLED:
+                ADMISSION_DECISIONS.inc(1, "timeout")
+            raise ServiceOverloadedError("Too many concurrent chat sessions. Please retry shortly.")
+        except BaseException:
+            self._release(plan)
+            raise
+        finally:
+            self.waiting -= 1
+
+        if settings.METRICS_ENABLED:
+            ADMISSION_DECISIONS.inc(1, plan.level)
+        if plan.level != FULL:
+            logger.info(f"Admitted turn degraded to {plan.level} ({self.waiting} waiting)")
+        _current.set(plan)
+        self.in_flight += 1
+        try:
+            yield plan
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+    def settle(self, plan: TurnPlan, llm_calls: int, llm_tokens: int) -> None:
+        """Give back the LLM requests and tokens reserved for `plan` but not used (or take the overrun)."""
+        if OPENAI in self.budgets and OPENAI in plan.cost:
+            requests, tokens = plan.cost[OPENAI]
+            self.budgets[OPENAI].give_back(requests - llm_calls, tokens - llm_tokens)
+
+    def upstream_rate_limited(self, exc: BaseException) -> Optional[ServiceOverloadedError]:
+        """
+        For an upstream 429 (after the SDK's own retries), pause that upstream's
+        budgets for its Retry-After, so new turns queue or are shed instead of
+        failing the same way, and return the 429 to send; otherwise None.
+        """
+        retry_after = rate_limit_retry_after(exc)
+        if retry_after is None:
+            return None
+        names = ERROR_MODULES.get(type(exc).__module__.split(".")[0], ())
+        for name in names:
+            if name in self.budgets:
+                self.budgets[name].block(retry_after)
+        logger.warning(f"Upstream rate limit ({', '.join(names) or type(exc).__name__}), backing off {retry_after:.0f}s")
+        return self._shed("Upstream rate limits reached. Please retry shortly.", retry_after, "upstream_rate_limited")
+
+    def stats(self) -> dict:
+        return {"waiting": self.waiting, "in_flight": self.in_flight}
+
+    def metrics(self):
+        """Queue and budget gauges, in the metrics registry's collector format."""
+        yield "rag_admission_waiting", "gauge", "Chat turns waiting for upstream budget or a slot", [({}, self.waiting)]
+        yield "rag_admission_in_flight", "gauge", "Admitted chat turns in flight", [({}, self.in_flight)]
+        samples = []
+        for name, budget in self.budgets.items():
+            for kind, bucket in (("requests", budget.requests), ("tokens", budget.tokens)):
+                if bucket.rate:
+                    samples.append(({"upstream": name, "kind": kind}, bucket.available()))
+        yield "rag_upstream_budget_available", "gauge", "Requests/tokens left in each upstream's rate-limit budget", samples
+
+
+def build_budgets() -> Dict[str, UpstreamBudget]:
+    """Per-upstream budgets from the *_PER_MINUTE settings (none when ADMISSION_CONTROL_ENABLED=false)."""
+    if not settings.ADMISSION_CONTROL_ENABLED:
+        return {}
+    burst = settings.ADMISSION_BURST_SECONDS
+    return {
+        OPENAI: UpstreamBudget(OPENAI, settings.OPENAI_REQUESTS_PER_MINUTE, settings.OPENAI_TOKENS_PER_MINUTE, burst),
+        OPENAI_EMBEDDING: UpstreamBudget(OPENAI_EMBEDDING, settings.EMBEDDING_REQUESTS_PER_MINUTE, 0, burst),
+        PINECONE: UpstreamBudget(PINECONE, settings.PINECONE_REQUESTS_PER_MINUTE, 0, burst),
+        COHERE: UpstreamBudget(COHERE, settings.COHERE_REQUESTS_PER_MINUTE, 0, burst),
+    }
+
+
+def build_admission_controller(searches_per_query: int, rerank_calls: int) -> AdmissionController:
+    """
+    Admission controller for a pipeline making `searches_per_query` remote
+    vector searches per query and `rerank_calls` remote rerank calls per turn.
+    """
+    enabled = settings.ADMISSION_CONTROL_ENABLED
+    return AdmissionController(
+        budgets=build_budgets(),
+        max_concurrency=settings.CHAT_MAX_CONCURRENCY,
+        queue_timeout=settings.CHAT_QUEUE_TIMEOUT,
+        queue_depth=settings.CHAT_QUEUE_MAX_DEPTH,
+        degrade_queue_fill=settings.ADMISSION_DEGRADE_QUEUE_FILL if enabled else 0.0,
+        num_queries=settings.RETRIEVAL_NUM_QUERIES if settings.QUERY_EXPANSION_MODE != "off" else 1,
+        searches_per_query=searches_per_query,
+        rerank_calls=rerank_calls,
+        expansion_tokens=settings.ADMISSION_EXPANSION_TOKENS,
+        answer_tokens=settings.ADMISSION_ANSWER_TOKENS,
+    )
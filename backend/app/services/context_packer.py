@@ -0,0 +1,163 @@
+import logging
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.utils import get_tokenizer
+from pydantic import PrivateAttr
+
+from app.core.config import settings
+from app.services import stage_timer
+from app.services.perspectives import perspective_of
+
+logger = logging.getLogger("app.services.context_packer")
+
+_WORD = re.compile(r"\w+")
+
+
+class MinHasher:
+    """MinHash signatures of word shingles; the share of equal slots estimates Jaccard similarity."""
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.shingle_size = shingle_size
+        # Multiply-add-shift hashes: (a * x + b) mod 2^64, top 32 bits, a odd
+        self._a = rng.integers(0, 2 ** 64, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 64, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        words = _WORD.findall(text.lower()) or [""]
+        word_hashes = np.fromiter((zlib.crc32(w.encode("utf-8")) for w in words), dtype=np.uint64, count=len(words))
+        # Rolling 32-bit hash of each run of `shingle_size` words (repeats don't change the minimum)
+        size = min(self.shingle_size, len(words))
+        count = len(words) - size + 1
+        shingles = word_hashes[:count].copy()
+        for offset in range(1, size):
+            shingles = (shingles * np.uint64(1000003) + word_hashes[offset:offset + count]) & np.uint64(0xFFFFFFFF)
+        return ((np.outer(shingles, self._a) + self._b) >> np.uint64(32)).min(axis=0)
+
+    @staticmethod
+    def similarity(a: np.ndarray, b: np.ndarray) -> float:
+        return float(np.count_nonzero(a == b)) / len(a)
+
+
+class ContextPacker(BaseNodePostprocessor):
+    """
+    Assembles the retrieved context that goes into the prompt.
+
+    Walks the candidates in relevance order, drops near-duplicates of chunks
+    already kept (MinHash similarity of word shingles >= `dedupe_threshold`),
+    and fills `token_budget` alternating between the spiritual and modern
+    sources (see `perspective_of`) so both halves of the answer have material.
+    Chunks that don't fit are skipped for smaller ones further down; the most
+    relevant chunk is always kept. The result stays in relevance order.
+
+    Token counts and signatures are cached per node ID.
+    """
+
+    token_budget: int = 2500
+    dedupe_threshold: float = 0.5
+    balance_perspectives: bool = True
+    cache_size: int = 10000
+
+    _hasher: MinHasher = PrivateAttr(default_factory=MinHasher)
+    _tokenizer: Any = PrivateAttr(default_factory=get_tokenizer)
+    _cache: "OrderedDict[str, Tuple[int, np.ndarray]]" = PrivateAttr(default_factory=OrderedDict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _hits: int = PrivateAttr(default=0)
+    _misses: int = PrivateAttr(default=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextPacker"
+
+    def stats(self) -> dict:
+        return {"entries": len(self._cache), "hits": self._hits, "misses": self._misses}
+
+    def _features(self, node: NodeWithScore) -> Tuple[int, np.ndarray]:
+        """(tokens as the LLM sees the chunk, MinHash signature)."""
+        node_id = node.node.node_id
+        with self._lock:
+            features = self._cache.get(node_id)
+            if features is not None:
+                self._cache.move_to_end(node_id)
+                self._hits += 1
+                return features
+            self._misses += 1
+        text = node.node.get_content(metadata_mode=MetadataMode.LLM)
+        features = (len(self._tokenizer(text)), self._hasher.signature(node.node.get_content()))
+        with self._lock:
+            self._cache[node_id] = features
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return features
+
+    def pack(self, nodes: List[NodeWithScore]) -> Tuple[List[NodeWithScore], Dict[str, int]]:
+        """(packed nodes, report) where the report counts tokens and dropped chunks."""
+        features = [self._features(node) for node in nodes]
+        report = {"candidate_tokens": sum(tokens for tokens, _ in features), "packed_tokens": 0,
+                  "duplicates": 0, "over_budget": 0}
+
+        unique: List[int] = []
+        for i, (_, signature) in enumerate(features):
+            if any(MinHasher.similarity(signature, features[j][1]) >= self.dedupe_threshold for j in unique):
+                report["duplicates"] += 1
+            else:
+                unique.append(i)
+
+        # Interleave the perspectives, each in relevance order, starting with the best chunk's
+        if self.balance_perspectives:
+            groups: Dict[str, List[int]] = {}
+            for i in unique:
+                groups.setdefault(perspective_of(nodes[i]), []).append(i)
+            queues = list(groups.values())
+            order = [queue[k] for k in range(max(map(len, queues), default=0)) for queue in queues if k < len(queue)]
+        else:
+            order = unique
+
+        selected, used = [], 0
+        for i in order:
+            tokens = features[i][0]
+            if used + tokens <= self.token_budget or not selected:
+                selected.append(i)
+                used += tokens
+            else:
+                report["over_budget"] += 1
+        report["packed_tokens"] = used
+        return [nodes[i] for i in sorted(selected)], report
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if not nodes:
+            return []
+        packed, report = self.pack(nodes)
+        stage_timer.record_context(report["candidate_tokens"], report["packed_tokens"],
+                                   report["duplicates"], report["over_budget"])
+        logger.debug(f"Packed {len(packed)}/{len(nodes)} chunks: {report}")
+        return packed
+
+    async def _apostprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        # A few milliseconds for a cold top-10 and far less once cached; run it inline
+        return self._postprocess_nodes(nodes, query_bundle)
+
+
+def build_context_packer() -> Optional[ContextPacker]:
+    """The context packer, or None with CONTEXT_PACKING_ENABLED=false."""
+    if not settings.CONTEXT_PACKING_ENABLED:
+        return None
+    return ContextPacker(
+        token_budget=settings.CONTEXT_TOKEN_BUDGET,
+        dedupe_threshold=settings.CONTEXT_DEDUPE_THRESHOLD,
+    )
@@ -0,0 +1,290 @@
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from pydantic import Field, PrivateAttr
+
+from app.core.clients import openai_embedding
+from app.core.config import settings
+from app.services.single_flight import SingleFlight
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger("app.services.embedding_cache")
+
+KEY_SIZE = 16  # bytes of blake2b digest per entry
+
+
+def embedding_key(model_name: str, text: str) -> bytes:
+    """Content address of an embedding: hash of model name + text."""
+    return hashlib.blake2b(f"{model_name}\x00{text}".encode("utf-8"), digest_size=KEY_SIZE).digest()
+
+
+class EmbeddingStore:
+    """
+    Append-only, content-addressed store of float32 vectors on local disk.
+
+    Layout of `directory`:
+        meta.json     {"dim": N}
+        keys.bin      one KEY_SIZE digest per row (the offset index)
+        vectors.f32   row-major float32 matrix, memory-mapped for reads
+
+    Several processes (server, ingest, evals) may share a directory: appends are
+    serialized with an exclusive file lock (flock, or msvcrt on Windows) and each
+    writer first picks up rows appended by the others; a lookup that misses
+    picks them up too. Rows become visible only once both files hold them, so
+    readers need no lock. A directory holds one dimension; `wrap_with_cache`
+    gives each model its own (see `store_directory`).
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._keys_path = os.path.join(directory, "keys.bin")
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._lock_path = os.path.join(directory, ".lock")
+
+        self._lock = threading.Lock()
+        self._index: Dict[bytes, int] = {}
+        self._dim: Optional[int] = None
+        self._rows = 0
+        self._matrix: Optional[np.memmap] = None
+
+        with self._file_lock():
+            self._recover()
+            self._refresh()
+
+    def __len__(self) -> int:
+        return self._rows
+
+    @contextmanager
+    def _file_lock(self):
+        fd = os.open(self._lock_path, os.O_CREAT | os.O_RDWR)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                # Locks the lock file's first byte; LK_LOCK retries for ~10 s before raising
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                else:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+    def _load_dim(self) -> Optional[int]:
+        if self._dim is None and os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                self._dim = int(json.load(f)["dim"])
+        return self._dim
+
+    def _disk_rows(self) -> int:
+        """Complete rows on disk (keys and vectors both written)."""
+        dim = self._load_dim()
+        if dim is None or not os.path.exists(self._keys_path) or not os.path.exists(self._vectors_path):
+            return 0
+        return min(os.path.getsize(self._keys_path) // KEY_SIZE, os.path.getsize(self._vectors_path) // (4 * dim))
+
+    def _recover(self) -> None:
+        """Trim a partially written tail left by a crashed writer."""
+        rows = self._disk_rows()
+        if self._dim is None:
+            return
+        for path, row_size in ((self._keys_path, KEY_SIZE), (self._vectors_path, 4 * self._dim)):
+            if os.path.exists(path) and os.path.getsize(path) > rows * row_size:
+                with open(path, "r+b") as f:
+                    f.truncate(rows * row_size)
+
+    def _refresh(self) -> None:
+        """Index rows appended since the last refresh (possibly by another process)."""
+        rows = self._disk_rows()
+        if rows <= self._rows:
+            return
+        with open(self._keys_path, "rb") as f:
+            f.seek(self._rows * KEY_SIZE)
+            data = f.read((rows - self._rows) * KEY_SIZE)
+        for i in range(rows - self._rows):
+            self._index[data[i * KEY_SIZE:(i + 1) * KEY_SIZE]] = self._rows + i
+        self._rows = rows
+        self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(rows, self._dim))
+
+    def get_many(self, keys: Sequence[bytes]) -> List[Optional[List[float]]]:
+        with self._lock:
+            rows = [self._index.get(key) for key in keys]
+            if None in rows and self._disk_rows() > self._rows:
+                # Another process appended since we last looked
+                self._refresh()
+                rows = [self._index.get(key) for key in keys]
+            return [self._matrix[row].tolist() if row is not None else None for row in rows]
+
+    def put_many(self, keys: Sequence[bytes], vectors: Sequence[Sequence[float]]) -> None:
+        """Append the vectors of new keys. Blocks on the file lock; async callers run it in a thread."""
+        if not keys:
+            return
+        matrix = np.asarray(vectors, dtype=np.float32)
+        # The file lock is taken first, so lookups never wait behind another process's append
+        with self._file_lock(), self._lock:
+            self._refresh()
+            if self._load_dim() is None:
+                self._dim = int(matrix.shape[1])
+                with open(self._meta_path, "w") as f:
+                    json.dump({"dim": self._dim}, f)
+            if matrix.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match store dimension {self._dim}")
+
+            new_rows = []
+            seen = set()
+            for i, key in enumerate(keys):
+                if key not in self._index and key not in seen:
+                    seen.add(key)
+                    new_rows.append(i)
+            if not new_rows:
+                return
+
+            # Vectors first: a crash between the two writes leaves keys as the short side
+            with open(self._vectors_path, "ab") as f:
+                f.write(matrix[new_rows].tobytes())
+            with open(self._keys_path, "ab") as f:
+                f.write(b"".join(keys[i] for i in new_rows))
+            self._refresh()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Drop-in BaseEmbedding that memoizes another embedding model in an EmbeddingStore.
+
+    Entries are keyed on (model name, text), so query and text embeddings share
+    one cache. That holds for the OpenAI embedding models, which embed queries and
+    documents the same way. Concurrent async misses for the same texts share one
+    upstream request (`flights`).
+    """
+
+    embed_model: BaseEmbedding = Field(description="The wrapped embedding model.")
+    _store: EmbeddingStore = PrivateAttr()
+    _flights: SingleFlight = PrivateAttr(default_factory=lambda: SingleFlight(settings.SINGLE_FLIGHT_ENABLED))
+    _hits: int = PrivateAttr(default=0)
+    _misses: int = PrivateAttr(default=0)
+
+    def __init__(self, embed_model: BaseEmbedding, store: EmbeddingStore, **kwargs: Any):
+        kwargs.setdefault("model_name", embed_model.model_name)
+        kwargs.setdefault("embed_batch_size", embed_model.embed_batch_size)
+        super().__init__(embed_model=embed_model, **kwargs)
+        self._store = store
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def stats(self) -> dict:
+        return {"entries": len(self._store), "hits": self._hits, "misses": self._misses}
+
+    @property
+    def flights(self) -> SingleFlight:
+        return self._flights
+
+    def _lookup(self, texts: List[str]):
+        """Cached vectors (None where missing) and the distinct texts to fetch."""
+        cached = self._store.get_many([embedding_key(self.model_name, text) for text in texts])
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+        self._hits += len(texts) - sum(vector is None for vector in cached)
+        self._misses += len(missing)
+        return cached, missing
+
+    def _fill(self, texts: List[str], cached, missing: List[str], vectors) -> List[List[float]]:
+        # Round-trip through float32 so hits and misses return identical values
+        matrix = np.asarray(vectors, dtype=np.float32)
+        self._store.put_many([embedding_key(self.model_name, text) for text in missing], matrix)
+        return self._merge(texts, cached, missing, matrix)
+
+    async def _afill(self, texts: List[str], cached, missing: List[str], vectors) -> List[List[float]]:
+        matrix = np.asarray(vectors, dtype=np.float32)
+        # The append waits for the file lock and writes to disk: keep it off the event loop
+        await asyncio.to_thread(self._store.put_many, [embedding_key(self.model_name, text) for text in missing], matrix)
+        return self._merge(texts, cached, missing, matrix)
+
+    @staticmethod
+    def _merge(texts: List[str], cached, missing: List[str], matrix: np.ndarray) -> List[List[float]]:
+        fetched = dict(zip(missing, matrix.tolist()))
+        return [vector if vector is not None else fetched[text] for text, vector in zip(texts, cached)]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        cached, missing = self._lookup(texts)
+        if not missing:
+            return cached
+        return self._fill(texts, cached, missing, self.embed_model.get_text_embedding_batch(missing))
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        cached, missing = self._lookup(texts)
+        if not missing:
+            return cached
+        vectors = await self._flights.do(("texts", *missing), lambda: self.embed_model.aget_text_embedding_batch(missing))
+        return await self._afill(texts, cached, missing, vectors)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        cached, missing = self._lookup([query])
+        if not missing:
+            return cached[0]
+        return self._fill([query], cached, missing, [self.embed_model.get_query_embedding(query)])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        cached, missing = self._lookup([query])
+        if not missing:
+            return cached[0]
+        vector = await self._flights.do(("query", query), lambda: self.embed_model.aget_query_embedding(query))
+        return (await self._afill([query], cached, missing, [vector]))[0]
+
+
+def build_embed_model() -> BaseEmbedding:
+    """The OpenAI embedding model, wrapped in the on-disk cache unless disabled.
+
+    Shared by the chat service, `scripts/ingest.py` and `evals/evaluate.py`.
+    """
+    embed_model = openai_embedding()
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return embed_model
+    return wrap_with_cache(embed_model)
+
+
+def store_directory(base: str, embed_model: BaseEmbedding) -> str:
+    """
+    The store for `embed_model` under `base`: one per model name and requested
+    dimension, so switching models starts a fresh store instead of failing on
+    the old one's dimension.
+    """
+    name = embed_model.model_name
+    dimensions = getattr(embed_model, "dimensions", None)  # OpenAI text-embedding-3 models can be shortened
+    if dimensions:
+        name = f"{name}-{dimensions}"
+    return os.path.join(base, re.sub(r"[^A-Za-z0-9._-]+", "_", name))
+
+
+def wrap_with_cache(embed_model: BaseEmbedding, directory: Optional[str] = None) -> CachedEmbedding:
+    """Wrap any embedding model with its EmbeddingStore under EMBEDDING_CACHE_DIR (or `directory`)."""
+    directory = store_directory(directory or settings.EMBEDDING_CACHE_DIR, embed_model)
+    store = EmbeddingStore(directory)
+    logger.info(f"Embedding cache at '{directory}' ({len(store)} vectors)")
+    return CachedEmbedding(embed_model, store)
@@ -0,0 +1,228 @@
+
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.retrievers import QueryFusionRetriever
+from llama_index.core.retrievers.fusion_retriever import FUSION_MODES
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+
+from app.services import admission, stage_timer
+from app.core.config import settings
+from app.services.perspectives import partition_filters
+from app.services.query_expansion import QueryExpander
+from app.services.single_flight import SingleFlight
+from app.services.sparse_index import SparseRetriever
+
+logger = logging.getLogger("app.services.fusion_retriever")
+
+RRF_K = 60.0  # same constant as QueryFusionRetriever._reciprocal_rerank_fusion
+
+
+def reciprocal_rank_fusion(result_lists: List[List[NodeWithScore]]) -> List[NodeWithScore]:
+    """
+    Reciprocal rank fusion over several ranked lists, de-duplicated by node ID.
+
+    Produces the same order and scores as QueryFusionRetriever's RRF: each list
+    is ranked by score, contributions are summed in the same order, and ties keep
+    first-seen order. Only node IDs are touched, never node text.
+    """
+    column_of: Dict[str, int] = {}
+    fused_nodes: List[NodeWithScore] = []
+    columns, ranks = [], []
+    for nodes in result_lists:
+        order = sorted(range(len(nodes)), key=lambda i: nodes[i].score or 0.0, reverse=True)
+        for rank, i in enumerate(order):
+            node_id = nodes[i].node.node_id
+            column = column_of.get(node_id)
+            if column is None:
+                column = column_of[node_id] = len(fused_nodes)
+                fused_nodes.append(nodes[i])
+            columns.append(column)
+            ranks.append(rank)
+    if not fused_nodes:
+        return []
+
+    scores = np.bincount(columns, weights=1.0 / (np.asarray(ranks, dtype=np.float64) + RRF_K),
+                         minlength=len(fused_nodes))
+    fused = []
+    for column in np.argsort(-scores, kind="stable"):
+        node = fused_nodes[column]
+        node.score = float(scores[column])
+        fused.append(node)
+    return fused
+
+
+class BatchedFusionRetriever(QueryFusionRetriever):
+    """
+    QueryFusionRetriever that retrieves for all generated queries at once.
+
+    Instead of one embedding request and one vector search per query, the
+    original and generated queries are embedded in a single batched request and
+    searched together: one matrix multiply when the store supports `batch_query`
+    (LocalVectorStore), otherwise concurrent `aquery` calls, shared with any turn
+    searching the same queries at the same time (`search_flights`). Results are fused
+    with a vectorized RRF. The sync path is inherited unchanged.
+
+    With a `sparse_retriever` (hybrid retrieval, see sparse_index.py) every
+    query is also looked up in the BM25 index, and its ranked lists join the
+    fusion next to the vector search results.
+
+    With `partitions` (perspective -> candidates, see perspectives.py) the
+    queries are embedded once, then each perspective's chunks are searched
+    concurrently with `partition_top_k` hits per query and fused (RRF) on their own;
+    the result is each partition's top candidates, so both perspectives always
+    reach the reranker. If no partition matches anything (an untagged index), the
+    turn falls back to one search over the whole library.
+
+    Generated queries come from `query_expander` when given (see
+    query_expansion.py), otherwise from the upstream LLM prompt; the turn's
+    admission plan may skip them (see admission.py). Each stage's latency is
+    recorded with stage_timer.
+    """
+
+    def __init__(
+        self,
+        vector_store: BasePydanticVectorStore,
+        embed_model: BaseEmbedding,
+        vector_top_k: int,
+        query_expander: Optional[QueryExpander] = None,
+        sparse_retriever: Optional[SparseRetriever] = None,
+        partitions: Optional[Dict[str, int]] = None,
+        partition_top_k: int = 10,
+        **kwargs,
+    ) -> None:
+        if sparse_retriever is not None:
+            kwargs["retrievers"] = [*kwargs["retrievers"], sparse_retriever]
+        super().__init__(**kwargs)
+        self._vector_store = vector_store
+        self._embed_model = embed_model
+        self._vector_top_k = vector_top_k
+        self._query_expander = query_expander
+        self._sparse_retriever = sparse_retriever
+        self.partitions = partitions
+        self._partition_top_k = partition_top_k
+        self._warned_untagged = False
+        self.search_flights = SingleFlight(settings.SINGLE_FLIGHT_ENABLED)
+
+    def expansion_calls_llm(self, query: str) -> bool:
+        """Whether a full-service turn for `query` would make an LLM request to generate queries."""
+        if self.num_queries <= 1:
+            return False
+        return self._query_expander is None or self._query_expander.calls_llm(query, self.num_queries - 1)
+
+    async def _aget_queries(self, original_query: str) -> List[QueryBundle]:
+        if self._query_expander is None:
+            return await super()._aget_queries(original_query)
+        queries = await self._query_expander.aexpand(original_query, self.num_queries - 1)
+        logger.debug("Generated queries: %s", queries)
+        return [QueryBundle(q) for q in queries]
+
+    async def _asearch(
+        self,
+        queries: List[str],
+        embeddings: List[List[float]],
+        top_k: int,
+        perspective: Optional[str] = None,
+    ) -> List[VectorStoreQueryResult]:
+        filters = partition_filters(perspective) if perspective is not None else None
+        store_queries = [
+            VectorStoreQuery(query_embedding=embedding, similarity_top_k=top_k, query_str=query, filters=filters)
+            for query, embedding in zip(queries, embeddings)
+        ]
+        if hasattr(self._vector_store, "batch_query"):
+            # Runs inline, so it never overlaps another search
+            return self._vector_store.batch_query(store_queries)
+        return await self.search_flights.do(
+            (*queries, top_k, perspective),
+            lambda: asyncio.gather(*(self._vector_store.aquery(q) for q in store_queries)),
+        )
+
+    @staticmethod
+    def _result_lists(search_results: List[VectorStoreQueryResult]) -> List[List[NodeWithScore]]:
+        return [
+            [NodeWithScore(node=node, score=score) for node, score in zip(result.nodes or [], result.similarities or [])]
+            for result in search_results
+        ]
+
+    async def _aretrieve_partitions(
+        self, query_strs: List[str], embeddings: List[List[float]]
+    ) -> Optional[List[NodeWithScore]]:
+        """
+        Each partition's fused top candidates, partition after partition, or None
+        when no partition's vector search matched anything (an index ingested
+        before chunks were tagged with their perspective).
+        """
+        perspectives = list(self.partitions)
+        with stage_timer.stage("search"):
+            searches = await asyncio.gather(*(
+                self._asearch(query_strs, embeddings, self._partition_top_k, perspective)
+                for perspective in perspectives
+            ))
+        partition_lists = [self._result_lists(search_results) for search_results in searches]
+        if not any(nodes for result_lists in partition_lists for nodes in result_lists):
+            if not self._warned_untagged:
+                logger.warning("RETRIEVAL_PARTITIONED but no chunk matched a perspective filter; the index is "
+                               "probably untagged, re-run scripts/ingest.py. Searching the whole library at once.")
+                self._warned_untagged = True
+            return None
+        if self._sparse_retriever is not None:
+            with stage_timer.stage("sparse"):
+                for perspective, result_lists in zip(perspectives, partition_lists):
+                    result_lists += [self._sparse_retriever.index.query(query, self._partition_top_k, perspective)
+                                     for query in query_strs]
+        with stage_timer.stage("fusion"):
+            return [
+                node
+                for perspective, result_lists in zip(perspectives, partition_lists)
+                for node in reciprocal_rank_fusion(result_lists)[: self.partitions[perspective]]
+            ]
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        queries: List[QueryBundle] = [query_bundle]
+        # Admission control drops the generated queries under load (see admission.py)
+        if self.num_queries > 1 and admission.current_plan().expand_queries:
+            with stage_timer.stage("query_expansion"):
+                queries.extend(await self._aget_queries(query_bundle.query_str))
+        # Duplicate generated queries would return identical lists; keep the first
+        query_strs = list(dict.fromkeys(q.query_str for q in queries))
+
+        # OpenAI embeds queries and documents with the same model, so the batched
+        # text endpoint returns the same vectors as one query call per string.
+        with stage_timer.stage("embedding"):
+            embeddings = await self._embed_model.aget_text_embedding_batch(query_strs)
+        if self.partitions:
+            nodes = await self._aretrieve_partitions(query_strs, embeddings)
+            if nodes is not None:
+                return nodes
+        with stage_timer.stage("search"):
+            search_results = await self._asearch(query_strs, embeddings, self._vector_top_k)
+        result_lists = self._result_lists(search_results)
+        if self._sparse_retriever is not None:
+            with stage_timer.stage("sparse"):
+                result_lists += [self._sparse_retriever.index.query(query, self._sparse_retriever.similarity_top_k)
+                                 for query in query_strs]
+
+        if self.mode == FUSION_MODES.RECIPROCAL_RANK:
+            with stage_timer.stage("fusion"):
+                return reciprocal_rank_fusion(result_lists)[: self.similarity_top_k]
+
+        results: Dict[Tuple[str, int], List[NodeWithScore]] = {
+            # (query, retriever index): vector results first, then sparse
+            (query_strs[i % len(query_strs)], i // len(query_strs)): nodes for i, nodes in enumerate(result_lists)
+        }
+        if self.mode == FUSION_MODES.RELATIVE_SCORE:
+            return self._relative_score_fusion(results)[: self.similarity_top_k]
+        elif self.mode == FUSION_MODES.DIST_BASED_SCORE:
+            return self._relative_score_fusion(results, dist_based=True)[: self.similarity_top_k]
+        elif self.mode == FUSION_MODES.SIMPLE:
+            return self._simple_fusion(results)[: self.similarity_top_k]
+        else:
+            raise ValueError(f"Invalid fusion mode: {self.mode}")
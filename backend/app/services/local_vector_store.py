@@ -0,0 +1,415 @@
+
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+from pydantic import PrivateAttr
+
+from app.core.config import settings
+
+logger = logging.getLogger("app.services.local_vector_store")
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+def _kmeans(matrix: np.ndarray, num_lists: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means centroids for the IVF coarse quantizer."""
+    rng = np.random.default_rng(seed)
+    centroids = matrix[rng.choice(len(matrix), size=num_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(matrix @ centroids.T, axis=1)
+        for c in range(num_lists):
+            members = matrix[assignment == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids = _normalize(centroids)
+    return centroids
+
+
+class LocalVectorStore(BasePydanticVectorStore):
+    """
+    In-process vector store over a memory-mapped matrix of normalized embeddings.
+
+    Layout of `persist_dir`:
+        meta.json     {"dim": N}
+        vectors.f32   row-major float32 matrix of unit vectors, memory-mapped
+        rows.jsonl    log of row records (node id + node metadata, one per matrix
+                      row, in order) and delete records
+        ivf.npz       optional IVF centroids and inverted lists, built by compact()
+
+    Writes append to the matrix and the log, so ingestion can checkpoint after
+    every batch; compact() rewrites both without deleted rows. Queries score the
+    whole matrix with one matrix multiply (exact search), or, with `ivf_lists`,
+    only the rows in the `ivf_probes` clusters nearest the query plus any rows
+    appended since the last compaction.
+    """
+
+    stores_text: bool = True
+    is_embedding_query: bool = True
+
+    persist_dir: str
+    ivf_lists: int = 0
+    ivf_probes: int = 8
+
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _dim: Optional[int] = PrivateAttr(default=None)
+    _ids: List[str] = PrivateAttr(default_factory=list)
+    _records: List[dict] = PrivateAttr(default_factory=list)
+    _row_of: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _alive: np.ndarray = PrivateAttr(default_factory=lambda: np.zeros(0, dtype=bool))
+    _matrix: Optional[np.ndarray] = PrivateAttr(default=None)
+    _centroids: Optional[np.ndarray] = PrivateAttr(default=None)
+    _lists: List[np.ndarray] = PrivateAttr(default_factory=list)
+    _ivf_rows: int = PrivateAttr(default=0)
+    _filter_masks: Dict[str, np.ndarray] = PrivateAttr(default_factory=dict)
+
+    def __init__(self, persist_dir: str, **kwargs: Any):
+        super().__init__(persist_dir=persist_dir, **kwargs)
+        os.makedirs(persist_dir, exist_ok=True)
+        self._load()
+
+    @classmethod
+    def from_settings(cls) -> "LocalVectorStore":
+        store = cls(
+            persist_dir=settings.LOCAL_INDEX_DIR.format(index_name=settings.INDEX_NAME),
+            ivf_lists=settings.LOCAL_INDEX_IVF_LISTS,
+            ivf_probes=settings.LOCAL_INDEX_IVF_PROBES,
+        )
+        logger.info(f"Local vector index at '{store.persist_dir}' ({len(store)} vectors)")
+        return store
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    def __len__(self) -> int:
+        return int(self._alive.sum())
+
+    # Persistence
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.persist_dir, name)
+
+    def _load(self) -> None:
+        meta_path = self._path("meta.json")
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path) as f:
+            self._dim = int(json.load(f)["dim"])
+
+        vectors_path, rows_path = self._path("vectors.f32"), self._path("rows.jsonl")
+        vector_rows = os.path.getsize(vectors_path) // (4 * self._dim) if os.path.exists(vectors_path) else 0
+
+        # Replay the log: a row record appends a row (replacing any live row with
+        # the same ID), a delete record kills rows
+        ids, records, alive, row_of = [], [], [], {}
+        if os.path.exists(rows_path):
+            with open(rows_path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # partially written tail from a crashed writer
+                    if "id" in entry and len(ids) >= vector_rows:
+                        break
+                    for node_id in entry.get("delete", [entry.get("id")]):
+                        row = row_of.pop(node_id, None)
+                        if row is not None:
+                            alive[row] = False
+                    if "id" in entry:
+                        row_of[entry["id"]] = len(ids)
+                        ids.append(entry["id"])
+                        records.append(entry["node"])
+                        alive.append(True)
+
+        # Vectors are written before their log records: drop any unlogged tail
+        if vector_rows > len(ids):
+            with open(vectors_path, "r+b") as f:
+                f.truncate(len(ids) * 4 * self._dim)
+
+        self._ids, self._records, self._row_of = ids, records, row_of
+        self._alive = np.array(alive, dtype=bool)
+        self._map_matrix()
+        self._load_ivf()
+
+    def _map_matrix(self) -> None:
+        rows = len(self._ids)
+        self._matrix = (
+            np.memmap(self._path("vectors.f32"), dtype=np.float32, mode="r", shape=(rows, self._dim))
+            if rows else None
+        )
+
+    def _load_ivf(self) -> None:
+        self._centroids, self._lists, self._ivf_rows = None, [], 0
+        ivf_path = self._path("ivf.npz")
+        if not self.ivf_lists or not os.path.exists(ivf_path):
+            return
+        data = np.load(ivf_path)
+        if int(data["rows"]) > len(self._ids):
+            return  # stale: built for a matrix that has since been cleared
+        offsets = data["offsets"]
+        self._centroids = data["centroids"]
+        self._lists = [data["members"][offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+        self._ivf_rows = int(data["rows"])
+
+    def _append_log(self, entries: List[dict]) -> None:
+        with open(self._path("rows.jsonl"), "a") as f:
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+
+    def _kill(self, node_ids: Sequence[str]) -> List[str]:
+        killed = []
+        for node_id in node_ids:
+            row = self._row_of.pop(node_id, None)
+            if row is not None:
+                self._alive[row] = False
+                killed.append(node_id)
+        return killed
+
+    def compact(self) -> None:
+        """Rewrite the index without deleted rows and rebuild the IVF lists."""
+        with self._lock:
+            if self._dim is None:
+                return
+            keep = np.flatnonzero(self._alive)
+            matrix = np.asarray(self._matrix[keep]) if len(keep) else np.zeros((0, self._dim), dtype=np.float32)
+
+            with open(self._path("vectors.f32.tmp"), "wb") as f:
+                f.write(matrix.tobytes())
+            with open(self._path("rows.jsonl.tmp"), "w") as f:
+                f.write("".join(json.dumps({"id": self._ids[i], "node": self._records[i]}) + "\n" for i in keep))
+            os.replace(self._path("vectors.f32.tmp"), self._path("vectors.f32"))
+            os.replace(self._path("rows.jsonl.tmp"), self._path("rows.jsonl"))
+
+            self._ids = [self._ids[i] for i in keep]
+            self._records = [self._records[i] for i in keep]
+            self._row_of = {node_id: row for row, node_id in enumerate(self._ids)}
+            self._alive = np.ones(len(keep), dtype=bool)
+            self._filter_masks = {}
+            self._map_matrix()
+
+            ivf_path = self._path("ivf.npz")
+            if self.ivf_lists and len(keep) >= 4 * self.ivf_lists:
+                centroids = _kmeans(matrix, self.ivf_lists)
+                assignment = np.argmax(matrix @ centroids.T, axis=1)
+                members = np.argsort(assignment, kind="stable")
+                offsets = np.searchsorted(assignment[members], np.arange(self.ivf_lists + 1))
+                np.savez(ivf_path, centroids=centroids, members=members, offsets=offsets, rows=len(keep))
+            elif os.path.exists(ivf_path):
+                os.remove(ivf_path)
+            self._load_ivf()
+
+    # Writes
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        embeddings = []
+        for node in nodes:
+            if node.embedding is None:
+                raise ValueError(f"Node {node.node_id} has no embedding")
+            embeddings.append(node.embedding)
+        matrix = _normalize(np.asarray(embeddings, dtype=np.float32))
+
+        with self._lock:
+            if self._dim is None:
+                self._dim = int(matrix.shape[1])
+                with open(self._path("meta.json"), "w") as f:
+                    json.dump({"dim": self._dim}, f)
+            if matrix.shape[1] != self._dim:
+                raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match index dimension {self._dim}")
+
+            # Re-adding an ID (e.g. a resumed ingest) replaces the old row
+            replaced = self._kill([node.node_id for node in nodes])
+            entries = [{"delete": replaced}] if replaced else []
+            records = [node_to_metadata_dict(node, remove_text=False, flat_metadata=False) for node in nodes]
+            entries += [{"id": node.node_id, "node": record} for node, record in zip(nodes, records)]
+
+            with open(self._path("vectors.f32"), "ab") as f:
+                f.write(matrix.tobytes())
+            self._append_log(entries)
+
+            first_row = len(self._ids)
+            self._ids.extend(node.node_id for node in nodes)
+            self._records.extend(records)
+            self._alive = np.concatenate([self._alive, np.ones(len(nodes), dtype=bool)])
+            for offset, node in enumerate(nodes):
+                self._row_of[node.node_id] = first_row + offset
+            self._filter_masks = {}
+            self._map_matrix()
+        return [node.node_id for node in nodes]
+
+    def delete_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        with self._lock:
+            ids = list(node_ids or [])
+            if filters is not None:
+                ids += [self._ids[row] for row in np.flatnonzero(self._filter_mask(filters))]
+            killed = self._kill(ids)
+            if killed:
+                self._append_log([{"delete": killed}])
+                self._filter_masks = {}
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        with self._lock:
+            ids = [self._ids[row] for row in np.flatnonzero(self._alive)
+                   if self._records[row].get("ref_doc_id") == ref_doc_id]
+        self.delete_nodes(ids)
+
+    def clear(self) -> None:
+        with self._lock:
+            for name in ("meta.json", "vectors.f32", "rows.jsonl", "ivf.npz"):
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+            self._dim, self._ids, self._records, self._row_of = None, [], [], {}
+            self._alive = np.zeros(0, dtype=bool)
+            self._matrix, self._centroids, self._lists, self._ivf_rows = None, None, [], 0
+            self._filter_masks = {}
+
+    # Reads
+
+    def _filter_mask(self, filters: MetadataFilters) -> np.ndarray:
+        """Boolean row mask for EQ/NE/IN/NIN metadata filters (cached until the next write)."""
+        cache_key = filters.model_dump_json()
+        mask = self._filter_masks.get(cache_key)
+        if mask is not None:
+            return mask
+
+        def matches(record: dict, flt) -> bool:
+            if isinstance(flt, MetadataFilters):
+                results = (matches(record, sub) for sub in flt.filters)
+                return all(results) if flt.condition != FilterCondition.OR else any(results)
+            value = record.get(flt.key)
+            if flt.operator == FilterOperator.EQ:
+                return value == flt.value
+            if flt.operator == FilterOperator.NE:
+                return value != flt.value
+            if flt.operator == FilterOperator.IN:
+                return value in flt.value
+            if flt.operator == FilterOperator.NIN:
+                return value not in flt.value
+            raise NotImplementedError(f"LocalVectorStore does not support filter operator {flt.operator}")
+
+        mask = np.array([matches(record, filters) for record in self._records], dtype=bool)
+        mask &= self._alive
+        self._filter_masks[cache_key] = mask
+        return mask
+
+    def count(self, filters: Optional[MetadataFilters] = None) -> int:
+        """Live rows matching `filters` (all live rows without)."""
+        with self._lock:
+            return int(self._filter_mask(filters).sum()) if filters else len(self)
+
+    def _candidate_mask(self, query: VectorStoreQuery) -> np.ndarray:
+        mask = self._filter_mask(query.filters) if query.filters else self._alive
+        if query.node_ids or query.doc_ids:
+            restrict = np.zeros(len(self._ids), dtype=bool)
+            for node_id in query.node_ids or []:
+                if node_id in self._row_of:
+                    restrict[self._row_of[node_id]] = True
+            doc_ids = set(query.doc_ids or [])
+            if doc_ids:
+                restrict |= np.array([record.get("ref_doc_id") in doc_ids for record in self._records], dtype=bool)
+            mask = mask & restrict
+        return mask
+
+    def _search(self, vectors: np.ndarray, top_k: int, mask: np.ndarray) -> List[tuple]:
+        """(rows, scores) per query vector: one matrix multiply, or IVF probes."""
+        if self._matrix is None or not mask.any():
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in vectors]
+
+        if self._centroids is None:
+            scores = vectors @ self._matrix.T
+            scores[:, ~mask] = -np.inf
+            results = []
+            for row_scores in scores:
+                rows = _top_k(row_scores, top_k)
+                rows = rows[np.isfinite(row_scores[rows])]
+                results.append((rows, row_scores[rows]))
+            return results
+
+        results = []
+        tail = np.arange(self._ivf_rows, len(self._ids))
+        probes = min(self.ivf_probes, len(self._centroids))
+        for vector, nearest in zip(vectors, np.argsort(-(vectors @ self._centroids.T), axis=1)[:, :probes]):
+            rows = np.concatenate([self._lists[c] for c in nearest] + [tail])
+            rows = rows[mask[rows]]
+            row_scores = self._matrix[rows] @ vector
+            best = _top_k(row_scores, top_k)
+            results.append((rows[best], row_scores[best]))
+        return results
+
+    def _to_result(self, rows: np.ndarray, scores: np.ndarray) -> VectorStoreQueryResult:
+        nodes = [metadata_dict_to_node(self._records[row]) for row in rows]
+        return VectorStoreQueryResult(
+            nodes=nodes,
+            similarities=[float(score) for score in scores],
+            ids=[self._ids[row] for row in rows],
+        )
+
+    def batch_query(self, queries: Sequence[VectorStoreQuery]) -> List[VectorStoreQueryResult]:
+        """Answer several queries that share filters with a single matrix multiply."""
+        if not queries:
+            return []
+        with self._lock:
+            mask = self._candidate_mask(queries[0])
+            vectors = _normalize(np.asarray([q.query_embedding for q in queries], dtype=np.float32))
+            top_k = max(q.similarity_top_k for q in queries)
+            hits = self._search(vectors, top_k, mask)
+            return [self._to_result(rows[:q.similarity_top_k], scores[:q.similarity_top_k])
+                    for q, (rows, scores) in zip(queries, hits)]
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.query_embedding is None:
+            raise ValueError("LocalVectorStore only supports embedding queries")
+        return self.batch_query([query])[0]
+
+    async def aquery(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        # Sub-millisecond for corpora of this size; not worth a thread hop.
+        return self.query(query, **kwargs)
+
+    def get_nodes(
+        self,
+        node_ids: Optional[List[str]] = None,
+        filters: Optional[MetadataFilters] = None,
+    ) -> List[BaseNode]:
+        with self._lock:
+            # The filter mask is cached (see _filter_mask), so never narrow it in place
+            mask = self._filter_mask(filters) if filters else self._alive
+            if node_ids is not None:
+                wanted = np.zeros(len(self._ids), dtype=bool)
+                wanted[[self._row_of[i] for i in node_ids if i in self._row_of]] = True
+                mask = mask & wanted
+            return [metadata_dict_to_node(self._records[row]) for row in np.flatnonzero(mask)]
@@ -0,0 +1,69 @@
+import logging
+from typing import Any, Dict, Optional, Sequence
+
+from llama_index.core.schema import BaseNode, NodeWithScore
+from llama_index.core.vector_stores.types import BasePydanticVectorStore, MetadataFilter, MetadataFilters
+
+from app.core.config import settings
+from app.services.local_vector_store import LocalVectorStore
+
+logger = logging.getLogger("app.services.perspectives")
+
+# The prompt answers from two perspectives; sources matching these keywords
+# (case-insensitive, in the file name) are the spiritual one, the rest modern.
+SPIRITUAL_SOURCE_KEYWORDS = ("gita",)
+SPIRITUAL, MODERN = "spiritual", "modern"
+PERSPECTIVES = (SPIRITUAL, MODERN)
+
+# Metadata key holding a chunk's perspective, set at ingestion (see tag_perspectives)
+PERSPECTIVE_KEY = "perspective"
+
+
+def source_perspective(metadata: Dict[str, Any]) -> str:
+    """The perspective of a chunk's metadata: its tag, or else its source file name."""
+    tag = metadata.get(PERSPECTIVE_KEY)
+    if tag in PERSPECTIVES:
+        return tag
+    source = str(metadata.get("file_name", "")).lower()
+    return SPIRITUAL if any(keyword in source for keyword in SPIRITUAL_SOURCE_KEYWORDS) else MODERN
+
+
+def perspective_of(node: NodeWithScore) -> str:
+    return source_perspective(node.node.metadata)
+
+
+def tag_perspectives(nodes: Sequence[BaseNode]) -> None:
+    """
+    Tag each chunk with its perspective, so the vector store can search the
+    perspectives as separate partitions. The tag is left out of the text that is
+    embedded and sent to the LLM, so embeddings (and the embedding cache) don't change.
+    """
+    for node in nodes:
+        node.metadata[PERSPECTIVE_KEY] = source_perspective(node.metadata)
+        for excluded in (node.excluded_embed_metadata_keys, node.excluded_llm_metadata_keys):
+            if PERSPECTIVE_KEY not in excluded:
+                excluded.append(PERSPECTIVE_KEY)
+
+
+def partition_filters(perspective: str) -> MetadataFilters:
+    """Vector store filters selecting one perspective's chunks."""
+    return MetadataFilters(filters=[MetadataFilter(key=PERSPECTIVE_KEY, value=perspective)])
+
+
+def build_partitions(vector_store: BasePydanticVectorStore) -> Optional[Dict[str, int]]:
+    """
+    Fused candidates per perspective for RETRIEVAL_PARTITIONED, or None to
+    search the whole library at once (disabled, or a local index ingested
+    before chunks were tagged; re-run scripts/ingest.py to tag them). Other
+    stores can't be counted up front; for those the fusion retriever falls back
+    to a global search when no partition matches.
+    """
+    if not settings.RETRIEVAL_PARTITIONED:
+        return None
+    partitions = {p: settings.PARTITION_CANDIDATES[p] for p in PERSPECTIVES}
+    if isinstance(vector_store, LocalVectorStore) and len(vector_store):
+        if not any(vector_store.count(partition_filters(p)) for p in PERSPECTIVES):
+            logger.warning("RETRIEVAL_PARTITIONED but the local index has no perspective tags; "
+                           "run scripts/ingest.py. Searching the whole library at once.")
+            return None
+    return partitions
@@ -0,0 +1,182 @@
+
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from llama_index.core.llms import LLM
+
+from app.core.config import settings
+from app.services.response_cache import normalize_text
+from app.services.single_flight import SingleFlight
+
+logger = logging.getLogger("app.services.query_expansion")
+
+_WORD = re.compile(r"[a-z][a-z'-]*")
+
+STOPWORDS = frozenset(
+    "a about am an and any are as at be been being but by can could did do does doing for from "
+    "get got had has have how i if in into is it its it's me might more most my of on or our "
+    "should so some such than that the their them then there these they this those to too us "
+    "very was we were what when where which while who whom why will with would you your "
+    "tell explain give help please according say says book books".split()
+)
+
+# Small domain thesaurus bridging the modern and spiritual vocabularies of the library
+SYNONYMS: Dict[str, List[str]] = {
+    "habit": ["routine", "practice"],
+    "habits": ["routines", "practices"],
+    "duty": ["dharma", "responsibility"],
+    "action": ["karma", "work"],
+    "actions": ["karma", "deeds"],
+    "work": ["karma", "action"],
+    "purpose": ["ikigai", "meaning"],
+    "meaning": ["purpose", "ikigai"],
+    "anxiety": ["worry", "fear"],
+    "fear": ["anxiety", "worry"],
+    "stress": ["anxiety", "pressure"],
+    "anger": ["frustration", "wrath"],
+    "attachment": ["desire", "craving"],
+    "detachment": ["equanimity", "non-attachment"],
+    "desire": ["craving", "attachment"],
+    "motivation": ["drive", "discipline"],
+    "discipline": ["self-control", "willpower"],
+    "focus": ["attention", "concentration"],
+    "mind": ["thoughts", "self"],
+    "goal": ["outcome", "aim"],
+    "goals": ["outcomes", "aims"],
+    "success": ["achievement", "effectiveness"],
+    "happiness": ["contentment", "joy"],
+    "procrastination": ["delay", "avoidance"],
+    "productivity": ["effectiveness", "efficiency"],
+    "change": ["transformation", "growth"],
+    "identity": ["self-image", "character"],
+    "decision": ["choice", "judgment"],
+    "decisions": ["choices", "judgments"],
+    "failure": ["setback", "mistake"],
+    "death": ["mortality", "impermanence"],
+}
+
+
+class QueryExpander:
+    """Produces extra search queries for the fusion retriever (the original query excluded)."""
+
+    mode = "off"
+
+    async def aexpand(self, query: str, num_queries: int) -> List[str]:
+        return []
+
+    def calls_llm(self, query: str, num_queries: int) -> bool:
+        """Whether expanding `query` now would make an LLM request (priced by admission control)."""
+        return False
+
+
+class LLMQueryExpander(QueryExpander):
+    """One LLM completion per turn, parsed the same way as QueryFusionRetriever."""
+
+    mode = "llm"
+
+    def __init__(self, llm: LLM, prompt: str):
+        self._llm = llm
+        self._prompt = prompt
+
+    async def aexpand(self, query: str, num_queries: int) -> List[str]:
+        response = await self._llm.acomplete(self._prompt.format(num_queries=num_queries, query=query))
+        queries = [q.strip() for q in response.text.strip("`").split("\n") if q.strip()]
+        logger.debug(f"Generated queries: {queries}")
+        return queries[:num_queries]
+
+    def calls_llm(self, query: str, num_queries: int) -> bool:
+        return True
+
+
+class CachedQueryExpander(QueryExpander):
+    """
+    Memoizes another expander by normalized query, evicting least-recently-used
+    entries. Concurrent misses for the same query share one expansion (`flights`).
+    """
+
+    mode = "cached"
+
+    def __init__(self, expander: QueryExpander, max_entries: int = 1000):
+        self._expander = expander
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.flights = SingleFlight(settings.SINGLE_FLIGHT_ENABLED)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+    @staticmethod
+    def _key(query: str, num_queries: int) -> str:
+        return f"{num_queries}\x00{normalize_text(query)}"
+
+    def calls_llm(self, query: str, num_queries: int) -> bool:
+        with self._lock:
+            cached = self._key(query, num_queries) in self._entries
+        return not cached and self._expander.calls_llm(query, num_queries)
+
+    async def aexpand(self, query: str, num_queries: int) -> List[str]:
+        key = self._key(query, num_queries)
+        with self._lock:
+            queries = self._entries.get(key)
+            if queries is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return list(queries)
+            self.misses += 1
+
+        queries = await self.flights.do(key, lambda: self._expander.aexpand(query, num_queries))
+        with self._lock:
+            self._entries[key] = list(queries)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return queries
+
+
+class LocalQueryExpander(QueryExpander):
+    """
+    No-network expansion: a keyphrase query (stopwords dropped) and a synonym
+    query (keyphrases swapped through SYNONYMS).
+    """
+
+    mode = "local"
+
+    @staticmethod
+    def keyphrases(query: str) -> List[str]:
+        return [word for word in _WORD.findall(normalize_text(query)) if word not in STOPWORDS and len(word) > 2]
+
+    async def aexpand(self, query: str, num_queries: int) -> List[str]:
+        keyphrases = self.keyphrases(query)
+        if not keyphrases:
+            return []
+        candidates = [
+            " ".join(keyphrases),
+            " ".join(SYNONYMS[word][0] if word in SYNONYMS else word for word in keyphrases),
+            " ".join(SYNONYMS[word][1] if word in SYNONYMS else word for word in keyphrases),
+        ]
+        seen = {normalize_text(query)}
+        queries = []
+        for candidate in candidates:
+            if candidate not in seen:
+                seen.add(candidate)
+                queries.append(candidate)
+        return queries[:num_queries]
+
+
+def build_query_expander(llm: LLM, prompt: str, mode: Optional[str] = None) -> QueryExpander:
+    """Query expander for QUERY_EXPANSION_MODE: "off", "llm", "cached" or "local"."""
+    mode = mode or settings.QUERY_EXPANSION_MODE
+    if mode == "off":
+        return QueryExpander()
+    if mode == "llm":
+        return LLMQueryExpander(llm, prompt)
+    if mode == "cached":
+        return CachedQueryExpander(LLMQueryExpander(llm, prompt), max_entries=settings.QUERY_EXPANSION_CACHE_SIZE)
+    if mode == "local":
+        return LocalQueryExpander()
+    raise ValueError(f"Unknown QUERY_EXPANSION_MODE: {mode}")
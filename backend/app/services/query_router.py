@@ -0,0 +1,49 @@
+
+import re
+
+from app.services.response_cache import normalize_text
+
+RETRIEVAL = "retrieval"
+CONVERSATIONAL = "conversational"
+OUT_OF_SCOPE = "out_of_scope"
+
+# Whole-message small talk. Anything longer or more specific goes to retrieval.
+_CONVERSATIONAL = re.compile(
+    r"^(?:(?:hi|hello|hey|hiya|yo|greetings|namaste|good (?:morning|afternoon|evening))(?: there)?"
+    r"|(?:thanks|thank you|thx|ty)(?: (?:so much|a lot|very much))?"
+    r"|(?:bye|goodbye|see you|see ya)(?: later)?"
+    r"|ok(?:ay)?|cool|great|nice|got it"
+    r"|how are you(?: doing)?(?: today)?"
+    r"|who are you|what are you|what(?: is|'s) your name|what can you do|who (?:made|built|created) you"
+    r")(?: sage| modern sage)?[\s!.?]*$"
+)
+
+# Clearly outside a library of wisdom and psychology books. Only unambiguous multi-word
+# intents: single words like "recipe", "debug" or "compile" also appear in in-scope
+# questions ("the recipe for lasting habits", "debug my procrastination").
+_FOOD = r"(?:cake|cookies|bread|pasta|pizza|curry|soup|chicken|rice|pancakes|dinner|lunch|breakfast)"
+_LANGUAGE = r"(?:python|javascript|typescript|java|c\+\+|c#|golang|rust|sql|html|css|bash)"
+_OUT_OF_SCOPE = re.compile(
+    r"(?:\b(?:write|generate|give me|fix) (?:a |an |some |me a |me an |me some |this |my )?"
+    rf"(?:{_LANGUAGE} )?(?:program|script|function|code|query|regex)\b"
+    r"|\b(?:in|using|with) (?:python|javascript|typescript|c\+\+|c#|golang|sql|html|css)[?.!]*$"
+    r"|\b(?:stack trace|syntax error|compiler error|segmentation fault|null pointer exception|sql query)\b"
+    rf"|\brecipes? for (?:a |an |some |the )?(?:\w+ )?{_FOOD}\b"
+    rf"|^how (?:do i|to|can i|should i) (?:bake|cook|make) (?:a |an |some |the )?(?:\w+ )?{_FOOD}[?.!]*$"
+    r"|\b(?:weather forecast|stock price|bitcoin price|price of bitcoin|exchange rate)\b)"
+)
+
+
+def classify_query(message: str) -> str:
+    """
+    Cheap pre-retrieval routing of a user message.
+
+    CONVERSATIONAL and OUT_OF_SCOPE messages are answered (or declined) by the LLM
+    under the system prompt without retrieval; everything else is RETRIEVAL.
+    """
+    text = normalize_text(message)
+    if not text or _CONVERSATIONAL.match(text):
+        return CONVERSATIONAL
+    if _OUT_OF_SCOPE.search(text):
+        return OUT_OF_SCOPE
+    return RETRIEVAL
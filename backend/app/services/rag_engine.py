@@ -1,21 +1,45 @@
 
+import asyncio
 import logging
-from typing import List, Optional
-from llama_index.core.llms import ChatMessage
+import time
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional
+import llama_index.core
+from llama_index.core.llms import ChatMessage, LLM, MessageRole
+from llama_index.core.base.embeddings.base import BaseEmbedding
 from llama_index.core import VectorStoreIndex
-from llama_index.core.chat_engine import ContextChatEngine
-from llama_index.core.retrievers import QueryFusionRetriever
+from llama_index.core.chat_engine import ContextChatEngine, SimpleChatEngine
+from llama_index.core.chat_engine.types import StreamingAgentChatResponse
+from llama_index.core.chat_engine.utils import get_response_synthesizer
 from llama_index.core.retrievers.fusion_retriever import FUSION_MODES
 from llama_index.vector_stores.pinecone import PineconeVectorStore
-from pinecone import Pinecone
 from llama_index.core.memory import ChatMemoryBuffer
-from llama_index.llms.openai import OpenAI
-from llama_index.postprocessor.cohere_rerank import CohereRerank
 from llama_index.core.postprocessor.types import BaseNodePostprocessor
 from llama_index.core.schema import NodeWithScore
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
 from llama_index.core import set_global_handler
 
+from app.core.clients import openai_llm, pinecone_index
 from app.core.config import settings
+from app.core.metrics import CHAT_TURNS, REGISTRY
+from app.services.admission import build_admission_controller, estimate_tokens
+from app.services.embedding_cache import build_embed_model
+from app.services import stage_timer
+from app.services.context_packer import build_context_packer
+from app.services.fusion_retriever import BatchedFusionRetriever
+from app.services.perspectives import build_partitions
+from app.services.reranker import LocalCrossEncoderRerank, PartitionedRerank, SheddableRerank, build_reranker
+from app.services.local_vector_store import LocalVectorStore
+from app.services.query_expansion import build_query_expander
+from app.services.query_router import RETRIEVAL, classify_query
+from app.services.response_cache import build_response_cache, normalize_text, replay_tokens
+from app.services.sessions import PretrimmedMemory, Session, build_session_store
+from app.services.single_flight import StreamingSingleFlight
+from app.services.sparse_index import SparseRetriever, build_sparse_retriever
+from app.services.token_usage import install_token_usage_handler
 
 logger = logging.getLogger("app.services.rag")
 
@@ -60,6 +84,100 @@ QUERY_GEN_PROMPT = (
     "Output each query on a separate line."
 )
 
+# This turn's retrieved context goes into the last user message, after the static
+# system prompt and the conversation so far (see StaticPrefixChatEngine).
+CONTEXT_QA_TEMPLATE = (
+    "Book Context:\n"
+    "---------------------\n"
+    "{context_str}\n"
+    "---------------------\n\n"
+    "{query_str}"
+)
+
+CONTEXT_REFINE_TEMPLATE = (
+    "More Book Context:\n"
+    "---------------------\n"
+    "{context_msg}\n"
+    "---------------------\n"
+    "Existing answer:\n"
+    "{existing_answer}\n"
+    "---------------------\n"
+    "Refine the existing answer to the question below with this context. "
+    "If the context isn't helpful, repeat the existing answer.\n\n"
+    "{query_str}"
+)
+
+class StaticPrefixChatEngine(ContextChatEngine):
+    """ContextChatEngine that keeps the prompt prefix identical across turns.
+
+    The stock engine formats the retrieved context into the system message,
+    ahead of the system prompt, so no two prompts share a prefix. Here the
+    messages are [system prompt, *history, context + question]: within a
+    conversation everything but the last message repeats, which lets the
+    provider's prompt cache serve it.
+    """
+
+    def _get_response_synthesizer(self, chat_history: List[ChatMessage], streaming: bool = False):
+        prefix = [*self._prefix_messages, *chat_history]
+        return get_response_synthesizer(
+            self._llm,
+            self.callback_manager,
+            [*prefix, ChatMessage(content=CONTEXT_QA_TEMPLATE, role=MessageRole.USER)],
+            [*prefix, ChatMessage(content=CONTEXT_REFINE_TEMPLATE, role=MessageRole.USER)],
+            streaming,
+        )
+
+async def stream_response_tokens(response: StreamingAgentChatResponse) -> AsyncGenerator[str, None]:
+    """The tokens of a streaming chat response as they arrive.
+
+    Replaces ``response.async_response_gen()``, which polls for the end of the
+    stream every 0.1 s (so the turn ends up to 100 ms after its last token) and,
+    when closed early, waits for the rest of the answer to be generated. Closing
+    this generator cancels the generation instead.
+    """
+    writer = response.awrite_response_to_history_task
+    if writer is None:
+        async for token in response.async_response_gen():
+            yield token
+        return
+    response._ensure_async_setup()
+    queue = response.aqueue
+    getter = None
+    try:
+        while True:
+            if not queue.empty():
+                token = queue.get_nowait()
+            elif writer.done():
+                break
+            else:
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait((getter, writer), return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    continue
+                token = getter.result()
+            if token:
+                yield token
+        writer.result()  # re-raise an upstream error
+        if getattr(response, "exception", None) is not None:
+            raise response.exception  # llama_index versions that record the error instead
+    finally:
+        if getter is not None and not getter.done():
+            getter.cancel()
+        if not writer.done():
+            writer.cancel()
+
+def source_metadata(nodes: List[NodeWithScore]) -> List[Dict[str, Any]]:
+    """Book, page and score of the chunks an answer is based on (sent to the client ahead of the answer)."""
+    return [
+        {
+            "file_name": node.node.metadata.get("file_name"),
+            "page_label": node.node.metadata.get("page_label"),
+            "score": round(node.score, 4) if node.score is not None else None,
+        }
+        for node in nodes
+    ]
+
 class LoggingPostprocessor(BaseNodePostprocessor):
     """Custom Postprocessor to log nodes for debugging/inspection."""
     label: str = "Nodes"
@@ -76,16 +194,79 @@ class LoggingPostprocessor(BaseNodePostprocessor):
             logger.debug(f"[{i+1}] Score: {score} | {content_preview}...")
         return nodes
 
+    async def _apostprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[object] = None,
+    ) -> List[NodeWithScore]:
+        # Cheap enough to run inline; the base class would hop to a thread.
+        return self._postprocess_nodes(nodes, query_bundle)
+
+class StageTimedPostprocessor(BaseNodePostprocessor):
+    """Runs another postprocessor and records its latency as a chat turn stage."""
+    postprocessor: BaseNodePostprocessor
+    stage: str
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[object] = None,
+    ) -> List[NodeWithScore]:
+        with stage_timer.stage(self.stage):
+            return self.postprocessor.postprocess_nodes(nodes, query_bundle=query_bundle)
+
+    async def _apostprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[object] = None,
+    ) -> List[NodeWithScore]:
+        with stage_timer.stage(self.stage):
+            return await self.postprocessor.apostprocess_nodes(nodes, query_bundle=query_bundle)
+
+class AsyncPineconeVectorStore(PineconeVectorStore):
+    """PineconeVectorStore whose async query runs off the event loop.
+
+    The upstream store only implements a blocking ``query``; its inherited
+    ``aquery`` calls it inline, which stalls every other request on the worker.
+    """
+
+    async def aquery(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        return await asyncio.to_thread(self.query, query, **kwargs)
+
+def build_vector_store() -> BasePydanticVectorStore:
+    """The vector store selected by VECTOR_BACKEND ("pinecone" or "local")."""
+    if settings.VECTOR_BACKEND == "local":
+        return LocalVectorStore.from_settings()
+    return AsyncPineconeVectorStore(pinecone_index=pinecone_index(settings.INDEX_NAME))
+
 class ChatService:
     _instance = None
-    _chat_engine = None
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(ChatService, cls).__new__(cls)
-            cls._instance._initialize()
+            # Kept only once built, so a failed build is retried rather than leaving a broken singleton
+            instance = super(ChatService, cls).__new__(cls)
+            instance._initialize()
+            cls._instance = instance
         return cls._instance
 
+    @classmethod
+    def from_components(
+        cls,
+        llm: LLM,
+        embed_model: BaseEmbedding,
+        vector_store: BasePydanticVectorStore,
+        reranker: Optional[BaseNodePostprocessor] = None,
+        sparse_retriever: Optional[SparseRetriever] = None,
+    ) -> "ChatService":
+        """Build a standalone (non-singleton) service from pre-built components.
+
+        Used by benchmarks and tooling to run the real pipeline against stub backends.
+        """
+        service = super(ChatService, cls).__new__(cls)
+        service._build_pipeline(llm, embed_model, vector_store, reranker, sparse_retriever)
+        return service
+
     def _initialize(self):
         """Initialize the RAG pipeline once."""
         logger.info("Initializing ChatService and RAG Pipeline...")
@@ -102,40 +283,66 @@ class ChatService:
             except Exception as e:
                 logger.warning(f"Failed to init Langfuse: {e}")
 
-        # Vector Store
-        if not settings.PINECONE_API_KEY:
-            raise ValueError("PINECONE_API_KEY not found in settings")
-            
         # LLM & Embedding Config
-        import llama_index.core
-        from llama_index.embeddings.openai import OpenAIEmbedding
-
-        embed_model = OpenAIEmbedding(api_key=settings.OPENAI_API_KEY)
+        embed_model = build_embed_model()
         llama_index.core.Settings.embed_model = embed_model
-        llama_index.core.Settings.llm = OpenAI(model="gpt-4o", api_key=settings.OPENAI_API_KEY)
+        llama_index.core.Settings.llm = openai_llm(
+            "gpt-4o",
+            # Report token usage on the last streamed chunk (see token_usage.py)
+            additional_kwargs={"stream_options": {"include_usage": True}},
+        )
 
-        pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-        pinecone_index = pc.Index(settings.INDEX_NAME)
-        vector_store = PineconeVectorStore(pinecone_index=pinecone_index)
-        index = VectorStoreIndex.from_vector_store(vector_store=vector_store, embed_model=embed_model)
+        # Vector Store
+        vector_store = build_vector_store()
 
-        # LLM
         # LLM - Get from Settings
         llm = llama_index.core.Settings.llm
-        # or re-init if specific params needed, but we set it globally above.
-        # Let's keep using the one we set to be consistent.
+
+        # Reranker
+        reranker = build_reranker()
+
+        # BM25 retriever for hybrid retrieval (None when RETRIEVAL_MODE=dense)
+        sparse_retriever = build_sparse_retriever()
+
+        self._build_pipeline(llm, embed_model, vector_store, reranker, sparse_retriever)
+        logger.info("ChatService Initialized.")
+
+    def _build_pipeline(
+        self,
+        llm: LLM,
+        embed_model: BaseEmbedding,
+        vector_store: BasePydanticVectorStore,
+        reranker: Optional[BaseNodePostprocessor] = None,
+        sparse_retriever: Optional[SparseRetriever] = None,
+    ):
+        """Wire retrievers, postprocessors and the chat engine around the given clients."""
+        index = VectorStoreIndex.from_vector_store(vector_store=vector_store, embed_model=embed_model)
+
+        query_expander = build_query_expander(llm, QUERY_GEN_PROMPT)
 
         # Retrievers
         vector_retriever = index.as_retriever(similarity_top_k=15)
         
-        fusion_retriever = QueryFusionRetriever(
-            [vector_retriever],
+        # Spiritual and modern sources searched and reranked as separate partitions (None: one global search)
+        partitions = build_partitions(vector_store)
+
+        # Embeds and searches all generated queries in one batch (see fusion_retriever.py),
+        # and looks each of them up in the BM25 index with hybrid retrieval
+        fusion_retriever = BatchedFusionRetriever(
+            vector_store=vector_store,
+            embed_model=embed_model,
+            vector_top_k=15,
+            retrievers=[vector_retriever],
+            query_expander=query_expander,
+            sparse_retriever=sparse_retriever,
+            partitions=partitions,
+            partition_top_k=settings.PARTITION_TOP_K,
             llm=llm,
             similarity_top_k=30,
-            num_queries=3,
+            num_queries=settings.RETRIEVAL_NUM_QUERIES,
             mode=FUSION_MODES.RECIPROCAL_RANK,
             use_async=True,
-            verbose=True,
+            verbose=False,  # upstream prints the generated (user) queries to stdout
             query_gen_prompt=QUERY_GEN_PROMPT
         )
 
@@ -143,26 +350,299 @@ class ChatService:
         node_postprocessors = []
         node_postprocessors.append(LoggingPostprocessor(label="Retrieved (Pre-Rerank)"))
 
-        if settings.COHERE_API_KEY:
-            cohere_rerank = CohereRerank(api_key=settings.COHERE_API_KEY, top_n=10)
-            node_postprocessors.append(cohere_rerank)
+        if reranker is not None:
+            rerank = PartitionedRerank(reranker=reranker, top_n=settings.PARTITION_RERANK_TOP_N) if partitions else reranker
+            # Skipped by admission control under load, keeping the best fused candidates instead
+            rerank = SheddableRerank(
+                reranker=rerank,
+                top_n=getattr(reranker, "top_n", None) or 10,
+                partition_top_n=settings.PARTITION_RERANK_TOP_N if partitions else None,
+            )
+            node_postprocessors.append(StageTimedPostprocessor(postprocessor=rerank, stage="rerank"))
             node_postprocessors.append(LoggingPostprocessor(label="Selected (Post-Rerank)"))
-        else:
-            logger.warning("COHERE_API_KEY not found. Reranking disabled.")
 
-        # Chat Engine
-        self._chat_engine = ContextChatEngine.from_defaults(
-            retriever=fusion_retriever,
-            memory=ChatMemoryBuffer.from_defaults(token_limit=4000),
-            llm=llm,
-            system_prompt=SYSTEM_PROMPT,
-            node_postprocessors=node_postprocessors,
-            verbose=True
+        # Drop near-duplicate chunks and fit the rest into the context token budget
+        context_packer = build_context_packer()
+        if context_packer is not None:
+            node_postprocessors.append(StageTimedPostprocessor(postprocessor=context_packer, stage="packing"))
+
+        # Shared, stateless parts of the chat engine. Per-conversation state
+        # (memory) is created for every turn in create_chat_engine.
+        self._llm = llm
+        self._embed_model = embed_model
+        self._vector_store = vector_store
+        self._reranker = reranker
+        self._retriever = fusion_retriever
+        self._sparse_retriever = sparse_retriever
+        self._node_postprocessors = node_postprocessors
+        self._prefix_messages = [ChatMessage(content=SYSTEM_PROMPT, role=llm.metadata.system_role)]
+
+        # Per-stage latency across turns (see stage_timer.py)
+        self.stage_stats = stage_timer.StageStats()
+        # Prompt/completion tokens of every LLM call, per turn and in /metrics
+        install_token_usage_handler()
+
+        # Concurrency limit, bounded queue and upstream rate-limit budgets for chat turns
+        # (see admission.py); only remote searches and rerank calls count against the budgets
+        calls_per_query = len(partitions) if partitions else 1
+        self.admission = build_admission_controller(
+            searches_per_query=0 if isinstance(vector_store, LocalVectorStore) else calls_per_query,
+            rerank_calls=0 if reranker is None or isinstance(reranker, LocalCrossEncoderRerank) else calls_per_query,
         )
-        logger.info("ChatService Initialized.")
+        REGISTRY.register_collector("chat_admission", self.admission.metrics)
+
+        # Semantic cache of final answers (None when disabled)
+        self.response_cache = build_response_cache()
 
-    def get_chat_engine(self):
-        return self._chat_engine
+        # Identical first-turn questions in flight share one run (None when disabled)
+        self.turn_flights = StreamingSingleFlight() if settings.SINGLE_FLIGHT_ENABLED else None
+
+        # Server-side conversation history (None when disabled)
+        self.sessions = build_session_store()
+
+        # Hit/miss counters of every cache in the pipeline, read when /metrics is scraped
+        self._caches = {
+            "response": self.response_cache,
+            "embedding": embed_model,
+            "query_expansion": query_expander,
+            "rerank": reranker,
+            "context_packer": context_packer,
+            "sessions": self.sessions,
+            "single_flight_turn": self.turn_flights,
+            "single_flight_embedding": getattr(embed_model, "flights", None),
+            "single_flight_query_expansion": getattr(query_expander, "flights", None),
+            "single_flight_search": fusion_retriever.search_flights,
+        }
+        REGISTRY.register_collector("chat_service_caches", self.cache_metrics)
+
+    def create_chat_engine(
+        self,
+        chat_history: Optional[List[ChatMessage]] = None,
+        use_retrieval: bool = True,
+        history_trimmed: bool = False,
+    ):
+        """Create a chat engine for a single conversation turn.
+
+        The index, retrievers, LLM clients and reranker are shared across engines;
+        only the memory is new, so concurrent requests never see each other's history.
+        Without retrieval the engine answers from the system prompt and history alone.
+        With ``history_trimmed`` the history already fits CHAT_HISTORY_TOKEN_LIMIT
+        (see Session.history) and is used as is.
+        """
+        # Copy: the memory appends to the list it is given, and callers key caches on their history
+        memory_class = PretrimmedMemory if history_trimmed else ChatMemoryBuffer
+        memory = memory_class.from_defaults(chat_history=list(chat_history or []), token_limit=settings.CHAT_HISTORY_TOKEN_LIMIT)
+        if not use_retrieval:
+            return SimpleChatEngine(
+                llm=self._llm,
+                memory=memory,
+                prefix_messages=self._prefix_messages,
+                callback_manager=llama_index.core.Settings.callback_manager,
+            )
+        return StaticPrefixChatEngine(
+            retriever=self._retriever,
+            llm=self._llm,
+            memory=memory,
+            prefix_messages=self._prefix_messages,
+            node_postprocessors=self._node_postprocessors,
+            callback_manager=llama_index.core.Settings.callback_manager,
+        )
+
+    async def warm_up(self, query: Optional[str] = None):
+        """Run a probe query so the first real turn doesn't pay for cold clients.
+
+        Opens the embedding and vector store connections (or maps the local
+        index), pages in the BM25 index and its partition masks with hybrid
+        retrieval and, with RERANKER=local, runs the cross-encoder once. Skips
+        the LLM and Cohere, which would bill for every boot.
+        """
+        query = query or settings.WARMUP_QUERY
+        embedding = await self._embed_model.aget_query_embedding(query)
+        result = await self._vector_store.aquery(VectorStoreQuery(query_embedding=embedding, similarity_top_k=15))
+        if self._sparse_retriever is not None:
+            for perspective in self._retriever.partitions or [None]:
+                self._sparse_retriever.index.search(query, settings.SPARSE_TOP_K, perspective)
+        if isinstance(self._reranker, LocalCrossEncoderRerank) and result.nodes:
+            scores = result.similarities or [None] * len(result.nodes)
+            nodes = [NodeWithScore(node=node, score=score) for node, score in zip(result.nodes, scores)]
+            await self._reranker.apostprocess_nodes(nodes, query_str=query)
+        logger.info(f"Warm-up probe retrieved {len(result.nodes or [])} nodes")
+
+    def cache_metrics(self):
+        """Hit/miss/entry counts of the pipeline caches, in the metrics registry's collector format."""
+        stats = {name: cache.stats() for name, cache in self._caches.items() if callable(getattr(cache, "stats", None))}
+        for key, kind, help in (
+            ("hits", "counter", "Cache hits by cache"),
+            ("misses", "counter", "Cache misses by cache"),
+            ("entries", "gauge", "Entries held by cache"),
+        ):
+            name = f"rag_cache_{key}_total" if kind == "counter" else f"rag_cache_{key}"
+            yield name, kind, help, [({"cache": cache}, values[key]) for cache, values in stats.items() if key in values]
+
+    async def astream_chat(
+        self,
+        message: str,
+        chat_history: Optional[List[ChatMessage]] = None,
+        breakdown: Optional[Dict[str, Any]] = None,
+        history_trimmed: bool = False,
+        on_sources: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+    ) -> AsyncGenerator[str, None]:
+        """Stream the response tokens for one chat turn without blocking the event loop.
+
+        Near-duplicate questions with the same history are answered from the
+        semantic response cache, replayed as word-sized tokens. Concurrent
+        first-turn requests with the same normalized question share one run of
+        the pipeline (see single_flight.py); requests that join a run in flight
+        are reported with the "coalesced" route. Otherwise the turn is admitted
+        by admission control (see admission.py), which may skip query expansion
+        or reranking under load, and holds one of ``CHAT_MAX_CONCURRENCY`` slots
+        from retrieval until the last token. A full queue, exhausted upstream
+        budgets or an upstream 429 raise ``ServiceOverloadedError`` (429); waiting
+        longer than ``CHAT_QUEUE_TIMEOUT`` for a slot raises it with a 503.
+
+        Small talk and out-of-scope messages (see query_router.py) skip retrieval.
+        Stage latencies are logged per turn, aggregated in ``stage_stats`` and
+        exported on /metrics. When ``breakdown`` is given it is filled with the
+        turn's route, stage timings and token counts once the stream completes.
+        ``on_sources`` is called with the retrieved sources (see ``source_metadata``),
+        or a cached answer's sources, before the first token.
+        """
+        timings = stage_timer.start_turn()
+        tokens = stage_timer.turn_tokens()
+        start = time.perf_counter()
+
+        query_embedding = None
+        if self.response_cache is not None:
+            with stage_timer.stage("response_cache"):
+                query_embedding = await self._embed_model.aget_query_embedding(message)
+                cached = self.response_cache.lookup(query_embedding, chat_history)
+            if cached is not None:
+                logger.info("Response cache hit")
+                if on_sources is not None and cached.sources:
+                    on_sources(cached.sources)
+                for token in replay_tokens(cached.answer):
+                    yield token
+                self._finish_turn("cached", timings, tokens, start, breakdown)
+                return
+
+        if self.turn_flights is None or chat_history:
+            async for token in self._astream_turn(message, chat_history, history_trimmed, query_embedding,
+                                                  timings, tokens, start, breakdown, on_sources):
+                yield token
+            return
+
+        # The run starts in this request's context, so it records into this turn's timings and tokens
+        started = []
+
+        def start_run(publish_sources):
+            started.append(True)
+            return self._astream_turn(message, chat_history, history_trimmed, query_embedding,
+                                      timings, tokens, start, breakdown, publish_sources)
+
+        async for token in self.turn_flights.stream(normalize_text(message), start_run, on_sources):
+            yield token
+        if not started:
+            self._finish_turn("coalesced", timings, tokens, start, breakdown)
+
+    async def _astream_turn(
+        self,
+        message: str,
+        chat_history: Optional[List[ChatMessage]],
+        history_trimmed: bool,
+        query_embedding: Optional[List[float]],
+        timings: Dict[str, float],
+        tokens: Dict[str, int],
+        start: float,
+        breakdown: Optional[Dict[str, Any]],
+        on_sources: Optional[Callable[[List[Dict[str, Any]]], None]],
+    ) -> AsyncGenerator[str, None]:
+        """The pipeline part of ``astream_chat``: routing, retrieval and generation."""
+        with stage_timer.stage("routing"):
+            route = classify_query(message) if settings.QUERY_ROUTER_ENABLED else RETRIEVAL
+
+        retrieval = route == RETRIEVAL
+        prompt_chars = len(SYSTEM_PROMPT) + len(message) + sum(len(m.content or "") for m in chat_history or [])
+        prompt_tokens = estimate_tokens(prompt_chars) + (settings.CONTEXT_TOKEN_BUDGET if retrieval else 0)
+
+        # Query expansion is priced as an LLM request only when it would make one (see admission.py)
+        expansion_llm = retrieval and self._retriever.expansion_calls_llm(message)
+
+        async with self.admission.admit(retrieval, prompt_tokens, expansion_llm) as plan:
+            try:
+                chat_engine = self.create_chat_engine(chat_history, use_retrieval=retrieval, history_trimmed=history_trimmed)
+                response = await chat_engine.astream_chat(message)
+                sources = source_metadata(response.source_nodes) if response.source_nodes else []
+                if on_sources is not None and sources:
+                    on_sources(sources)
+                answer = []
+                first_token_at = None
+                async for token in stream_response_tokens(response):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        stage_timer.record("first_token", first_token_at - start)
+                    answer.append(token)
+                    yield token
+            except Exception as e:
+                rate_limited = self.admission.upstream_rate_limited(e)
+                if rate_limited is not None:
+                    raise rate_limited from e
+                raise
+            finally:
+                self.admission.settle(plan, tokens["llm_calls"], tokens["prompt"] + tokens["completion"])
+
+        if first_token_at is not None:
+            stage_timer.record("generation", time.perf_counter() - first_token_at)
+        self._finish_turn(route, timings, tokens, start, breakdown)
+        if breakdown is not None:
+            breakdown["admission"] = plan.level
+
+        # Only reached when the stream completed (not on errors or client disconnects)
+        if query_embedding is not None:
+            self.response_cache.store(query_embedding, chat_history, "".join(answer), time.perf_counter() - start,
+                                      sources)
+
+    async def astream_session_chat(
+        self,
+        session: Session,
+        message: str,
+        breakdown: Optional[Dict[str, Any]] = None,
+        on_sources: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+    ) -> AsyncGenerator[str, None]:
+        """Stream one turn of a server-side session (see sessions.py).
+
+        The history comes from the session, trimmed with its cached token counts;
+        turns of one session run one at a time. The turn is added to the session
+        once the answer has streamed completely, and may start a background
+        summary of older messages.
+        """
+        async with session.lock:
+            chat_history = session.history(settings.CHAT_HISTORY_TOKEN_LIMIT)
+            answer = []
+            async for token in self.astream_chat(message, chat_history, breakdown, history_trimmed=True, on_sources=on_sources):
+                answer.append(token)
+                yield token
+            self.sessions.append(session, [
+                ChatMessage(role=MessageRole.USER, content=message),
+                ChatMessage(role=MessageRole.ASSISTANT, content="".join(answer)),
+            ])
+            self.sessions.maybe_summarize(session, self._llm)
+
+    def _finish_turn(self, route: str, timings: Dict[str, float], tokens: Dict[str, int], start: float, breakdown: Optional[Dict[str, Any]]):
+        stage_timer.record("total", time.perf_counter() - start)
+        self.stage_stats.observe(timings)
+        if settings.METRICS_ENABLED:
+            CHAT_TURNS.inc(1, route)
+        logger.info(
+            f"Turn ({route}): " + ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in timings.items())
+            + f", tokens {tokens['prompt']}+{tokens['completion']}"
+            + (f", context {tokens['context_packed']}/{tokens['context_candidate']}" if "context_packed" in tokens else "")
+        )
+        if breakdown is not None:
+            breakdown.update({
+                "route": route,
+                "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in timings.items()},
+                "tokens": dict(tokens),
+            })
 
 # Singleton accessor
 def get_chat_service() -> ChatService:
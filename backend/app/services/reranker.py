@@ -0,0 +1,217 @@
+
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from pydantic import Field, PrivateAttr
+
+from app.core.clients import cohere_rerank
+from app.core.config import settings
+from app.services import admission
+from app.services.perspectives import perspective_of
+from app.services.response_cache import normalize_text
+
+logger = logging.getLogger("app.services.reranker")
+
+
+class LocalCrossEncoderRerank(BaseNodePostprocessor):
+    """
+    Reranks candidates with a small cross-encoder running on the local CPU.
+
+    Scores are cached per (normalized query, node ID) in an LRU, so only
+    passages not seen before with this query reach the model. Those are scored
+    in batches of `batch_size`, truncated to `max_length` tokens. Inference runs in
+    a worker thread, one batch at a time per process. The model needs the
+    optional `sentence-transformers` package.
+    """
+
+    model: str = Field(default="cross-encoder/ms-marco-MiniLM-L-6-v2")
+    top_n: int = 10
+    batch_size: int = 32
+    max_length: int = 512
+    cache_size: int = 10000
+
+    _model: Any = PrivateAttr()
+    _cache: "OrderedDict[Tuple[str, str], float]" = PrivateAttr(default_factory=OrderedDict)
+    _cache_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _inference_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _hits: int = PrivateAttr(default=0)
+    _misses: int = PrivateAttr(default=0)
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError as e:
+            raise ImportError(
+                "RERANKER=local requires sentence-transformers: pip install sentence-transformers"
+            ) from e
+        self._model = CrossEncoder(self.model, max_length=self.max_length, device="cpu")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "LocalCrossEncoderRerank"
+
+    def stats(self) -> dict:
+        return {"entries": len(self._cache), "hits": self._hits, "misses": self._misses}
+
+    def _score(self, query: str, nodes: List[NodeWithScore]) -> List[float]:
+        query_key = normalize_text(query)
+        keys = [(query_key, node.node.node_id) for node in nodes]
+        with self._cache_lock:
+            scores = [self._cache.get(key) for key in keys]
+            for key, score in zip(keys, scores):
+                if score is not None:
+                    self._cache.move_to_end(key)
+            missing = [i for i, score in enumerate(scores) if score is None]
+            self._hits += len(nodes) - len(missing)
+            self._misses += len(missing)
+
+        if missing:
+            pairs = [(query, nodes[i].node.get_content(metadata_mode=MetadataMode.EMBED)) for i in missing]
+            with self._inference_lock:
+                predicted = self._model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+            with self._cache_lock:
+                for i, score in zip(missing, predicted):
+                    scores[i] = float(score)
+                    self._cache[keys[i]] = scores[i]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if query_bundle is None:
+            raise ValueError("Missing query bundle in extra info.")
+        if not nodes:
+            return []
+        scores = self._score(query_bundle.query_str, nodes)
+        ranked = sorted(zip(nodes, scores), key=lambda pair: pair[1], reverse=True)
+        return [NodeWithScore(node=node.node, score=score) for node, score in ranked[: self.top_n]]
+
+    async def _apostprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        # CPU-bound inference; keep it off the event loop
+        return await asyncio.to_thread(self._postprocess_nodes, nodes, query_bundle)
+
+
+class PartitionedRerank(BaseNodePostprocessor):
+    """
+    Reranks each perspective's candidates on its own (see perspectives.py), all
+    partitions at once, and keeps the best `top_n[perspective]` of each. The
+    kept chunks are returned best first across partitions.
+
+    Used with partitioned retrieval: every rerank call gets a partition's
+    candidates only, and neither perspective can crowd out the other.
+    """
+
+    reranker: BaseNodePostprocessor
+    top_n: Dict[str, int]
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "PartitionedRerank"
+
+    def _partitions(self, nodes: List[NodeWithScore]) -> Dict[str, List[NodeWithScore]]:
+        partitions: Dict[str, List[NodeWithScore]] = {}
+        for node in nodes:
+            partitions.setdefault(perspective_of(node), []).append(node)
+        return partitions
+
+    def _merge(self, partitions: Dict[str, List[NodeWithScore]], ranked: List[List[NodeWithScore]]) -> List[NodeWithScore]:
+        kept = [node for perspective, nodes in zip(partitions, ranked) for node in nodes[: self.top_n.get(perspective, 0)]]
+        return sorted(kept, key=lambda node: node.score or 0.0, reverse=True)
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        partitions = self._partitions(nodes)
+        ranked = [self.reranker.postprocess_nodes(group, query_bundle=query_bundle) for group in partitions.values()]
+        return self._merge(partitions, ranked)
+
+    async def _apostprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        partitions = self._partitions(nodes)
+        ranked = await asyncio.gather(*(
+            self.reranker.apostprocess_nodes(group, query_bundle=query_bundle) for group in partitions.values()
+        ))
+        return self._merge(partitions, ranked)
+
+
+class SheddableRerank(BaseNodePostprocessor):
+    """
+    Runs `reranker` unless the turn's admission plan skips reranking under load
+    (see admission.py). Skipped, the fused candidates keep their order and are
+    cut to `top_n`, or to `partition_top_n[perspective]` of each perspective with
+    partitioned retrieval, so the prompt doesn't grow when the reranker is shed.
+    """
+
+    reranker: BaseNodePostprocessor
+    top_n: int = 10
+    partition_top_n: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "SheddableRerank"
+
+    def _fused_top(self, nodes: List[NodeWithScore]) -> List[NodeWithScore]:
+        if not self.partition_top_n:
+            return nodes[: self.top_n]
+        kept, counts = [], {}
+        for node in nodes:
+            perspective = perspective_of(node)
+            if counts.get(perspective, 0) < self.partition_top_n.get(perspective, 0):
+                counts[perspective] = counts.get(perspective, 0) + 1
+                kept.append(node)
+        return kept
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if not admission.current_plan().rerank:
+            return self._fused_top(nodes)
+        return self.reranker.postprocess_nodes(nodes, query_bundle=query_bundle)
+
+    async def _apostprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if not admission.current_plan().rerank:
+            return self._fused_top(nodes)
+        return await self.reranker.apostprocess_nodes(nodes, query_bundle=query_bundle)
+
+
+def build_reranker() -> Optional[BaseNodePostprocessor]:
+    """Reranker for RERANKER: "cohere" (needs COHERE_API_KEY), "local" or "none"."""
+    if settings.RERANKER == "local":
+        logger.info(f"Local cross-encoder reranking with '{settings.LOCAL_RERANK_MODEL}'")
+        return LocalCrossEncoderRerank(
+            model=settings.LOCAL_RERANK_MODEL,
+            top_n=10,
+            batch_size=settings.LOCAL_RERANK_BATCH_SIZE,
+            max_length=settings.LOCAL_RERANK_MAX_LENGTH,
+            cache_size=settings.LOCAL_RERANK_CACHE_SIZE,
+        )
+    if settings.RERANKER == "cohere":
+        if settings.COHERE_API_KEY:
+            return cohere_rerank(top_n=10)
+        logger.warning("COHERE_API_KEY not found. Reranking disabled.")
+    return None
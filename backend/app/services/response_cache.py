@@ -0,0 +1,326 @@
+
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_index.core.llms import ChatMessage
+
+from app.core.config import settings
+
+logger = logging.getLogger("app.services.response_cache")
+
+_WHITESPACE = re.compile(r"\s+")
+_REPLAY_TOKEN = re.compile(r"\S+\s*|\s+")
+
+# Hits update the entry's access time in memory; the backend gets them in batches, at most this often
+ACCESS_FLUSH_SECONDS = 5.0
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and collapse whitespace so trivial edits map to the same key."""
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+def history_fingerprint(chat_history: Optional[Sequence[ChatMessage]]) -> str:
+    """Stable hash of a normalized chat history. Empty history -> ''."""
+    if not chat_history:
+        return ""
+    digest = hashlib.sha256()
+    for message in chat_history:
+        role = getattr(message.role, "value", message.role)
+        digest.update(f"{role}\x1f{normalize_text(str(message.content or ''))}\x1e".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def replay_tokens(text: str) -> List[str]:
+    """Split a cached answer into word-sized tokens that concatenate back to `text`."""
+    return _REPLAY_TOKEN.findall(text)
+
+
+@dataclass
+class CacheEntry:
+    entry_id: str
+    history_key: str
+    embedding: np.ndarray  # normalized float32
+    answer: str
+    created_at: float
+    last_access: float
+    latency: float  # seconds the original pipeline run took
+    sources: List[Dict[str, Any]] = field(default_factory=list)  # replayed ahead of the answer
+
+
+class ResponseCacheBackend:
+    """Persistence for cache entries. The cache itself keeps the working set in memory."""
+
+    def load(self) -> Iterable[CacheEntry]:
+        return []
+
+    def save(self, entry: CacheEntry) -> None:
+        pass
+
+    def touch(self, accesses: Sequence[Tuple[str, float]]) -> None:
+        """Record the last access time of entries, as (entry_id, last_access) pairs."""
+
+    def delete(self, entry_ids: Sequence[str]) -> None:
+        pass
+
+
+class MemoryCacheBackend(ResponseCacheBackend):
+    """In-process only; entries are lost on restart."""
+
+
+class DiskCacheBackend(ResponseCacheBackend):
+    """SQLite file on local disk so the cache survives restarts."""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " entry_id TEXT PRIMARY KEY, history_key TEXT, embedding BLOB, answer TEXT,"
+            " created_at REAL, last_access REAL, latency REAL, sources TEXT)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(responses)")}
+        if "sources" not in columns:  # a file written before sources were cached
+            self._conn.execute("ALTER TABLE responses ADD COLUMN sources TEXT")
+        self._conn.commit()
+
+    def load(self) -> Iterable[CacheEntry]:
+        rows = self._conn.execute(
+            "SELECT entry_id, history_key, embedding, answer, created_at, last_access, latency, sources"
+            " FROM responses ORDER BY last_access"
+        )
+        for entry_id, history_key, blob, answer, created_at, last_access, latency, sources in rows:
+            yield CacheEntry(
+                entry_id=entry_id,
+                history_key=history_key,
+                embedding=np.frombuffer(blob, dtype=np.float32),
+                answer=answer,
+                created_at=created_at,
+                last_access=last_access,
+                latency=latency,
+                sources=json.loads(sources) if sources else [],
+            )
+
+    def save(self, entry: CacheEntry) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses"
+            " (entry_id, history_key, embedding, answer, created_at, last_access, latency, sources)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                entry.entry_id,
+                entry.history_key,
+                entry.embedding.astype(np.float32).tobytes(),
+                entry.answer,
+                entry.created_at,
+                entry.last_access,
+                entry.latency,
+                json.dumps(entry.sources),
+            ),
+        )
+        self._conn.commit()
+
+    def touch(self, accesses: Sequence[Tuple[str, float]]) -> None:
+        if not accesses:
+            return
+        self._conn.executemany(
+            "UPDATE responses SET last_access = ? WHERE entry_id = ?",
+            [(last_access, entry_id) for entry_id, last_access in accesses],
+        )
+        self._conn.commit()
+
+    def delete(self, entry_ids: Sequence[str]) -> None:
+        if not entry_ids:
+            return
+        self._conn.executemany("DELETE FROM responses WHERE entry_id = ?", [(i,) for i in entry_ids])
+        self._conn.commit()
+
+
+class SemanticResponseCache:
+    """
+    Caches final answers keyed on (query embedding, history fingerprint).
+
+    A lookup hits when a cached entry with the same history fingerprint has a
+    cosine similarity >= `similarity_threshold` to the query and is younger than
+    `ttl_seconds`. Entries are evicted least-recently-used beyond `max_entries`.
+    Each entry keeps the sources its answer was based on, so a hit can send
+    them ahead of the replayed answer like the original turn did.
+
+    Access times of hits reach the backend in batches (every
+    ACCESS_FLUSH_SECONDS, and with the next write), so the LRU order survives a
+    restart; a crash loses at most the last few seconds of it.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[ResponseCacheBackend] = None,
+        similarity_threshold: float = 0.98,
+        ttl_seconds: float = 3600,
+        max_entries: int = 1000,
+    ):
+        self.backend = backend or MemoryCacheBackend()
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()  # LRU order, oldest first
+        self._buckets: Dict[str, Tuple[List[str], np.ndarray]] = {}  # history_key -> (ids, matrix)
+
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+
+        self._accessed: Dict[str, float] = {}  # entry_id -> last_access not yet written to the backend
+        self._accesses_flushed = time.time()
+
+        for entry in self.backend.load():
+            self._entries[entry.entry_id] = entry
+        self._evict(time.time())
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _bucket(self, history_key: str) -> Tuple[List[str], Optional[np.ndarray]]:
+        if history_key not in self._buckets:
+            ids = [i for i, e in self._entries.items() if e.history_key == history_key]
+            matrix = np.stack([self._entries[i].embedding for i in ids]) if ids else None
+            self._buckets[history_key] = (ids, matrix)
+        return self._buckets[history_key]
+
+    def _flush_accesses(self, now: float) -> None:
+        self._accesses_flushed = now
+        if self._accessed:
+            accesses, self._accessed = list(self._accessed.items()), {}
+            self.backend.touch(accesses)
+
+    def _remove(self, entry_ids: Sequence[str]) -> None:
+        for entry_id in entry_ids:
+            self._accessed.pop(entry_id, None)
+            entry = self._entries.pop(entry_id, None)
+            if entry is not None:
+                self._buckets.pop(entry.history_key, None)
+        self.backend.delete(entry_ids)
+
+    def _evict(self, now: float) -> None:
+        expired = [i for i, e in self._entries.items() if now - e.created_at > self.ttl_seconds]
+        overflow = max(0, len(self._entries) - len(expired) - self.max_entries)
+        expired_ids = set(expired)
+        lru = [i for i in self._entries if i not in expired_ids][:overflow]
+        if expired or lru:
+            self._remove(expired + lru)
+
+    def lookup(
+        self,
+        query_embedding: Sequence[float],
+        chat_history: Optional[Sequence[ChatMessage]] = None,
+    ) -> Optional[CacheEntry]:
+        """Return the best matching fresh entry, or None on a miss."""
+        history_key = history_fingerprint(chat_history)
+        query = self._normalize(query_embedding)
+        now = time.time()
+        with self._lock:
+            ids, matrix = self._bucket(history_key)
+            entry = None
+            if matrix is not None and matrix.shape[1] == query.shape[0]:
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    entry = self._entries[ids[best]]
+                    if now - entry.created_at > self.ttl_seconds:
+                        self._remove([entry.entry_id])
+                        entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            entry.last_access = now
+            self._entries.move_to_end(entry.entry_id)
+            self._accessed[entry.entry_id] = now
+            if now - self._accesses_flushed >= ACCESS_FLUSH_SECONDS:
+                self._flush_accesses(now)
+            self.hits += 1
+            self.latency_saved += entry.latency
+            return entry
+
+    def store(
+        self,
+        query_embedding: Sequence[float],
+        chat_history: Optional[Sequence[ChatMessage]],
+        answer: str,
+        latency: float,
+        sources: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        """Add a freshly generated answer to the cache."""
+        if not answer.strip():
+            return
+        now = time.time()
+        entry = CacheEntry(
+            entry_id=uuid.uuid4().hex,
+            history_key=history_fingerprint(chat_history),
+            embedding=self._normalize(query_embedding),
+            answer=answer,
+            created_at=now,
+            last_access=now,
+            latency=latency,
+            sources=list(sources or []),
+        )
+        with self._lock:
+            self._entries[entry.entry_id] = entry
+            self._buckets.pop(entry.history_key, None)
+            self.backend.save(entry)
+            self._flush_accesses(now)
+            self._evict(now)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "latency_saved_seconds": round(self.latency_saved, 3),
+        }
+
+
+def build_response_cache() -> Optional[SemanticResponseCache]:
+    """Create the response cache configured in settings, or None when disabled."""
+    if not settings.RESPONSE_CACHE_ENABLED:
+        return None
+
+    if settings.RESPONSE_CACHE_BACKEND == "disk":
+        backend = DiskCacheBackend(settings.RESPONSE_CACHE_PATH)
+    elif settings.RESPONSE_CACHE_BACKEND == "memory":
+        backend = MemoryCacheBackend()
+    else:
+        raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {settings.RESPONSE_CACHE_BACKEND}")
+
+    cache = SemanticResponseCache(
+        backend=backend,
+        similarity_threshold=settings.RESPONSE_CACHE_SIMILARITY_THRESHOLD,
+        ttl_seconds=settings.RESPONSE_CACHE_TTL_SECONDS,
+        max_entries=settings.RESPONSE_CACHE_MAX_ENTRIES,
+    )
+    logger.info(f"Response cache enabled ({settings.RESPONSE_CACHE_BACKEND}, {len(cache)} entries loaded)")
+    return cache
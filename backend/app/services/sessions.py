@@ -0,0 +1,362 @@
+import asyncio
+import contextvars
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Sequence, Set
+
+from llama_index.core.llms import LLM, ChatMessage, MessageRole
+from llama_index.core.memory import ChatMemoryBuffer
+from llama_index.core.utils import get_tokenizer
+
+from app.core.config import settings
+
+logger = logging.getLogger("app.services.sessions")
+
+SUMMARY_PROMPT = (
+    "You keep a running summary of a conversation between a user and 'The Modern Sage', "
+    "an assistant that answers from spiritual and modern psychology books.\n"
+    "Update the summary with the new messages. Keep the user's situation, goals and open "
+    "questions, the main ideas given and the books they came from. Use at most 200 words.\n\n"
+    "Summary so far:\n{summary}\n\n"
+    "New messages:\n{messages}\n\n"
+    "Updated summary:"
+)
+
+
+@dataclass
+class Session:
+    """
+    One conversation held on the server.
+
+    `token_counts[i]` is the token count of `messages[i]`, computed once when the
+    message is added. The first `summarized` messages are folded into `summary`
+    and no longer sent to the LLM.
+    """
+
+    session_id: str
+    messages: List[ChatMessage] = field(default_factory=list)
+    token_counts: List[int] = field(default_factory=list)
+    summary: str = ""
+    summary_tokens: int = 0
+    summarized: int = 0
+    created_at: float = field(default_factory=time.time)
+    last_access: float = field(default_factory=time.time)
+    # Serializes turns of the same conversation
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False, compare=False)
+    summarizing: bool = field(default=False, repr=False, compare=False)
+
+    def history(self, token_limit: int) -> List[ChatMessage]:
+        """
+        The history to send with the next turn: the summary (as a system message)
+        and the most recent messages that fit in `token_limit` with it, starting at
+        a user message. Walks back from the end, so the cost doesn't grow with the
+        length of the conversation.
+        """
+        budget = token_limit - self.summary_tokens
+        start, used = len(self.messages), 0
+        while start > self.summarized and used + self.token_counts[start - 1] <= budget:
+            start -= 1
+            used += self.token_counts[start]
+        while start < len(self.messages) and self.messages[start].role != MessageRole.USER:
+            start += 1
+        history = self.messages[start:]
+        if self.summary:
+            summary = ChatMessage(role=MessageRole.SYSTEM, content=f"Summary of the conversation so far:\n{self.summary}")
+            history = [summary, *history]
+        return history
+
+    def unsummarized_tokens(self) -> int:
+        return sum(self.token_counts[self.summarized:])
+
+
+class PretrimmedMemory(ChatMemoryBuffer):
+    """Chat memory for a history already fitted to the token limit (see `Session.history`).
+
+    ChatMemoryBuffer re-tokenizes the whole history on every read, once per
+    message it drops; this returns it as given.
+    """
+
+    def get(self, input: Optional[str] = None, initial_token_count: int = 0, **kwargs: Any) -> List[ChatMessage]:
+        return self.get_all()
+
+    async def aget(self, input: Optional[str] = None, initial_token_count: int = 0, **kwargs: Any) -> List[ChatMessage]:
+        return self.get_all()
+
+
+class SessionBackend:
+    """Persistence for sessions. The store keeps the active ones in memory."""
+
+    def load(self, session_id: str) -> Optional[Session]:
+        return None
+
+    def save(self, session: Session, new_messages: int = 0) -> None:
+        """Write the session's state and its last `new_messages` messages."""
+
+    def delete(self, session_ids: Sequence[str]) -> None:
+        pass
+
+    def expire(self, before: float) -> None:
+        """Drop sessions last used before `before` (epoch seconds)."""
+
+
+class MemorySessionBackend(SessionBackend):
+    """In-process only; sessions are lost on restart or when evicted from memory."""
+
+
+class DiskSessionBackend(SessionBackend):
+    """SQLite file on local disk; sessions survive restarts and eviction from memory."""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY, summary TEXT, summary_tokens INTEGER, summarized INTEGER,"
+            " created_at REAL, last_access REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS session_messages ("
+            " session_id TEXT, position INTEGER, role TEXT, content TEXT, tokens INTEGER,"
+            " PRIMARY KEY (session_id, position))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)")
+        self._conn.commit()
+
+    def load(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, summary_tokens, summarized, created_at, last_access FROM sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            messages = self._conn.execute(
+                "SELECT role, content, tokens FROM session_messages WHERE session_id = ? ORDER BY position",
+                (session_id,),
+            ).fetchall()
+        summary, summary_tokens, summarized, created_at, last_access = row
+        return Session(
+            session_id=session_id,
+            messages=[ChatMessage(role=MessageRole(role), content=content) for role, content, _ in messages],
+            token_counts=[tokens for _, _, tokens in messages],
+            summary=summary,
+            summary_tokens=summary_tokens,
+            summarized=summarized,
+            created_at=created_at,
+            last_access=last_access,
+        )
+
+    def save(self, session: Session, new_messages: int = 0) -> None:
+        first = len(session.messages) - new_messages
+        rows = [
+            (session.session_id, first + i, message.role.value, message.content or "", tokens)
+            for i, (message, tokens) in enumerate(zip(session.messages[first:], session.token_counts[first:]))
+        ]
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?)",
+                (session.session_id, session.summary, session.summary_tokens, session.summarized,
+                 session.created_at, session.last_access),
+            )
+            self._conn.executemany("INSERT OR REPLACE INTO session_messages VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def delete(self, session_ids: Sequence[str]) -> None:
+        if not session_ids:
+            return
+        params = [(i,) for i in session_ids]
+        with self._lock:
+            self._conn.executemany("DELETE FROM session_messages WHERE session_id = ?", params)
+            self._conn.executemany("DELETE FROM sessions WHERE session_id = ?", params)
+            self._conn.commit()
+
+    def expire(self, before: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM session_messages WHERE session_id IN (SELECT session_id FROM sessions WHERE last_access < ?)",
+                (before,),
+            )
+            self._conn.execute("DELETE FROM sessions WHERE last_access < ?", (before,))
+            self._conn.commit()
+
+
+class SessionStore:
+    """
+    Server-side conversation sessions, so clients send only their new message.
+
+    Active sessions are kept in memory, least-recently-used beyond `max_active`;
+    with the disk backend evicted sessions are reloaded on their next turn. A
+    session expires `ttl_seconds` after its last turn.
+
+    When a session's verbatim history exceeds `summary_trigger_tokens`, its older
+    messages are folded into a running summary by a background task, leaving the
+    last `summary_keep_tokens` verbatim. Turns never wait for it.
+    """
+
+    def __init__(
+        self,
+        backend: Optional[SessionBackend] = None,
+        ttl_seconds: float = 86400,
+        max_active: int = 10000,
+        summary_trigger_tokens: int = 3000,
+        summary_keep_tokens: int = 1000,
+    ):
+        self.backend = backend or MemorySessionBackend()
+        self.ttl_seconds = ttl_seconds
+        self.max_active = max_active
+        self.summary_trigger_tokens = summary_trigger_tokens
+        self.summary_keep_tokens = summary_keep_tokens
+
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()  # LRU order, oldest first
+        self._tokenizer = get_tokenizer()
+        self._tasks: Set[asyncio.Task] = set()
+
+        self.hits = 0
+        self.misses = 0
+        self.summaries = 0
+
+        self._last_sweep = 0.0
+        self._sweep(time.time())
+
+    def _sweep(self, now: float) -> None:
+        """Drop expired sessions, at most once a minute."""
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        with self._lock:
+            expired = [i for i, s in self._sessions.items() if now - s.last_access > self.ttl_seconds]
+            for session_id in expired:
+                del self._sessions[session_id]
+        self.backend.expire(now - self.ttl_seconds)
+
+    def _activate(self, session: Session) -> None:
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._sessions.move_to_end(session.session_id)
+            while len(self._sessions) > self.max_active:
+                self._sessions.popitem(last=False)
+
+    def create(self) -> Session:
+        session = Session(session_id=uuid.uuid4().hex)
+        self._sweep(session.created_at)
+        self.backend.save(session)
+        self._activate(session)
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """The session, or None when it doesn't exist or has expired."""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self.hits += 1
+        if session is None:
+            session = self.backend.load(session_id)
+            self.misses += 1
+        if session is None:
+            return None
+        if now - session.last_access > self.ttl_seconds:
+            self.delete(session_id)
+            return None
+        self._activate(session)
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            found = self._sessions.pop(session_id, None) is not None
+        found = found or self.backend.load(session_id) is not None
+        self.backend.delete([session_id])
+        return found
+
+    def append(self, session: Session, messages: Sequence[ChatMessage]) -> None:
+        """Add messages to the session, counting their tokens once."""
+        session.messages.extend(messages)
+        session.token_counts.extend(len(self._tokenizer(message.content or "")) for message in messages)
+        session.last_access = time.time()
+        self.backend.save(session, new_messages=len(messages))
+        self._activate(session)
+
+    def maybe_summarize(self, session: Session, llm: LLM) -> None:
+        """Start folding older messages into the summary if the verbatim history has grown too long."""
+        if session.summarizing or session.unsummarized_tokens() <= self.summary_trigger_tokens:
+            return
+        # Fold everything but the most recent `summary_keep_tokens`, ending before a user message
+        end, kept = len(session.messages), 0
+        while end > session.summarized and kept + session.token_counts[end - 1] <= self.summary_keep_tokens:
+            end -= 1
+            kept += session.token_counts[end]
+        while end < len(session.messages) and session.messages[end].role != MessageRole.USER:
+            end += 1
+        if end <= session.summarized:
+            return
+        session.summarizing = True
+        # A fresh context: the summary's LLM call is not part of the turn that triggered it.
+        # (create_task copies the current context; its `context=` argument needs Python 3.11.)
+        task = contextvars.Context().run(asyncio.get_running_loop().create_task, self._summarize(session, llm, end))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _summarize(self, session: Session, llm: LLM, end: int) -> None:
+        start = time.perf_counter()
+        try:
+            messages = "\n".join(
+                f"{message.role.value}: {message.content}" for message in session.messages[session.summarized:end]
+            )
+            response = await llm.acomplete(SUMMARY_PROMPT.format(summary=session.summary or "(none)", messages=messages))
+            summary = response.text.strip()
+            # Messages are only ever appended, so `end` still marks the same message
+            session.summary, session.summary_tokens = summary, len(self._tokenizer(summary))
+            session.summarized = end
+            self.summaries += 1
+            self.backend.save(session)
+            logger.debug(f"Summarized session {session.session_id} up to message {end} in {time.perf_counter() - start:.2f}s")
+        except Exception as e:
+            logger.warning(f"Summarizing session {session.session_id} failed: {e}")
+        finally:
+            session.summarizing = False
+
+    async def drain(self) -> None:
+        """Wait for summaries in progress (shutdown, benchmarks)."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> dict:
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses, "summaries": self.summaries}
+
+
+def build_session_store() -> Optional[SessionStore]:
+    """Create the session store configured in settings, or None when sessions are disabled."""
+    if not settings.SESSIONS_ENABLED:
+        return None
+
+    if settings.SESSION_BACKEND == "disk":
+        backend = DiskSessionBackend(settings.SESSION_STORE_PATH)
+    elif settings.SESSION_BACKEND == "memory":
+        backend = MemorySessionBackend()
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND: {settings.SESSION_BACKEND}")
+
+    store = SessionStore(
+        backend=backend,
+        ttl_seconds=settings.SESSION_TTL_SECONDS,
+        max_active=settings.SESSION_MAX_ACTIVE,
+        summary_trigger_tokens=settings.SESSION_SUMMARY_TRIGGER_TOKENS,
+        summary_keep_tokens=settings.SESSION_SUMMARY_KEEP_TOKENS,
+    )
+    logger.info(f"Sessions enabled ({settings.SESSION_BACKEND})")
+    return store
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger("app.services.single_flight")
+
+
+class _Call:
+    """One shared execution and the number of callers awaiting it."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls with the same key: the first caller starts the
+    call, callers arriving while it runs await the same result (or error). Once
+    it finishes the key is forgotten, so this never serves stale results.
+
+    The call runs in its own task, so one caller giving up (a client disconnect)
+    doesn't fail the others; it is cancelled only when every caller has left.
+    Disabled (SINGLE_FLIGHT_ENABLED=false), every call runs on its own.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._calls: Dict[Hashable, _Call] = {}
+        self.hits = 0  # callers that joined a call already in flight
+        self.misses = 0  # calls started
+
+    def stats(self) -> dict:
+        return {"entries": len(self._calls), "hits": self.hits, "misses": self.misses}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.enabled:
+            return await fn()
+        call = self._calls.get(key)
+        if call is None:
+            self.misses += 1
+            call = self._calls[key] = _Call(asyncio.ensure_future(fn()))
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+        else:
+            self.hits += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+
+    def _forget(self, key: Hashable, call: Any) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+
+class _Broadcast:
+    """One shared run of a token stream: the tokens so far, fanned out to every subscriber."""
+
+    def __init__(self):
+        self.tokens: List[str] = []
+        self.sources: Optional[List[Dict[str, Any]]] = None
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    def _notify(self) -> None:
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    def publish_sources(self, sources: List[Dict[str, Any]]) -> None:
+        self.sources = sources
+        self._notify()
+
+    async def produce(self, tokens: AsyncIterator[str]) -> None:
+        try:
+            async for token in tokens:
+                self.tokens.append(token)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    async def subscribe(self, on_sources: Optional[Callable[[List[Dict[str, Any]]], None]]) -> AsyncIterator[str]:
+        """Every token from the first, as it arrives; late subscribers catch up from the buffer."""
+        sent = 0
+        sources_sent = False
+        while True:
+            wakeup = self._wakeup
+            if not sources_sent and self.sources is not None:
+                sources_sent = True
+                if on_sources is not None:
+                    on_sources(self.sources)
+            while sent < len(self.tokens):
+                sent += 1
+                yield self.tokens[sent - 1]
+            if self.done:
+                break
+            await wakeup.wait()
+        if self.error is not None:
+            raise self.error
+
+
+class StreamingSingleFlight:
+    """
+    SingleFlight for token streams. Concurrent requests with the same key share
+    one run of the stream: the first starts it, and everyone subscribed while it
+    runs receives every token (late joiners replay the buffer first) and the
+    sources it publishes. The run is cancelled once its last subscriber leaves.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Broadcast] = {}
+        self.hits = 0  # streams served from a run already in flight
+        self.misses = 0  # runs started
+
+    def stats(self) -> dict:
+        return {"entries": len(self._flights), "hits": self.hits, "misses": self.misses}
+
+    async def stream(
+        self,
+        key: Hashable,
+        start: Callable[[Callable[[List[Dict[str, Any]]], None]], AsyncIterator[str]],
+        on_sources: Optional[Callable[[List[Dict[str, Any]]], None]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Tokens of the run for `key`. `start(publish_sources)` is called only when
+        no run is in flight and returns the token stream to share; it reports the
+        retrieved sources through `publish_sources`.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            self.misses += 1
+            flight = self._flights[key] = _Broadcast()
+            flight.task = asyncio.ensure_future(flight.produce(start(flight.publish_sources)))
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            self.hits += 1
+            logger.debug(f"Joined an in-flight run ({flight.subscribers} subscribers)")
+        flight.subscribers += 1
+        try:
+            async for token in flight.subscribe(on_sources):
+                yield token
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.task.done():
+                flight.task.cancel()
+                await asyncio.wait({flight.task})
+
+    def _forget(self, key: Hashable, flight: _Broadcast) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
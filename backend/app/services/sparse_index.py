@@ -0,0 +1,302 @@
+import json
+import logging
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import BaseNode, MetadataMode, NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.utils import metadata_dict_to_node, node_to_metadata_dict
+
+from app.core.config import settings
+from app.services.local_vector_store import _top_k
+from app.services.perspectives import source_perspective
+from app.services.query_expansion import STOPWORDS
+
+logger = logging.getLogger("app.services.sparse_index")
+
+INDEX_VERSION = 1
+
+# Letters and digits, keeping inner apostrophes and hyphens ("self-control", "don't");
+# "1% better" -> ["1", "better"], "Quadrant II" -> ["quadrant", "ii"]
+_TERM = re.compile(r"[a-z0-9]+(?:['-][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word terms without stopwords or possessive 's; the same for chunks and queries."""
+    terms = _TERM.findall(text.lower().replace("\u2019", "'"))
+    return [term[:-2] if term.endswith("'s") else term for term in terms if term not in STOPWORDS]
+
+
+class SparseIndex:
+    """
+    BM25 inverted index over chunk text, memory-mapped at startup.
+
+    Layout of `persist_dir`:
+        docs.jsonl    log of chunk records (node id + node metadata) and delete
+                      records, like LocalVectorStore's rows.jsonl
+        meta.json     {"version", "k1", "b", "docs", "avg_length", "log_size"}
+        terms.json    sorted vocabulary; a term's position is its ID
+        offsets.i64   postings of term t are entries offsets[t]:offsets[t + 1]
+        postings.i32  document rows, ascending within a term
+        weights.f32   BM25 weight of each posting:
+                      idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length))
+
+    Term weights, including the document length normalization, are computed
+    when the index is built, so a query is a few array slices and one
+    `np.bincount` over their postings. Writes append to the log; compact()
+    rewrites it without deleted chunks and rebuilds the arrays. An index whose
+    log changed since the last compaction is rebuilt in memory on load.
+    """
+
+    def __init__(self, persist_dir: str, k1: float = 1.2, b: float = 0.75):
+        self.persist_dir = persist_dir
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._ids: List[str] = []
+        self._records: List[dict] = []
+        self._term_ids: Dict[str, int] = {}
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._postings = np.zeros(0, dtype=np.int32)
+        self._weights = np.zeros(0, dtype=np.float32)
+        self._partition_masks: Dict[str, np.ndarray] = {}
+        os.makedirs(persist_dir, exist_ok=True)
+        self._load()
+
+    @classmethod
+    def from_settings(cls) -> "SparseIndex":
+        index = cls(persist_dir=settings.SPARSE_INDEX_DIR.format(index_name=settings.INDEX_NAME))
+        logger.info(f"Sparse index at '{index.persist_dir}' ({len(index)} chunks, {len(index._term_ids)} terms)")
+        return index
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._ids), "terms": len(self._term_ids), "postings": len(self._postings)}
+
+    # Persistence
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.persist_dir, name)
+
+    def _read_log(self) -> Tuple[List[str], List[dict]]:
+        """Live (ids, records) in insertion order after replaying the log."""
+        records: Dict[str, dict] = {}
+        path = self._path("docs.jsonl")
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # partially written tail from a crashed writer
+                    for node_id in entry.get("delete", []):
+                        records.pop(node_id, None)
+                    if "id" in entry:
+                        records.pop(entry["id"], None)  # a re-added chunk moves to the end
+                        records[entry["id"]] = entry["node"]
+        return list(records), list(records.values())
+
+    def _log_size(self) -> int:
+        path = self._path("docs.jsonl")
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _load(self) -> None:
+        self._ids, self._records = self._read_log()
+        self._partition_masks = {}
+        meta_path = self._path("meta.json")
+        meta = None
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+        if (meta is None or meta.get("version") != INDEX_VERSION or meta["log_size"] != self._log_size()
+                or meta["k1"] != self.k1 or meta["b"] != self.b):
+            if self._ids:
+                logger.warning(f"Sparse index at '{self.persist_dir}' is not compacted; building it in memory")
+            self._build()
+            return
+        with open(self._path("terms.json")) as f:
+            self._term_ids = {term: i for i, term in enumerate(json.load(f))}
+        self._offsets = np.memmap(self._path("offsets.i64"), dtype=np.int64, mode="r")
+        postings = int(self._offsets[-1])
+        self._postings = (np.memmap(self._path("postings.i32"), dtype=np.int32, mode="r")
+                          if postings else np.zeros(0, dtype=np.int32))
+        self._weights = (np.memmap(self._path("weights.f32"), dtype=np.float32, mode="r")
+                         if postings else np.zeros(0, dtype=np.float32))
+
+    def _build(self) -> Dict[str, Any]:
+        """Build the in-memory arrays from the live records; returns the meta to persist."""
+        term_ids: Dict[str, int] = {}
+        doc_terms, lengths = [], []
+        for record in self._records:
+            counts = Counter(tokenize(metadata_dict_to_node(record).get_content(metadata_mode=MetadataMode.NONE)))
+            doc_terms.append(counts)
+            lengths.append(sum(counts.values()))
+            for term in counts:
+                term_ids.setdefault(term, len(term_ids))
+
+        vocabulary = sorted(term_ids)
+        term_ids = {term: i for i, term in enumerate(vocabulary)}
+        num_docs = len(doc_terms)
+        avg_length = (sum(lengths) / num_docs) if num_docs else 0.0
+
+        # Postings sorted by (term, row): gather (term, row, tf), then one stable sort by term
+        terms, rows, tfs = [], [], []
+        for row, counts in enumerate(doc_terms):
+            for term, tf in counts.items():
+                terms.append(term_ids[term])
+                rows.append(row)
+                tfs.append(tf)
+        terms = np.asarray(terms, dtype=np.int64)
+        order = np.argsort(terms, kind="stable")
+        terms = terms[order]
+        postings = np.asarray(rows, dtype=np.int32)[order]
+        tf = np.asarray(tfs, dtype=np.float64)[order]
+        offsets = np.searchsorted(terms, np.arange(len(vocabulary) + 1)).astype(np.int64)
+
+        # BM25 with the non-negative idf variant (Lucene's): log(1 + (N - df + 0.5) / (df + 0.5))
+        df = np.diff(offsets).astype(np.float64)
+        idf = np.log1p((num_docs - df + 0.5) / (df + 0.5))
+        length = np.asarray(lengths, dtype=np.float64)[postings] if len(postings) else np.zeros(0)
+        norm = self.k1 * (1 - self.b + self.b * length / (avg_length or 1.0))
+        weights = (np.repeat(idf, np.diff(offsets)) * tf * (self.k1 + 1) / (tf + norm)).astype(np.float32)
+
+        self._term_ids, self._offsets, self._postings, self._weights = term_ids, offsets, postings, weights
+        return {"version": INDEX_VERSION, "k1": self.k1, "b": self.b, "docs": num_docs,
+                "avg_length": avg_length, "vocabulary": vocabulary}
+
+    def compact(self) -> None:
+        """Rewrite the log without deleted chunks and persist freshly built arrays."""
+        with self._lock:
+            self._ids, self._records = self._read_log()
+            with open(self._path("docs.jsonl.tmp"), "w") as f:
+                f.write("".join(json.dumps({"id": node_id, "node": record}) + "\n"
+                                for node_id, record in zip(self._ids, self._records)))
+            os.replace(self._path("docs.jsonl.tmp"), self._path("docs.jsonl"))
+
+            meta = self._build()
+            for name, array in (("offsets.i64", self._offsets), ("postings.i32", self._postings),
+                                ("weights.f32", self._weights)):
+                with open(self._path(f"{name}.tmp"), "wb") as f:
+                    f.write(np.ascontiguousarray(array).tobytes())
+                os.replace(self._path(f"{name}.tmp"), self._path(name))
+            with open(self._path("terms.json.tmp"), "w") as f:
+                json.dump(meta.pop("vocabulary"), f)
+            os.replace(self._path("terms.json.tmp"), self._path("terms.json"))
+            # Written last: it marks the arrays as matching the log
+            meta["log_size"] = self._log_size()
+            with open(self._path("meta.json.tmp"), "w") as f:
+                json.dump(meta, f)
+            os.replace(self._path("meta.json.tmp"), self._path("meta.json"))
+            self._load()
+        logger.info(f"Sparse index compacted: {len(self._ids)} chunks, {len(self._term_ids)} terms, "
+                    f"{len(self._postings)} postings")
+
+    # Writes (take effect at the next compact())
+
+    def _append_log(self, entries: List[dict]) -> None:
+        with open(self._path("docs.jsonl"), "a") as f:
+            f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+
+    def add(self, nodes: Sequence[BaseNode]) -> List[str]:
+        entries = [{"id": node.node_id, "node": node_to_metadata_dict(node, remove_text=False, flat_metadata=False)}
+                   for node in nodes]
+        if entries:
+            with self._lock:
+                self._append_log(entries)
+        return [node.node_id for node in nodes]
+
+    def delete_nodes(self, node_ids: Sequence[str]) -> None:
+        if node_ids:
+            with self._lock:
+                self._append_log([{"delete": list(node_ids)}])
+
+    def clear(self) -> None:
+        with self._lock:
+            for name in ("docs.jsonl", "meta.json", "terms.json", "offsets.i64", "postings.i32", "weights.f32"):
+                if os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+            self._ids, self._records = [], []
+            self._partition_masks = {}
+            self._build()
+
+    # Reads
+
+    def _partition_mask(self, perspective: str) -> np.ndarray:
+        """Boolean row mask of one perspective's chunks (see perspectives.py)."""
+        mask = self._partition_masks.get(perspective)
+        if mask is None:
+            mask = np.array([source_perspective(record) == perspective for record in self._records], dtype=bool)
+            self._partition_masks[perspective] = mask
+        return mask
+
+    def search(self, query: str, top_k: int, perspective: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (rows, BM25 scores) of the top_k chunks sharing a term with the query,
+        best first; only chunks of `perspective` when given.
+        """
+        term_ids = [self._term_ids[term] for term in dict.fromkeys(tokenize(query)) if term in self._term_ids]
+        if not term_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        offsets = self._offsets
+        if len(term_ids) == 1:
+            start, end = offsets[term_ids[0]], offsets[term_ids[0] + 1]
+            matched, scores = self._postings[start:end], self._weights[start:end]
+        else:
+            rows = np.concatenate([self._postings[offsets[t]:offsets[t + 1]] for t in term_ids])
+            weights = np.concatenate([self._weights[offsets[t]:offsets[t + 1]] for t in term_ids])
+            # Matching rows only: no pass over the whole corpus
+            matched, inverse = np.unique(rows, return_inverse=True)
+            scores = np.bincount(inverse, weights=weights).astype(np.float32)
+        if perspective is not None:
+            keep = self._partition_mask(perspective)[matched]
+            matched, scores = matched[keep], scores[keep]
+        best = _top_k(scores, top_k)
+        return matched[best].astype(np.int64), scores[best]
+
+    def node(self, row: int) -> BaseNode:
+        return metadata_dict_to_node(self._records[row])
+
+    def query(self, query: str, top_k: int, perspective: Optional[str] = None) -> List[NodeWithScore]:
+        rows, scores = self.search(query, top_k, perspective)
+        return [NodeWithScore(node=self.node(row), score=float(score)) for row, score in zip(rows, scores)]
+
+
+class SparseRetriever(BaseRetriever):
+    """BM25 retriever over a SparseIndex; a second retriever next to the vector retriever in the fusion."""
+
+    def __init__(self, index: SparseIndex, similarity_top_k: int = 15,
+                 callback_manager: Optional[CallbackManager] = None):
+        super().__init__(callback_manager=callback_manager)
+        self.index = index
+        self.similarity_top_k = similarity_top_k
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return self.index.query(query_bundle.query_str, self.similarity_top_k)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        # Microseconds per lookup; not worth a thread hop
+        return self._retrieve(query_bundle)
+
+
+def build_sparse_retriever(top_k: Optional[int] = None) -> Optional[SparseRetriever]:
+    """
+    The BM25 retriever for RETRIEVAL_MODE=hybrid, or None for "dense" or when no
+    sparse index has been built yet (scripts/ingest.py builds it).
+    """
+    mode = settings.RETRIEVAL_MODE
+    if mode == "dense":
+        return None
+    if mode != "hybrid":
+        raise ValueError(f"Unknown RETRIEVAL_MODE: {mode}")
+    index = SparseIndex.from_settings()
+    if not len(index):
+        logger.warning("RETRIEVAL_MODE=hybrid but the sparse index is empty; run scripts/ingest.py. Using dense retrieval.")
+        return None
+    return SparseRetriever(index, similarity_top_k=top_k or settings.SPARSE_TOP_K)
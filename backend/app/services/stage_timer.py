@@ -0,0 +1,100 @@
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.core.metrics import CONTEXT_CHUNKS_DROPPED, CONTEXT_TOKENS, LLM_TOKENS, STAGE_SECONDS
+
+# Timings and LLM token counts of the chat turn running in the current task.
+# Tasks spawned with asyncio.gather copy the context, so they record into the same dicts.
+_current: ContextVar[Optional[Dict[str, float]]] = ContextVar("stage_timings", default=None)
+_tokens: ContextVar[Optional[Dict[str, int]]] = ContextVar("turn_tokens", default=None)
+
+
+def start_turn() -> Dict[str, float]:
+    """Begin recording stage timings (and token counts, see `turn_tokens`) for a new chat turn in this task."""
+    timings: Dict[str, float] = {}
+    _current.set(timings)
+    _tokens.set({"prompt": 0, "completion": 0, "llm_calls": 0})
+    return timings
+
+
+def turn_tokens() -> Optional[Dict[str, int]]:
+    """Prompt/completion tokens and LLM calls of the current turn, plus context_candidate/context_packed
+    when retrieved context was packed (None outside a turn)."""
+    return _tokens.get()
+
+
+def record(stage: str, seconds: float) -> None:
+    """Add `seconds` to `stage` for the current turn and to the stage latency histogram."""
+    timings = _current.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+    if settings.METRICS_ENABLED:
+        STAGE_SECONDS.observe(seconds, stage)
+
+
+def record_llm_call() -> None:
+    """Count one LLM request towards the current turn (counted when it starts, so abandoned streams count too)."""
+    tokens = _tokens.get()
+    if tokens is not None:
+        tokens["llm_calls"] += 1
+
+
+def record_tokens(prompt: int, completion: int) -> None:
+    """Count the tokens of one LLM call towards the current turn and the token counters."""
+    tokens = _tokens.get()
+    if tokens is not None:
+        tokens["prompt"] += prompt
+        tokens["completion"] += completion
+    if settings.METRICS_ENABLED:
+        LLM_TOKENS.inc(prompt, "prompt")
+        LLM_TOKENS.inc(completion, "completion")
+
+
+def record_context(candidate_tokens: int, packed_tokens: int, duplicates: int, over_budget: int) -> None:
+    """Record how much retrieved context the turn's prompt kept (see context_packer.py)."""
+    tokens = _tokens.get()
+    if tokens is not None:
+        tokens["context_candidate"] = tokens.get("context_candidate", 0) + candidate_tokens
+        tokens["context_packed"] = tokens.get("context_packed", 0) + packed_tokens
+    if settings.METRICS_ENABLED:
+        CONTEXT_TOKENS.inc(candidate_tokens, "candidate")
+        CONTEXT_TOKENS.inc(packed_tokens, "packed")
+        CONTEXT_CHUNKS_DROPPED.inc(duplicates, "duplicate")
+        CONTEXT_CHUNKS_DROPPED.inc(over_budget, "over_budget")
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+class StageStats:
+    """Running count / total / max seconds per stage across turns."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def observe(self, timings: Dict[str, float]) -> None:
+        with self._lock:
+            for name, seconds in timings.items():
+                entry = self._stats.setdefault(name, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+                entry["count"] += 1
+                entry["total_seconds"] += seconds
+                entry["max_seconds"] = max(entry["max_seconds"], seconds)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                name: {**entry, "mean_seconds": entry["total_seconds"] / entry["count"]}
+                for name, entry in self._stats.items()
+            }
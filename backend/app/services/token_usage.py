@@ -0,0 +1,75 @@
+from typing import Any
+
+from llama_index.core.callbacks.token_counting import get_tokens_from_response
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events import BaseEvent
+from llama_index.core.instrumentation.events.llm import (
+    LLMChatEndEvent,
+    LLMChatStartEvent,
+    LLMCompletionEndEvent,
+    LLMCompletionStartEvent,
+)
+from llama_index.core.utilities.token_counting import TokenCounter
+
+from app.core.config import settings
+from app.services import stage_timer
+
+
+class TokenUsageHandler(BaseEventHandler):
+    """
+    Counts every LLM call and its prompt and completion tokens (see stage_timer.record_tokens),
+    for the metrics and for settling the turn's admission control reservation.
+
+    Uses the usage reported by the provider; OpenAI streams only report it with
+    ``stream_options={"include_usage": True}``, otherwise the text is tokenized locally.
+    """
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "TokenUsageHandler"
+
+    def handle(self, event: BaseEvent, **kwargs: Any) -> None:
+        if not settings.METRICS_ENABLED and not settings.ADMISSION_CONTROL_ENABLED:
+            return
+        if isinstance(event, (LLMChatStartEvent, LLMCompletionStartEvent)):
+            stage_timer.record_llm_call()
+            return
+        if isinstance(event, LLMChatEndEvent):
+            prompt, completion = self._counts(event.response)
+            if event.response is not None:
+                if not prompt:
+                    prompt = _counter.estimate_tokens_in_messages(event.messages)
+                if not completion:
+                    completion = _counter.get_string_tokens(event.response.message.content or "")
+        elif isinstance(event, LLMCompletionEndEvent):
+            prompt, completion = self._counts(event.response)
+            if not prompt:
+                prompt = _counter.get_string_tokens(event.prompt)
+            if not completion:
+                completion = _counter.get_string_tokens(event.response.text or "")
+        else:
+            return
+        stage_timer.record_tokens(prompt, completion)
+
+    @staticmethod
+    def _counts(response) -> tuple:
+        if response is None:
+            return 0, 0
+        try:
+            return get_tokens_from_response(response)
+        except Exception:
+            return 0, 0
+
+
+_counter = TokenCounter()
+_handler = None
+
+
+def install_token_usage_handler() -> TokenUsageHandler:
+    """Attach the handler to the root instrumentation dispatcher (once per process)."""
+    global _handler
+    if _handler is None:
+        _handler = TokenUsageHandler()
+        get_dispatcher().add_event_handler(_handler)
+    return _handler
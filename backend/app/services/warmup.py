@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Optional
+
+from app.core.exceptions import ServiceOverloadedError
+
+logger = logging.getLogger("app.services.warmup")
+
+
+def build_chat_service():
+    """The production chat service. Imported here so llama_index, Pinecone and
+    Cohere load in the warm-up thread, not on the app's import path."""
+    from app.services.rag_engine import get_chat_service
+
+    return get_chat_service()
+
+
+class Readiness:
+    """
+    Builds and warms the chat service in the background; backs GET /health/ready.
+
+    status: "starting" -> "warming" -> "ready", or "failed" (retried by the next
+    request that needs the service).
+    """
+
+    def __init__(self, factory: Callable[[], object] = build_chat_service):
+        self.factory = factory
+        self.status = "starting"
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+        self.service = None
+        self._task: Optional[asyncio.Task] = None
+        self._started_at = time.perf_counter()
+
+    def start(self) -> asyncio.Task:
+        if self._task is None or (self._task.done() and self.service is None):
+            self._task = asyncio.create_task(self._warm_up())
+        return self._task
+
+    async def _warm_up(self):
+        self.status, self.error = "warming", None
+        start = time.perf_counter()
+        try:
+            # Imports and client construction are blocking; keep the loop free for /health/live
+            service = await asyncio.to_thread(self.factory)
+            built = time.perf_counter()
+            await service.warm_up()
+        except Exception as e:
+            self.status, self.error = "failed", str(e)
+            logger.error(f"Chat service warm-up failed: {e}", exc_info=True)
+            return
+        done = time.perf_counter()
+        self.timings = {
+            "build_seconds": round(built - start, 3),
+            "warm_up_seconds": round(done - built, 3),
+            "time_to_ready_seconds": round(done - self._started_at, 3),
+        }
+        self.service, self.status = service, "ready"
+        logger.info(f"Chat service ready: {self.timings}")
+
+    async def wait(self):
+        """The warmed service, waiting for (or starting) the warm-up if necessary."""
+        if self.service is None:
+            await asyncio.shield(self.start())
+        if self.service is None:
+            raise ServiceOverloadedError(f"Service is starting up ({self.error}). Please retry shortly.", retry_after=5)
+        return self.service
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def report(self) -> dict:
+        report = {"status": self.status, **self.timings}
+        if self.error:
+            report["error"] = self.error
+        return report
+
+
+readiness = Readiness()
+
+
+async def get_ready_chat_service():
+    """FastAPI dependency: the chat service once warmed up (see `Readiness`)."""
+    return await readiness.wait()
@@ -0,0 +1,133 @@
+"""
+Chat turns under sustained overload against rate-limited upstreams, with and
+without admission control (ADMISSION_CONTROL_ENABLED).
+
+The stub LLM, embedding model, vector store and reranker each enforce a
+per-minute request limit with `--burst-seconds` of headroom. Over the limit a
+call is retried with exponential backoff like the SDKs, then fails with a 429.
+Questions arrive open loop at `--rate` per second for `--duration` seconds,
+more than the upstreams can serve at full service, and run through the real
+ChatService (LLM query expansion, partitioned retrieval, reranking). The
+admission budgets are set to the stubs' limits.
+
+Reported per mode:
+    ok / 429 / 503 / 500   turns answered, shed, timed out in the queue, failed
+    full / no_exp / no_rr  answered turns per service level
+    upstream 429s          upstream calls that failed after their retries
+    ok p50 / p99           latency of answered turns
+    resp p99               time to any response, answer or error
+
+Usage (from backend/):
+    python benchmarks/admission_control.py --rate 12 --duration 30
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from collections import Counter
+from contextlib import redirect_stdout
+from io import StringIO
+
+# Add the project root to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Settings requires provider keys; the stubs never use them.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from app.core.config import settings
+from app.core.exceptions import ServiceOverloadedError
+from app.services.rag_engine import ChatService
+from benchmarks.chat_load import percentile
+from benchmarks.stubs import StubEmbedding, StubLLM, StubRateLimiter, StubReranker, StubVectorStore, fake_corpus
+
+
+def build_service(args):
+    limiters = {
+        "llm": StubRateLimiter("openai", args.llm_rpm, burst_seconds=args.burst_seconds),
+        "embedding": StubRateLimiter("openai", args.embed_rpm, burst_seconds=args.burst_seconds),
+        "search": StubRateLimiter("pinecone", args.search_rpm, burst_seconds=args.burst_seconds),
+        "rerank": StubRateLimiter("cohere", args.rerank_rpm, burst_seconds=args.burst_seconds),
+    }
+    llm = StubLLM(first_token_latency=0.3, token_latency=0.01, query_gen_latency=0.5, limiter=limiters["llm"])
+    embed_model = StubEmbedding(latency=0.05, limiter=limiters["embedding"])
+    vector_store = StubVectorStore(latency=0.08, nodes=fake_corpus(2000), limiter=limiters["search"])
+    reranker = StubReranker(latency=0.15, limiter=limiters["rerank"])
+    return ChatService.from_components(llm, embed_model, vector_store, reranker=reranker), limiters
+
+
+async def run_load(service, rate, duration):
+    results = []
+
+    async def turn(i):
+        start = time.perf_counter()
+        breakdown = {}
+        try:
+            async for _ in service.astream_chat(f"Question {i}: how do I stay disciplined under pressure?",
+                                                breakdown=breakdown):
+                pass
+            outcome = breakdown.get("admission", "full")
+        except ServiceOverloadedError as e:
+            outcome = str(e.status_code)
+        except Exception:
+            outcome = "500"
+        results.append((outcome, time.perf_counter() - start))
+
+    start = time.perf_counter()
+    tasks = []
+    for i in range(int(rate * duration)):
+        await asyncio.sleep(max(0.0, start + i / rate - time.perf_counter()))
+        tasks.append(asyncio.create_task(turn(i)))
+    await asyncio.gather(*tasks)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=12.0, help="Questions per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of arrivals")
+    parser.add_argument("--llm-rpm", type=int, default=600)
+    parser.add_argument("--embed-rpm", type=int, default=3000)
+    parser.add_argument("--search-rpm", type=int, default=6000)
+    parser.add_argument("--rerank-rpm", type=int, default=1200)
+    parser.add_argument("--burst-seconds", type=float, default=2.0)
+    parser.add_argument("--queue-timeout", type=float, default=5.0, help="CHAT_QUEUE_TIMEOUT")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    settings.RESPONSE_CACHE_ENABLED = False
+    settings.QUERY_ROUTER_ENABLED = False
+    settings.QUERY_EXPANSION_MODE = "llm"  # every turn's query generation reaches the LLM
+    settings.CHAT_QUEUE_TIMEOUT = args.queue_timeout
+    settings.OPENAI_REQUESTS_PER_MINUTE = args.llm_rpm
+    settings.OPENAI_TOKENS_PER_MINUTE = 0
+    settings.EMBEDDING_REQUESTS_PER_MINUTE = args.embed_rpm
+    settings.PINECONE_REQUESTS_PER_MINUTE = args.search_rpm
+    settings.COHERE_REQUESTS_PER_MINUTE = args.rerank_rpm
+    settings.ADMISSION_BURST_SECONDS = args.burst_seconds
+    default_depth = settings.CHAT_QUEUE_MAX_DEPTH
+
+    print(f"{args.rate:.0f} questions/s for {args.duration:.0f}s; limits per minute: LLM {args.llm_rpm}, "
+          f"embedding {args.embed_rpm}, search {args.search_rpm}, rerank {args.rerank_rpm}")
+    print(f"{'admission':<10} {'ok':>5} {'429':>5} {'503':>5} {'500':>5} {'full':>5} {'no_exp':>6} {'no_rr':>5} "
+          f"{'upstream 429s':>13} {'ok p50':>7} {'ok p99':>7} {'resp p99':>8}")
+    for enabled in (False, True):
+        settings.ADMISSION_CONTROL_ENABLED = enabled
+        # Off: no queue bound either, like the service before admission control
+        settings.CHAT_QUEUE_MAX_DEPTH = default_depth if enabled else 0
+        service, limiters = build_service(args)
+        with redirect_stdout(StringIO()):  # the fusion retriever prints its generated queries
+            results = asyncio.run(run_load(service, args.rate, args.duration))
+        outcomes = Counter(outcome for outcome, _ in results)
+        answered = [seconds for outcome, seconds in results if not outcome.isdigit()]
+        print(f"{'on' if enabled else 'off':<10} {len(answered):>5} {outcomes['429']:>5} {outcomes['503']:>5} "
+              f"{outcomes['500']:>5} {outcomes['full']:>5} {outcomes['no_expansion']:>6} {outcomes['no_rerank']:>5} "
+              f"{sum(limiter.rejected for limiter in limiters.values()):>13} "
+              f"{percentile(answered, 50):>6.2f}s {percentile(answered, 99):>6.2f}s "
+              f"{percentile([seconds for _, seconds in results], 99):>7.2f}s")
+
+
+if __name__ == "__main__":
+    main()
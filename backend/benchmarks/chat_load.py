@@ -0,0 +1,151 @@
+
+"""
+Load benchmark for POST /api/v1/chat against stubbed LLM / vector / rerank backends.
+
+Runs the real FastAPI app under uvicorn on a local port and sweeps the number of
+concurrent chat sessions, reporting p50/p99 time-to-first-token (TTFT) and total
+turn latency per level. `--history N` starts every conversation N question/answer
+pairs deep.
+
+Usage (from backend/):
+    python benchmarks/chat_load.py --concurrency 1 8 32 128 --turns 3
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+# Add the project root to sys.path to allow imports from app
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Settings requires provider keys; the stubs never use them.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("PINECONE_API_KEY", "pc-benchmark")
+
+import httpx
+import uvicorn
+
+from app.core.config import settings
+from app.main import app
+from app.services.warmup import readiness
+from benchmarks.stubs import build_stub_service
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return float("nan")
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def start_server():
+    """Serve the app on an ephemeral port in a background thread."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+
+    config = uvicorn.Config(app, log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+def seed_history(session_id, turns, words=60):
+    """`turns` earlier question/answer pairs to start a conversation with."""
+    filler = " ".join(f"habit {i % 9} duty {i % 7}" for i in range(words // 4))
+    messages = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"Session {session_id}, earlier question {turn}: {filler}?"})
+        messages.append({"role": "assistant", "content": filler})
+    return messages
+
+
+async def run_session(client, url, session_id, turns, ttfts, totals, errors, history=0):
+    messages = seed_history(session_id, history)
+    for turn in range(turns):
+        # Unique per session so the response cache does not short-circuit the pipeline
+        messages.append({"role": "user", "content": f"Session {session_id}: how do I build better habits? (turn {turn})"})
+        start = time.perf_counter()
+        first = None
+        answer = []
+        try:
+            async with client.stream("POST", url, json={"messages": messages}) as response:
+                if response.status_code != 200:
+                    errors.append(response.status_code)
+                    return
+                async for line in response.aiter_lines():
+                    if first is None and line.startswith("0:"):  # after the sources frame
+                        first = time.perf_counter() - start
+                    answer.append(line)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            return
+        ttfts.append(first if first is not None else time.perf_counter() - start)
+        totals.append(time.perf_counter() - start)
+        messages.append({"role": "assistant", "content": "".join(answer)})
+
+
+async def run_level(base_url, concurrency, turns, history=0):
+    ttfts, totals, errors = [], [], []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        url = f"{base_url}/api/v1/chat"
+        start = time.perf_counter()
+        await asyncio.gather(*(run_session(client, url, i, turns, ttfts, totals, errors, history) for i in range(concurrency)))
+        wall = time.perf_counter() - start
+    return {
+        "concurrency": concurrency,
+        "turns": len(totals),
+        "errors": len(errors),
+        "ttft_p50": percentile(ttfts, 50),
+        "ttft_p99": percentile(ttfts, 99),
+        "total_p50": percentile(totals, 50),
+        "total_p99": percentile(totals, 99),
+        "throughput": len(totals) / wall if wall else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--turns", type=int, default=3, help="Sequential turns per session")
+    parser.add_argument("--history", type=int, default=0, help="Earlier turns each conversation starts with")
+    parser.add_argument("--nodes", type=int, default=2000, help="Size of the stub corpus")
+    args = parser.parse_args()
+
+    # Keep per-request logs and the retriever's verbose query dumps out of the report
+    logging.getLogger().setLevel(logging.WARNING)
+
+    settings.ADMISSION_CONTROL_ENABLED = False  # the stubs have no rate limits to budget for
+    service = build_stub_service(num_nodes=args.nodes)
+    readiness.factory = lambda: service  # the app's startup warm-up serves the stub pipeline
+    server, thread, base_url = start_server()
+
+    print(f"{'sessions':>8} {'turns':>6} {'errors':>6} {'ttft p50':>9} {'ttft p99':>9} "
+          f"{'total p50':>10} {'total p99':>10} {'turns/s':>8}")
+    try:
+        for concurrency in args.concurrency:
+            with contextlib.redirect_stdout(io.StringIO()):
+                r = asyncio.run(run_level(base_url, concurrency, args.turns, args.history))
+            print(f"{r['concurrency']:>8} {r['turns']:>6} {r['errors']:>6} "
+                  f"{r['ttft_p50']:>8.3f}s {r['ttft_p99']:>8.3f}s "
+                  f"{r['total_p50']:>9.3f}s {r['total_p99']:>9.3f}s {r['throughput']:>8.1f}")
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+
+
+if __name__ == "__main__":
+    main()
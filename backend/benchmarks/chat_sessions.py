@@ -0,0 +1,154 @@
+"""
+Per-turn overhead of long conversations: stateless requests vs server-side sessions.
+
+One conversation of `--turns` turns goes through the real FastAPI app (in
+process, over httpx's ASGI transport) with the stub pipeline at zero latency,
+so what's left of a turn is the server's own work.
+    stateless  the client sends the whole conversation every turn; the chat
+               memory trims it to CHAT_HISTORY_TOKEN_LIMIT by re-tokenizing
+    session    POST /sessions once, then only the new message; the history is
+               trimmed with cached token counts and older turns are summarized
+               in the background
+Reported per window of turns: request size, server time per turn, the part of
+it spent preparing the history (reading the chat memory), and the prompt tokens
+of the answer call.
+
+Usage (from backend/):
+    python benchmarks/chat_sessions.py --turns 60 --answer-tokens 300
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+import httpx
+
+# Add the project root to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Settings requires provider keys; the stubs never use them.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from llama_index.core.memory import ChatMemoryBuffer
+
+from app.core.config import settings
+from app.main import app
+from app.services import sessions
+from app.services.rag_engine import ChatService
+from app.services.warmup import readiness
+from benchmarks.stubs import StubEmbedding, StubLLM, StubReranker, StubVectorStore, fake_corpus
+from evals.golden_set import GoldenSet
+
+# Seconds spent reading the chat memory / building the session history in the current turn
+history_seconds = [0.0]
+
+
+def timed(function):
+    if asyncio.iscoroutinefunction(function):
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                history_seconds[0] += time.perf_counter() - start
+    else:
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                history_seconds[0] += time.perf_counter() - start
+    return wrapper
+
+
+ChatMemoryBuffer.aget = timed(ChatMemoryBuffer.aget)
+sessions.PretrimmedMemory.aget = timed(sessions.PretrimmedMemory.aget)
+sessions.Session.history = timed(sessions.Session.history)
+
+
+def question(turn, questions):
+    return f"{questions[turn % len(questions)]} (turn {turn + 1})"
+
+
+async def converse(client, mode, turns, questions):
+    rows, messages, session_id = [], [], None
+    if mode == "session":
+        session_id = (await client.post("/api/v1/sessions")).json()["session_id"]
+    for turn in range(turns):
+        messages.append({"role": "user", "content": question(turn, questions)})
+        body = {"messages": messages if mode == "stateless" else messages[-1:], "include_timings": True}
+        if session_id:
+            body["session_id"] = session_id
+        payload = json.dumps(body)
+        history_seconds[0] = 0.0
+        start = time.perf_counter()
+        response = await client.post("/api/v1/chat", content=payload, headers={"content-type": "application/json"})
+        elapsed = time.perf_counter() - start
+        response.raise_for_status()
+        answer, timings = "", {}
+        for line in response.text.splitlines():
+            if line.startswith("0:"):
+                answer += json.loads(line[2:])
+            elif line.startswith("2:"):
+                timings = json.loads(line[2:])[0]
+        messages.append({"role": "assistant", "content": answer})
+        rows.append({
+            "turn": turn + 1, "request_bytes": len(payload), "server_ms": 1000 * elapsed,
+            "history_ms": 1000 * history_seconds[0], "prompt_tokens": timings["tokens"]["prompt"],
+        })
+    if mode == "session":
+        await readiness.service.sessions.drain()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--answer-tokens", type=int, default=300, help="Words per stub answer")
+    parser.add_argument("--window", type=int, default=10, help="Turns averaged per reported row")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    settings.RESPONSE_CACHE_ENABLED = False
+    settings.QUERY_ROUTER_ENABLED = False
+    settings.ADMISSION_CONTROL_ENABLED = False  # the stubs have no rate limits to budget for
+    questions = [item["question"] for item in GoldenSet().questions]
+
+    llm = StubLLM(first_token_latency=0, token_latency=0, query_gen_latency=0, num_tokens=args.answer_tokens)
+    service = ChatService.from_components(
+        llm, StubEmbedding(latency=0), StubVectorStore(latency=0, nodes=fake_corpus(2000)), StubReranker(latency=0),
+    )
+    readiness.factory = lambda: service
+
+    async def run_all():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=300) as client:
+            await client.post("/api/v1/chat", json={"messages": [{"role": "user", "content": "warm up"}]})
+            return {mode: await converse(client, mode, args.turns, questions) for mode in ("stateless", "session")}
+
+    with redirect_stdout(StringIO()):  # the fusion retriever prints its generated queries
+        results = asyncio.run(run_all())
+
+    print(f"{args.turns} turns, {args.answer_tokens}-word answers, CHAT_HISTORY_TOKEN_LIMIT={settings.CHAT_HISTORY_TOKEN_LIMIT}, "
+          f"summary after {settings.SESSION_SUMMARY_TRIGGER_TOKENS} tokens")
+    print(f"{'mode':<10} {'turns':>7} {'request KB':>10} {'server ms':>10} {'history ms':>10} {'prompt tok':>10}")
+    for mode, rows in results.items():
+        for first in range(0, args.turns, args.window):
+            window = rows[first:first + args.window]
+            print(f"{mode:<10} {f'{first + 1}-{first + len(window)}':>7} "
+                  f"{statistics.mean(r['request_bytes'] for r in window) / 1024:>10.1f} "
+                  f"{statistics.mean(r['server_ms'] for r in window):>10.1f} "
+                  f"{statistics.mean(r['history_ms'] for r in window):>10.2f} "
+                  f"{statistics.mean(r['prompt_tokens'] for r in window):>10.0f}")
+    print(f"summaries written: {service.sessions.summaries}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""
+Prompt tokens saved per turn by context packing, on the eval set.
+
+Each golden-set question opens a four-turn conversation through the real
+`ChatService` with stub backends. The corpus is synthetic: book passages of
+120-480 words, a share of them (`--overlap`) followed by a near-duplicate
+(an overlapping window with a few words changed, like a re-chunked or
+re-ingested passage), and the stub search returns neighbouring passages, so
+duplicates are retrieved together the way overlapping chunks are.
+    stock      CONTEXT_PACKING_ENABLED=false and llama_index's ContextChatEngine
+               (context formatted into the system message, ahead of the prompt)
+    dedupe     packing with an unlimited budget: near-duplicate removal only
+    budget N   the shipped packer (CONTEXT_DEDUPE_THRESHOLD) at CONTEXT_TOKEN_BUDGET=N,
+               and once without perspective balancing at the tightest budget
+Reported per answer-generation call: prompt and context tokens (tiktoken),
+chunks in the context, how often both perspectives made it in, packing time,
+and per turn the prompt prefix shared with the previous turn of the same
+conversation (what a provider-side prompt cache could serve; OpenAI caches
+prefixes of 1024 tokens or more).
+
+Usage (from backend/):
+    python benchmarks/context_packing.py --overlap 0.3
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import statistics
+import sys
+from contextlib import redirect_stdout
+from io import StringIO
+
+import tiktoken
+
+# Add the project root to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Settings requires provider keys; the stubs never use them.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from llama_index.core.base.llms.types import ChatMessage, MessageRole
+from llama_index.core.chat_engine import ContextChatEngine
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, TextNode
+from llama_index.core.utils import get_tokenizer
+from llama_index.core.vector_stores.types import VectorStoreQuery, VectorStoreQueryResult
+
+from app.core.config import settings
+from app.services import rag_engine
+from app.services.perspectives import perspective_of
+from app.services.rag_engine import ChatService
+from benchmarks.stubs import BOOKS, StubEmbedding, StubLLM, StubReranker, StubVectorStore, _seed
+from evals.golden_set import GoldenSet
+
+FOLLOW_UPS = ["Can you say more about that?", "How would I apply this tomorrow?", "What would the Gita add?"]
+
+
+def vocabulary():
+    """Lower-case words that are one token each, most frequent first (so a passage of
+    N words is about N tokens, close to English prose)."""
+    get_tokenizer()  # points tiktoken at the encodings bundled with llama_index
+    encoding = tiktoken.get_encoding("cl100k_base")
+    pieces = (encoding.decode([token]) for token in range(1000, 30000))
+    return [p[1:] for p in pieces if p.startswith(" ") and p[1:].isalpha() and p[1:].islower() and len(p) > 3]
+
+
+def overlapping_corpus(passages_per_book: int, overlap: float, seed: int = 0):
+    """Passages per book, each followed with probability `overlap` by a near-duplicate."""
+    rng = random.Random(seed)
+    words = vocabulary()
+    weights = [1 / (rank + 1) for rank in range(len(words))]  # Zipf-like word frequencies
+    nodes = []
+    for book in BOOKS:
+        stream = rng.choices(words, weights, k=passages_per_book * 600)
+        position = 0
+        for p in range(passages_per_book):
+            length = rng.randint(120, 480)
+            passage = stream[position:position + length]
+            position += length
+            metadata = {"file_name": book, "page_label": str(p + 1)}
+            nodes.append(TextNode(id_=f"{book}-{p}", text=" ".join(passage), metadata=metadata))
+            if rng.random() < overlap:
+                shift = length // 8
+                variant = stream[position - length + shift:position + shift]
+                for _ in range(length // 40):
+                    variant[rng.randrange(len(variant))] = rng.choice(words)
+                nodes.append(TextNode(id_=f"{book}-{p}-dup", text=" ".join(variant), metadata=metadata))
+    return nodes
+
+
+class NeighbourhoodVectorStore(StubVectorStore):
+    """Returns a run of neighbouring passages (which keeps near-duplicates together),
+    then a shorter run from elsewhere in the library, ranked below it."""
+
+    def _top_k(self, query: VectorStoreQuery) -> VectorStoreQueryResult:
+        seed = _seed(query.query_str or "")
+        primary, secondary = seed % len(self.nodes), (seed >> 20) % len(self.nodes)
+        k = min(query.similarity_top_k, len(self.nodes))
+        split = 2 * k // 3
+        picked = [self.nodes[(primary + i) % len(self.nodes)] for i in range(split)]
+        picked += [self.nodes[(secondary + i) % len(self.nodes)] for i in range(k - split)]
+        return VectorStoreQueryResult(nodes=picked, similarities=[1.0 - i / (k + 1) for i in range(k)],
+                                      ids=[node.node_id for node in picked])
+
+
+class RecordingLLM(StubLLM):
+    """Stub LLM that reports tiktoken usage and remembers the answer prompts."""
+
+    num_tokens: int = 400  # a typical two-perspective answer
+    prompts: list = []
+
+    def _usage(self, prompt: str, completion: str) -> dict:
+        if not self._is_query_gen(prompt) and (not self.prompts or self.prompts[-1] != prompt):
+            self.prompts.append(prompt)
+        return {"usage": {"prompt_tokens": _count(prompt), "completion_tokens": _count(completion)}}
+
+
+_tokenizer = get_tokenizer()
+_counts = {}
+
+
+def _count(text: str) -> int:
+    if text not in _counts:
+        _counts[text] = len(_tokenizer(text))
+    return _counts[text]
+
+
+def shared_prefix_tokens(a: str, b: str) -> int:
+    tokens_a, tokens_b = _tokenizer(a), _tokenizer(b)
+    shared = 0
+    for x, y in zip(tokens_a, tokens_b):
+        if x != y:
+            break
+        shared += 1
+    return shared
+
+
+async def run(service, llm, questions):
+    rows = []
+    for question in questions:
+        history, previous_prompt = [], None
+        for turn, message in enumerate([question, *FOLLOW_UPS], start=1):
+            breakdown = {}
+            answer = "".join([token async for token in service.astream_chat(message, history, breakdown)])
+            prompt = llm.prompts[-1]
+            context = service.context.nodes
+            mixed = len({perspective_of(n) for n in service.candidates.nodes}) == 2
+            rows.append({
+                "prompt": breakdown["tokens"]["prompt"],
+                "context": sum(_count(n.node.get_content(metadata_mode=MetadataMode.LLM)) for n in context),
+                "chunks": len(context),
+                # Both perspectives in the prompt, of the turns whose candidates had both
+                "balanced": len({perspective_of(n) for n in context}) == 2 if mixed else None,
+                "packing_ms": breakdown["stages_ms"].get("packing", 0.0),
+                "turn": turn,
+                "shared_prefix": shared_prefix_tokens(previous_prompt, prompt) if previous_prompt else None,
+            })
+            history += [ChatMessage(role=MessageRole.USER, content=message),
+                        ChatMessage(role=MessageRole.ASSISTANT, content=answer)]
+            previous_prompt = prompt
+    return rows
+
+
+class NodeRecorder(BaseNodePostprocessor):
+    """Remembers the nodes passing through this point of the postprocessor chain."""
+
+    nodes: list = []
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        self.nodes = list(nodes)
+        return nodes
+
+
+def build_service(corpus, llm):
+    service = ChatService.from_components(
+        llm, StubEmbedding(latency=0), NeighbourhoodVectorStore(latency=0, nodes=corpus), StubReranker(latency=0),
+    )
+    # Record the chunks before and after the packer (the last postprocessor when enabled)
+    service.candidates, service.context = NodeRecorder(), NodeRecorder()
+    position = len(service._node_postprocessors) - (1 if settings.CONTEXT_PACKING_ENABLED else 0)
+    service._node_postprocessors.insert(position, service.candidates)
+    service._node_postprocessors.append(service.context)
+    return service
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--overlap", type=float, default=0.3, help="Share of passages with a near-duplicate")
+    parser.add_argument("--passages", type=int, default=200, help="Passages per book")
+    parser.add_argument("--budgets", default="3000,2500,2000,1500", help="CONTEXT_TOKEN_BUDGET values to compare")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    settings.RESPONSE_CACHE_ENABLED = False
+    settings.QUERY_ROUTER_ENABLED = False  # follow-ups like "Can you say more?" would skip retrieval
+    settings.RETRIEVAL_PARTITIONED = False  # the neighbourhood store models one search over the whole library
+    questions = [item["question"] for item in GoldenSet().questions]
+    corpus = overlapping_corpus(args.passages, args.overlap)
+    default_budget = settings.CONTEXT_TOKEN_BUDGET
+    budgets = [int(b) for b in args.budgets.split(",")]
+    static_prefix = rag_engine.StaticPrefixChatEngine
+
+    # (label, packing enabled, budget, balance perspectives, engine)
+    configs = [("stock", False, None, True, ContextChatEngine), ("dedupe only", True, 10 ** 9, True, static_prefix)]
+    configs += [(f"budget {b}", True, b, True, static_prefix) for b in budgets]
+    configs.append((f"budget {min(budgets)}, unbalanced", True, min(budgets), False, static_prefix))
+
+    turns = 1 + len(FOLLOW_UPS)
+    print(f"{len(questions)} golden questions x {turns} turns, {len(corpus)} passages (overlap {args.overlap:.0%}), "
+          f"dedupe threshold {settings.CONTEXT_DEDUPE_THRESHOLD}")
+    print(f"{'config':<26} {'prompt tok':>10} {'context tok':>11} {'chunks':>7} {'both sides':>10} {'packing ms':>10}  "
+          + " ".join(f"{f'prefix t{t}':>9}" for t in range(2, turns + 1)))
+    results = {}
+    for label, enabled, budget, balance, engine_class in configs:
+        settings.CONTEXT_PACKING_ENABLED = enabled
+        settings.CONTEXT_TOKEN_BUDGET = budget or default_budget
+        rag_engine.StaticPrefixChatEngine = engine_class
+        llm = RecordingLLM(first_token_latency=0, token_latency=0, query_gen_latency=0, prompts=[])
+        service = build_service(corpus, llm)
+        if enabled:
+            service._caches["context_packer"].balance_perspectives = balance
+        with redirect_stdout(StringIO()):  # the fusion retriever prints its generated queries
+            rows = asyncio.run(run(service, llm, questions))
+        rag_engine.StaticPrefixChatEngine = static_prefix
+        results[label] = rows
+        balanced = [row["balanced"] for row in rows if row["balanced"] is not None]
+        prefixes = [statistics.mean(r["shared_prefix"] for r in rows if r["turn"] == t) for t in range(2, turns + 1)]
+        print(f"{label:<26} {statistics.mean(r['prompt'] for r in rows):>10.0f} "
+              f"{statistics.mean(r['context'] for r in rows):>11.0f} {statistics.mean(r['chunks'] for r in rows):>7.1f} "
+              f"{statistics.mean(balanced) if balanced else 0:>10.0%} "
+              f"{statistics.mean(r['packing_ms'] for r in rows):>10.2f}  " + " ".join(f"{p:>9.0f}" for p in prefixes))
+    settings.CONTEXT_PACKING_ENABLED, settings.CONTEXT_TOKEN_BUDGET = True, default_budget
+
+    stock = statistics.mean(r["prompt"] for r in results["stock"])
+    print(f"\nprompt tokens saved per turn vs stock (both sides = share of turns with both perspectives in the "
+          f"context, of those whose candidates had both):")
+    for label in results:
+        if label != "stock":
+            saved = stock - statistics.mean(r["prompt"] for r in results[label])
+            print(f"  {label:<26} {saved:>6.0f} ({saved / stock:.0%})")
+
+
+if __name__ == "__main__":
+    main()
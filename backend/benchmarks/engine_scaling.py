@@ -0,0 +1,88 @@
+
+"""
+Throughput benchmark for per-turn chat engines in `ChatService`.
+
+Every turn gets its own `ContextChatEngine` (fresh memory) on top of the shared
+retriever / LLM / reranker. This measures what that costs and how throughput
+scales with the number of concurrent conversations in a single process, calling
+`ChatService.astream_chat` directly against stub backends.
+
+Usage (from backend/):
+    python benchmarks/engine_scaling.py --concurrency 1 4 16 64 256 --turns 3
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import os
+import sys
+import time
+import timeit
+
+# Add the project root to sys.path to allow imports from app
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Settings requires provider keys; the stubs never use them.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("PINECONE_API_KEY", "pc-benchmark")
+
+from llama_index.core.llms import ChatMessage, MessageRole
+
+from app.core.config import settings
+from benchmarks.stubs import build_stub_service
+
+
+async def run_conversation(service, session_id, turns):
+    history = []
+    for turn in range(turns):
+        question = f"Session {session_id}: how do I stay disciplined? (turn {turn})"
+        answer = "".join([token async for token in service.astream_chat(question, chat_history=list(history))])
+        history.append(ChatMessage(role=MessageRole.USER, content=question))
+        history.append(ChatMessage(role=MessageRole.ASSISTANT, content=answer))
+
+
+async def run_level(service, concurrency, turns):
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    await asyncio.gather(*(run_conversation(service, i, turns) for i in range(concurrency)))
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    total_turns = concurrency * turns
+    return wall, total_turns / wall, cpu / total_turns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64, 256])
+    parser.add_argument("--turns", type=int, default=3, help="Sequential turns per conversation")
+    parser.add_argument("--max-concurrency", type=int, default=1024,
+                        help="Override CHAT_MAX_CONCURRENCY so the limiter does not cap the sweep")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    settings.CHAT_MAX_CONCURRENCY = args.max_concurrency
+    settings.ADMISSION_CONTROL_ENABLED = False  # the stubs have no rate limits to budget for
+    service = build_stub_service()
+
+    # 1. Cost of building a per-turn engine with a realistic history
+    history = [
+        ChatMessage(role=MessageRole.USER if i % 2 == 0 else MessageRole.ASSISTANT, content="word " * 120)
+        for i in range(10)
+    ]
+    n = 2000
+    per_engine = timeit.timeit(lambda: service.create_chat_engine(history), number=n) / n
+    print(f"create_chat_engine (10-message history): {per_engine * 1e6:.1f} us/turn\n")
+
+    # 2. Throughput as concurrent conversations increase
+    print(f"{'sessions':>8} {'turns':>6} {'wall':>8} {'turns/s':>8} {'cpu/turn':>9}")
+    for concurrency in args.concurrency:
+        with contextlib.redirect_stdout(io.StringIO()):
+            wall, throughput, cpu_per_turn = asyncio.run(run_level(service, concurrency, args.turns))
+        print(f"{concurrency:>8} {concurrency * args.turns:>6} {wall:>7.2f}s {throughput:>8.1f} "
+              f"{cpu_per_turn * 1e3:>7.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+
+"""
+Wall time of the eval harness (`evals/evaluate.py`) by concurrency, and the
+effect of the judge verdict cache on a re-run.
+
+Runs `run_evals` over a synthetic golden set against the stub chat service,
+with the stub LLM also acting as the judge (so verdicts are meaningless; only
+timing and cache behaviour are measured). Each configuration uses a fresh
+judge cache, then the last one is re-run against its warm cache.
+
+Usage (from backend/):
+    python benchmarks/eval_harness.py --questions 64 --concurrency 1 8 32
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from io import StringIO
+
+# Add the project root to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Settings requires provider keys; the stubs never use them.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from benchmarks.stubs import StubLLM, build_stub_service
+from evals.evaluate import run_evals
+from evals.golden_set import GoldenSet, question_id
+from evals.judge_cache import JudgeCache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    workdir = tempfile.mkdtemp(prefix="eval-bench-")
+    try:
+        golden_set = GoldenSet(os.path.join(workdir, "golden_set.json"))
+        questions = [f"Question {i}: what do the books say about habit {i % 7} and duty?" for i in range(args.questions)]
+        golden_set.version = 1
+        golden_set.questions = [{"id": question_id(q), "question": q} for q in questions]
+
+        service = build_stub_service(llm_token=0.005)
+        judge_llm = StubLLM(first_token_latency=0.3, token_latency=0.0)
+
+        print(f"{'run':<22} {'wall s':>7} {'q/min':>7} {'judge hits':>10} {'judge calls':>11}")
+        for concurrency in args.concurrency:
+            cache = JudgeCache(os.path.join(workdir, f"judge-{concurrency}.sqlite3"))
+            runs = [("cold", cache)] + ([("re-run (warm cache)", cache)] if concurrency == args.concurrency[-1] else [])
+            for label, run_cache in runs:
+                hits_before, misses_before = run_cache.hits, run_cache.misses
+                with redirect_stdout(StringIO()):  # the fusion retriever prints its generated queries
+                    _, summary = asyncio.run(run_evals(golden_set, service, judge_llm, concurrency, run_cache))
+                wall = summary["wall_seconds"]
+                print(f"{f'c={concurrency} {label}':<22} {wall:>7.1f} {60 * summary['questions'] / wall:>7.0f} "
+                      f"{run_cache.hits - hits_before:>10} {run_cache.misses - misses_before:>11}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+
+"""
+Retrieval wall time per chat turn: upstream QueryFusionRetriever vs
+BatchedFusionRetriever (`app/services/fusion_retriever.py`).
+
+Both retrievers run against the same stub LLM and embedding model, over the stub
+network vector store (a simulated Pinecone round trip) and over the local
+vector index. For each pair the script checks that the fused rankings and RRF
+scores are identical, then reports embedding and search requests per turn and
+retrieval latency with 1 and `--concurrency` turns in flight. Query generation
+latency is set to 0 so only embedding, search and fusion are timed.
+
+Usage (from backend/):
+    python benchmarks/fusion_retrieval.py --turns 64 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Add the project root to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Settings requires provider keys; the stubs never use them.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from llama_index.core import VectorStoreIndex
+from llama_index.core.retrievers import QueryFusionRetriever
+from llama_index.core.retrievers.fusion_retriever import FUSION_MODES
+
+from app.services.fusion_retriever import BatchedFusionRetriever
+from app.services.local_vector_store import LocalVectorStore
+from app.services.rag_engine import QUERY_GEN_PROMPT
+from benchmarks.stubs import StubEmbedding, StubLLM, StubVectorStore, fake_corpus, fake_embedding
+
+
+def build_retrievers(vector_store, embed_model, llm):
+    index = VectorStoreIndex.from_vector_store(vector_store=vector_store, embed_model=embed_model)
+    vector_retriever = index.as_retriever(similarity_top_k=15)
+    options = dict(
+        llm=llm,
+        similarity_top_k=30,
+        num_queries=3,
+        mode=FUSION_MODES.RECIPROCAL_RANK,
+        use_async=True,
+        verbose=False,
+        query_gen_prompt=QUERY_GEN_PROMPT,
+    )
+    upstream = QueryFusionRetriever([vector_retriever], **options)
+    batched = BatchedFusionRetriever(vector_store=vector_store, embed_model=embed_model, vector_top_k=15,
+                                     retrievers=[vector_retriever], **options)
+    return upstream, batched
+
+
+async def timed_turns(retriever, questions, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def turn(question):
+        async with semaphore:
+            start = time.perf_counter()
+            await retriever.aretrieve(question)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(turn(q) for q in questions))
+    return latencies
+
+
+async def compare(label, vector_store, embed_model, llm, questions, concurrency):
+    upstream, batched = build_retrievers(vector_store, embed_model, llm)
+
+    mismatches = 0
+    for question in questions[:16]:
+        expected = await upstream.aretrieve(question)
+        actual = await batched.aretrieve(question)
+        if [(n.node.node_id, n.score) for n in expected] != [(n.node.node_id, n.score) for n in actual]:
+            mismatches += 1
+    print(f"{label}: identical rankings on {16 - mismatches}/16 questions")
+
+    for name, retriever in (("upstream", upstream), ("batched", batched)):
+        embed_before = embed_model.calls
+        search_before = getattr(vector_store, "queries", 0)
+        serial = await timed_turns(retriever, questions, 1)
+        loaded = await timed_turns(retriever, questions, concurrency)
+        turns = 2 * len(questions)
+        searches = (getattr(vector_store, "queries", 0) - search_before) / turns
+        print(f"  {name:<9} embed req/turn {(embed_model.calls - embed_before) / turns:>4.1f}  "
+              f"search req/turn {searches:>4.1f}  "
+              f"p50 {1000 * np.percentile(serial, 50):>7.1f} ms  "
+              f"p50@{concurrency} {1000 * np.percentile(loaded, 50):>7.1f} ms  "
+              f"p99@{concurrency} {1000 * np.percentile(loaded, 99):>7.1f} ms")
+
+
+async def main_async(args):
+    llm = StubLLM(query_gen_latency=0.0)
+    questions = [f"question {i}: how do habits shape identity and duty?" for i in range(args.turns)]
+
+    embed_model = StubEmbedding(latency=args.embed_latency)
+    remote = StubVectorStore(latency=args.search_latency, nodes=fake_corpus(args.nodes))
+    await compare(f"network store ({1000 * args.search_latency:.0f} ms search)", remote, embed_model, llm,
+                  questions, args.concurrency)
+
+    workdir = tempfile.mkdtemp(prefix="fusion-bench-")
+    try:
+        local = LocalVectorStore(persist_dir=workdir)
+        nodes = fake_corpus(args.nodes)
+        for node in nodes:
+            node.embedding = fake_embedding(node.text, embed_model.dim)
+        local.add(nodes)
+        embed_model = StubEmbedding(latency=args.embed_latency)
+        await compare("local index", local, embed_model, llm, questions, args.concurrency)
+    finally:
+        shutil.rmtree(workdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--nodes", type=int, default=2000)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--search-latency", type=float, default=0.08)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+Per-turn latency of the chat pipeline with the providers' default clients
+versus the pooled clients from `app/core/clients.py`.
+
+The real SDK clients (llama_index OpenAI / OpenAIEmbedding, Pinecone,
+CohereRerank) talk HTTPS to a local stub of the three provider APIs:
+    client -> LatencyProxy (adds `--rtt` to connection setup and every packet)
+           -> TLSFrontend (HTTP/2 via ALPN, or HTTP/1.1 spliced to uvicorn)
+           -> stub app (20 ms per request)
+so TCP/TLS handshakes cost what they would over the internet.
+    default     clients built as before: one pool per client object, HTTP/1.1,
+                httpx defaults (idle connections closed after 5 s)
+    pooled/1.1  app/core/clients.py with HTTP2_ENABLED=false: shared pools,
+                HTTP_KEEPALIVE_SECONDS
+    pooled/h2   app/core/clients.py as shipped: OpenAI and Cohere over HTTP/2
+Scenarios:
+    idle      sequential turns with `--gap` seconds between them (a quiet worker)
+    busy      sequential turns back to back
+    burst     `--burst` turns at once
+Needs the `openssl` CLI for the throwaway certificate.
+
+Usage (from backend/):
+    python benchmarks/http_clients.py --rtt 0.04 --gap 6 --turns 5
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+# Add the project root to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Settings requires provider keys; the stub server ignores them.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("PINECONE_API_KEY", "pc-benchmark")
+os.environ.setdefault("COHERE_API_KEY", "co-benchmark")
+
+import h2.config
+import h2.connection
+import h2.events
+import h2.exceptions
+import httpx
+import uvicorn
+
+from app.core.config import settings
+from benchmarks.stub_server import SERVICE_TIME, stub_upstream_app
+
+
+class LatencyProxy:
+    """TCP proxy that delays connection setup by one RTT and every chunk by half an RTT per direction."""
+
+    def __init__(self, target_port: int, rtt: float):
+        self.target_port = target_port
+        self.rtt = rtt
+        self.connections = 0
+        self.port = None
+
+    async def _pipe(self, reader, writer):
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def deliver():
+            while True:
+                due, data = await queue.get()
+                if data is None:
+                    break
+                await asyncio.sleep(max(0.0, due - time.perf_counter()))
+                writer.write(data)
+                await writer.drain()
+            writer.close()
+
+        delivery = asyncio.create_task(deliver())
+        try:
+            while data := await reader.read(65536):
+                queue.put_nowait((time.perf_counter() + self.rtt / 2, data))
+        except ConnectionError:
+            pass
+        queue.put_nowait((0.0, None))
+        await delivery
+
+    async def _handle(self, client_reader, client_writer):
+        self.connections += 1
+        await asyncio.sleep(self.rtt)  # TCP handshake
+        upstream_reader, upstream_writer = await asyncio.open_connection("127.0.0.1", self.target_port)
+        await asyncio.gather(self._pipe(client_reader, upstream_writer), self._pipe(upstream_reader, client_writer),
+                             return_exceptions=True)
+
+    def start(self):
+        ready = threading.Event()
+
+        async def serve():
+            server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+            self.port = server.sockets[0].getsockname()[1]
+            ready.set()
+            async with server:
+                await server.serve_forever()
+
+        threading.Thread(target=asyncio.run, args=(serve(),), daemon=True).start()
+        ready.wait()
+        return self
+
+
+def start_stub_server(keepalive) -> int:
+    """The stub app under uvicorn, plain HTTP/1.1 (TLS and HTTP/2 are done by `TLSFrontend`)."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(stub_upstream_app(), log_level="warning", access_log=False,
+                                           timeout_keep_alive=keepalive))
+    threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return sock.getsockname()[1]
+
+
+class TLSFrontend:
+    """
+    Terminates TLS for the stub, like the providers' edge: clients that offer h2
+    in ALPN get HTTP/2 (served here with the `h2` package, requests relayed to
+    the stub app), everyone else is spliced through to uvicorn over HTTP/1.1.
+    """
+
+    def __init__(self, app_port: int, certfile: str, keyfile: str):
+        self.app_port = app_port
+        self.ssl = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        self.ssl.load_cert_chain(certfile, keyfile)
+        self.ssl.set_alpn_protocols(["h2", "http/1.1"])
+        self.port = None
+
+    async def _splice(self, reader, writer):
+        try:
+            while data := await reader.read(65536):
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def _handle(self, reader, writer):
+        if writer.get_extra_info("ssl_object").selected_alpn_protocol() == "h2":
+            await self._serve_h2(reader, writer)
+            return
+        app_reader, app_writer = await asyncio.open_connection("127.0.0.1", self.app_port)
+        await asyncio.gather(self._splice(reader, app_writer), self._splice(app_reader, writer), return_exceptions=True)
+
+    async def _serve_h2(self, reader, writer):
+        conn = h2.connection.H2Connection(config=h2.config.H2Configuration(client_side=False, header_encoding="utf-8"))
+        conn.initiate_connection()
+        writer.write(conn.data_to_send())
+        requests, window_open = {}, asyncio.Event()
+
+        async def respond(stream_id, headers, body):
+            try:
+                async with self._app.stream(headers[":method"], headers[":path"], content=bytes(body),
+                                            headers={"content-type": headers.get("content-type", "application/json")}) as r:
+                    conn.send_headers(stream_id, [(":status", str(r.status_code)),
+                                                  ("content-type", r.headers.get("content-type", ""))])
+                    async for chunk in r.aiter_raw():
+                        while chunk:
+                            while conn.local_flow_control_window(stream_id) < 1:
+                                window_open.clear()
+                                writer.write(conn.data_to_send())
+                                await window_open.wait()
+                            size = min(len(chunk), conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size)
+                            conn.send_data(stream_id, chunk[:size])
+                            chunk = chunk[size:]
+                            writer.write(conn.data_to_send())
+                    conn.end_stream(stream_id)
+            except h2.exceptions.StreamClosedError:
+                pass  # client reset the stream (e.g. stopped reading after [DONE])
+            writer.write(conn.data_to_send())
+
+        try:
+            while data := await reader.read(65536):
+                for event in conn.receive_data(data):
+                    if isinstance(event, h2.events.RequestReceived):
+                        requests[event.stream_id] = (dict(event.headers), bytearray())
+                    elif isinstance(event, h2.events.DataReceived):
+                        requests[event.stream_id][1].extend(event.data)
+                        conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, h2.events.StreamEnded):
+                        asyncio.create_task(respond(event.stream_id, *requests.pop(event.stream_id)))
+                    elif isinstance(event, h2.events.WindowUpdated):
+                        window_open.set()
+                writer.write(conn.data_to_send())
+        except ConnectionError:
+            pass
+        writer.close()
+
+    def start(self):
+        ready = threading.Event()
+
+        async def serve():
+            self._app = httpx.AsyncClient(base_url=f"http://127.0.0.1:{self.app_port}", timeout=60)
+            server = await asyncio.start_server(self._handle, "127.0.0.1", 0, ssl=self.ssl)
+            self.port = server.sockets[0].getsockname()[1]
+            ready.set()
+            async with server:
+                await server.serve_forever()
+
+        threading.Thread(target=asyncio.run, args=(serve(),), daemon=True).start()
+        ready.wait()
+        return self
+
+
+def make_certificate(directory):
+    certfile, keyfile = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+         "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1", "-keyout", keyfile, "-out", certfile],
+        check=True, capture_output=True,
+    )
+    return certfile, keyfile
+
+
+def default_clients(base_url):
+    """The clients as the entry points built them before app/core/clients.py."""
+    from llama_index.embeddings.openai import OpenAIEmbedding
+    from llama_index.llms.openai import OpenAI
+    from llama_index.postprocessor.cohere_rerank import CohereRerank
+    from pinecone import Pinecone
+
+    llm = OpenAI(model="gpt-4o", api_key=settings.OPENAI_API_KEY, api_base=f"{base_url}/v1",
+                 additional_kwargs={"stream_options": {"include_usage": True}})
+    embed_model = OpenAIEmbedding(api_key=settings.OPENAI_API_KEY, api_base=f"{base_url}/v1")
+    index = Pinecone(api_key=settings.PINECONE_API_KEY).Index(host=base_url)
+    reranker = CohereRerank(api_key=settings.COHERE_API_KEY, base_url=base_url, top_n=10)
+    return llm, embed_model, index, reranker
+
+
+def pooled_clients(base_url):
+    from app.core.clients import cohere_rerank, openai_embedding, openai_llm, pinecone_client
+
+    llm = openai_llm("gpt-4o", api_base=f"{base_url}/v1", additional_kwargs={"stream_options": {"include_usage": True}})
+    embed_model = openai_embedding(api_base=f"{base_url}/v1")
+    index = pinecone_client().Index(host=base_url)
+    reranker = cohere_rerank(top_n=10, api_key=settings.COHERE_API_KEY, base_url=base_url)
+    return llm, embed_model, index, reranker
+
+
+async def turn(service, question):
+    """(time to first token, time to last token)."""
+    start = time.perf_counter()
+    first = last = None
+    async for _ in service.astream_chat(question):
+        last = time.perf_counter() - start
+        if first is None:
+            first = last
+    return first, last
+
+
+async def run_scenario(service, proxy, name, turns, gap, burst):
+    connections = proxy.connections
+    results = []
+    if name == "burst":
+        results = await asyncio.gather(*(turn(service, f"{name} {i}: how do habits form?") for i in range(burst)))
+    else:
+        for i in range(turns):
+            if i and gap:
+                await asyncio.sleep(gap)
+            results.append(await turn(service, f"{name} {i}: how do habits form?"))
+    count = len(results)
+    return {
+        "ttft": 1000 * sum(r[0] for r in results) / count,
+        "last": 1000 * sum(r[1] for r in results) / count,
+        "connections": (proxy.connections - connections) / count,
+    }
+
+
+async def run_config(builder, base_url, proxy, args):
+    from app.services.rag_engine import AsyncPineconeVectorStore, ChatService
+
+    llm, embed_model, index, reranker = builder(base_url)
+    service = ChatService.from_components(llm, embed_model, AsyncPineconeVectorStore(pinecone_index=index), reranker)
+    await turn(service, "warm up: open the first connections")
+    rows = {}
+    for name in ("idle", "busy", "burst"):
+        if name == "idle":
+            await asyncio.sleep(args.gap)
+        rows[name] = await run_scenario(service, proxy, name, args.turns, args.gap if name == "idle" else 0, args.burst)
+    return rows
+
+
+async def run_all(base_url, proxy, args):
+    from app.core.clients import aclose_clients
+
+    results = {}
+    for label, builder, http2 in (("default", default_clients, False), ("pooled/1.1", pooled_clients, False),
+                                  ("pooled/h2", pooled_clients, True)):
+        settings.HTTP2_ENABLED = http2
+        results[label] = await run_config(builder, base_url, proxy, args)
+        await aclose_clients()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rtt", type=float, default=0.04, help="Simulated network round trip (s)")
+    parser.add_argument("--gap", type=float, default=6.0, help="Idle seconds between turns in the idle scenario")
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--server-keepalive", type=float, default=90.0,
+                        help="Seconds the stub server keeps idle connections (provider load balancers: 60 s or more)")
+    parser.add_argument("--burst", type=int, default=16)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    settings.RESPONSE_CACHE_ENABLED = False
+    settings.QUERY_EXPANSION_MODE = "llm"  # one query-generation call per turn, as without the cache
+
+    workdir = tempfile.mkdtemp(prefix="http-bench-")
+    certfile, keyfile = make_certificate(workdir)
+    os.environ["SSL_CERT_FILE"] = certfile  # httpx (and so every SDK here) trusts the stub's certificate
+    frontend = TLSFrontend(start_stub_server(args.server_keepalive), certfile, keyfile).start()
+    proxy = LatencyProxy(frontend.port, args.rtt).start()
+    base_url = f"https://127.0.0.1:{proxy.port}"
+
+    print(f"rtt {1000 * args.rtt:.0f} ms, server time {1000 * SERVICE_TIME:.0f} ms/request, idle gap {args.gap:.0f} s, "
+          f"server keep-alive {args.server_keepalive:.0f} s")
+    print(f"{'clients':<11} {'scenario':<9} {'ttft ms':>8} {'last token ms':>14} {'new conns/turn':>15}")
+    with redirect_stdout(StringIO()):  # the fusion retriever prints its generated queries
+        results = asyncio.run(run_all(base_url, proxy, args))
+    for label, rows in results.items():
+        for name, row in rows.items():
+            print(f"{label:<11} {name:<9} {row['ttft']:>8.0f} {row['last']:>14.0f} {row['connections']:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""
+Recall and latency of dense vs hybrid (dense + BM25) retrieval, with 3 queries
+per turn (the original plus 2 generated) and with the original query alone.
+
+Builds a synthetic library: chunks about one of `--topics` topics, each
+mentioning a rare name or term that appears in a handful of chunks, like
+"Arjuna" or "Quadrant II" in the real books. Questions name one of those terms
+plus two topic words; the chunks containing the term are the relevant ones.
+The dense stand-in embeds a text as the sum of per-word vectors, so a rare term
+is one word among ~150 in a chunk vector; that is the dilution that makes real
+dense retrieval miss exact names. Generated queries are keyphrase and synonym
+rewrites of the question (LocalQueryExpander) delivered after a simulated LLM
+call of `--query-gen-latency` seconds.
+
+Vectors are searched with the real LocalVectorStore and terms with the real
+SparseIndex, through BatchedFusionRetriever. Reported per configuration:
+recall of the relevant chunks in the fused top 10 and top 30 (what the
+reranker sees), and retrieval latency per turn. Also reported: sparse index
+build time and size, and the latency of one BM25 lookup.
+
+Usage (from backend/):
+    python benchmarks/hybrid_retrieval.py --chunks 5000 --questions 300
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+from typing import List
+
+import numpy as np
+
+# Add the project root to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Settings requires provider keys; the benchmark never uses them.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from llama_index.core import VectorStoreIndex
+from llama_index.core.retrievers.fusion_retriever import FUSION_MODES
+from llama_index.core.schema import TextNode
+
+from app.services.fusion_retriever import BatchedFusionRetriever
+from app.services.local_vector_store import LocalVectorStore
+from app.services.query_expansion import STOPWORDS, LocalQueryExpander
+from app.services.rag_engine import QUERY_GEN_PROMPT
+from app.services.sparse_index import SparseIndex, SparseRetriever, tokenize
+from benchmarks.stubs import BOOKS, StubEmbedding, StubLLM, fake_embedding
+
+SYLLABLES = "ka ri mo ta ve lu shi an dor pel gra nim so tu rek ba".split()
+FILLER = sorted(STOPWORDS - {"tell", "explain", "give", "help", "please", "according", "say", "says", "book", "books"})
+
+
+def pseudo_words(count: int, rng: random.Random, syllables: int) -> List[str]:
+    words = set()
+    while len(words) < count:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(syllables)))
+    return sorted(words)
+
+
+def build_library(num_chunks: int, num_topics: int, seed: int = 0):
+    """(nodes, rare term -> relevant chunk IDs, topic words per topic, topic per chunk)."""
+    rng = random.Random(seed)
+    vocabulary = pseudo_words(2000, rng, 3)
+    topics = [rng.sample(vocabulary[:1200], 25) for _ in range(num_topics)]
+    general = vocabulary[1200:]
+    zipf = [1.0 / (rank + 1) for rank in range(len(general))]
+    rare = pseudo_words(num_chunks // 2 + num_topics, rng, 5)
+
+    nodes, relevant, chunk_topic = [], {}, []
+    for i in range(num_chunks):
+        topic = i % num_topics
+        words = rng.choices(topics[topic], k=60) + rng.choices(general, weights=zipf, k=40) + rng.choices(FILLER, k=50)
+        # Each rare term appears in 2 chunks of one topic (chunks i and i + num_topics)
+        term = rare[i // (2 * num_topics) * num_topics + topic]
+        words.insert(rng.randrange(len(words)), term.capitalize())
+        rng.shuffle(words)
+        node_id = f"chunk-{i}"
+        relevant.setdefault(term, set()).add(node_id)
+        chunk_topic.append(topic)
+        nodes.append(TextNode(id_=node_id, text=" ".join(words),
+                              metadata={"file_name": BOOKS[i % len(BOOKS)], "page_label": str(i // 4 + 1)}))
+    return nodes, relevant, topics, chunk_topic
+
+
+class BagOfWordsEmbedding(StubEmbedding):
+    """Sum of per-word pseudo-vectors: related texts land near each other, rare words barely move a chunk."""
+
+    def _vector(self, text: str) -> List[float]:
+        words = tokenize(text) + [w for w in text.lower().split() if w in STOPWORDS]
+        vector = np.sum([self._word(w) for w in words] or [np.zeros(self.dim)], axis=0)
+        return (vector / (np.linalg.norm(vector) or 1.0)).tolist()
+
+    def _word(self, word: str) -> np.ndarray:
+        cache = self.__dict__.setdefault("_words", {})
+        if word not in cache:
+            cache[word] = np.asarray(fake_embedding(word, self.dim))
+        return cache[word]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self._vector(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._vector(text)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector(text) for text in texts]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+
+class SimulatedLLMExpander(LocalQueryExpander):
+    """Keyphrase/synonym rewrites after a simulated LLM round trip."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def aexpand(self, query: str, num_queries: int) -> List[str]:
+        await asyncio.sleep(self.latency)
+        return await super().aexpand(query, num_queries)
+
+
+def questions_for(relevant, topics, chunk_topic, count, seed=1):
+    rng = random.Random(seed)
+    terms = sorted(relevant)
+    questions = []
+    for term in rng.sample(terms, min(count, len(terms))):
+        topic = chunk_topic[int(min(relevant[term]).split("-")[1])]
+        a, b = rng.sample(topics[topic], 2)
+        questions.append((f"What does {term.capitalize()} teach about {a} and {b}?", relevant[term]))
+    return questions
+
+
+async def run_config(retriever, questions, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    recall10, recall30, latencies = [], [], []
+
+    async def turn(question, expected):
+        async with semaphore:
+            start = time.perf_counter()
+            nodes = await retriever.aretrieve(question)
+            latencies.append(time.perf_counter() - start)
+        ids = [n.node.node_id for n in nodes]
+        recall10.append(len(expected & set(ids[:10])) / len(expected))
+        recall30.append(len(expected & set(ids[:30])) / len(expected))
+
+    await asyncio.gather(*(turn(q, e) for q, e in questions))
+    return np.mean(recall10), np.mean(recall30), latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--topics", type=int, default=40)
+    parser.add_argument("--questions", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--query-gen-latency", type=float, default=0.5, help="Simulated LLM query generation (s)")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Simulated embedding request (s)")
+    args = parser.parse_args()
+
+    nodes, relevant, topics, chunk_topic = build_library(args.chunks, args.topics)
+    questions = questions_for(relevant, topics, chunk_topic, args.questions)
+    embed_model = BagOfWordsEmbedding(latency=args.embed_latency)
+    for node, embedding in zip(nodes, embed_model._get_text_embeddings([n.get_content() for n in nodes])):
+        node.embedding = embedding
+
+    workdir = tempfile.mkdtemp(prefix="hybrid-")
+    try:
+        vector_store = LocalVectorStore(persist_dir=os.path.join(workdir, "vectors"))
+        vector_store.add(nodes)
+        sparse = SparseIndex(os.path.join(workdir, "sparse"))
+        start = time.perf_counter()
+        sparse.add(nodes)
+        sparse.compact()
+        build = time.perf_counter() - start
+        sparse = SparseIndex(sparse.persist_dir)  # memory-mapped, as the API loads it
+        size = sum(os.path.getsize(os.path.join(sparse.persist_dir, name))
+                   for name in ("terms.json", "offsets.i64", "postings.i32", "weights.f32"))
+        print(f"{args.chunks} chunks: sparse index built in {build:.2f}s, {sparse.stats()['terms']} terms, "
+              f"{sparse.stats()['postings']} postings, {size / 1024:.0f} KB of arrays + vocabulary")
+
+        for label, call in (("search", lambda q: sparse.search(q, 15)), ("search + nodes", lambda q: sparse.query(q, 15))):
+            samples = []
+            for question, _ in questions:
+                start = time.perf_counter()
+                call(question)
+                samples.append(time.perf_counter() - start)
+            print(f"BM25 {label:<15} p50 {1e6 * np.percentile(samples, 50):7.1f} us   "
+                  f"p99 {1e6 * np.percentile(samples, 99):7.1f} us")
+
+        index = VectorStoreIndex.from_vector_store(vector_store=vector_store, embed_model=embed_model)
+        print(f"\n{len(questions)} questions, {args.concurrency} in flight, query generation "
+              f"{1000 * args.query_gen_latency:.0f} ms, embedding {1000 * args.embed_latency:.0f} ms")
+        print(f"{'retrieval':<10} {'queries':>7} {'recall@10':>9} {'recall@30':>9} {'p50 ms':>7} {'p99 ms':>7}")
+        for mode, num_queries in (("dense", 3), ("dense", 1), ("hybrid", 3), ("hybrid", 1)):
+            retriever = BatchedFusionRetriever(
+                vector_store=vector_store,
+                embed_model=embed_model,
+                vector_top_k=15,
+                retrievers=[index.as_retriever(similarity_top_k=15)],
+                query_expander=SimulatedLLMExpander(args.query_gen_latency),
+                sparse_retriever=SparseRetriever(sparse, similarity_top_k=15) if mode == "hybrid" else None,
+                llm=StubLLM(),
+                similarity_top_k=30,
+                num_queries=num_queries,
+                mode=FUSION_MODES.RECIPROCAL_RANK,
+                use_async=True,
+                verbose=False,
+                query_gen_prompt=QUERY_GEN_PROMPT,
+            )
+            with redirect_stdout(StringIO()):
+                recall10, recall30, latencies = asyncio.run(run_config(retriever, questions, args.concurrency))
+            print(f"{mode:<10} {num_queries:>7} {recall10:>9.3f} {recall30:>9.3f} "
+                  f"{1000 * np.percentile(latencies, 50):>7.0f} {1000 * np.percentile(latencies, 99):>7.0f}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+
+"""
+Verifies and times incremental ingestion (`scripts/ingest.py`) against a local
+fake vector store and stub embedding model.
+
+Scenarios, run in order on a synthetic corpus of text files:
+    initial      empty store, every file is new
+    no-change    nothing changed: expect 0 embedding calls, 0 upserts, 0 deletes
+    edit         one file modified, one deleted, one added
+    crash        the store fails mid-file; the next run resumes from the checkpoint
+
+Usage (from backend/):
+    python benchmarks/ingest_incremental.py --files 20
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Add the project root and scripts/ to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+# Settings requires provider keys; the stubs never use them.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("PINECONE_API_KEY", "pc-benchmark")
+
+from ingest import ingest_incremental
+from benchmarks.stubs import StubEmbedding, StubVectorStore, WORDS
+
+
+class CrashingVectorStore(StubVectorStore):
+    """Raises on the N-th upsert to simulate a crashed ingest run."""
+
+    fail_on_upsert: int = 0
+
+    def add(self, nodes, **add_kwargs):
+        if self.fail_on_upsert and self.upserts + 1 == self.fail_on_upsert:
+            raise RuntimeError("simulated crash")
+        return super().add(nodes, **add_kwargs)
+
+
+def write_book(data_dir, name, seed, sentences=400):
+    text = ". ".join(
+        " ".join(WORDS[(seed * 31 + i * 7 + j * 3) % len(WORDS)] for j in range(8 + (i + seed) % 9))
+        for i in range(sentences)
+    )
+    with open(os.path.join(data_dir, name), "w") as f:
+        f.write(text + ".")
+
+
+def run(label, data_dir, store, manifest_path, max_retries=None):
+    embed_model = StubEmbedding(latency=0.0)
+    calls_before, upserts_before, deletes_before = embed_model.calls, store.upserts, store.deletes
+    start = time.perf_counter()
+    error = ""
+    try:
+        stats = ingest_incremental(data_dir, store, embed_model, manifest_path, log=lambda *_: None,
+                                   workers=2, max_retries=max_retries)
+    except RuntimeError as e:
+        stats, error = {}, str(e)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {elapsed:>7.2f}s {embed_model.calls - calls_before:>11} "
+          f"{store.upserts - upserts_before:>8} {store.deletes - deletes_before:>8} {len(store.nodes):>8}  "
+          f"{error or {k: v for k, v in stats.items() if v and isinstance(v, int)}}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="ingest-bench-")
+    data_dir = os.path.join(workdir, "data")
+    os.makedirs(data_dir)
+    manifest_path = os.path.join(workdir, "manifest.json")
+    try:
+        for i in range(args.files):
+            write_book(data_dir, f"book_{i:03d}.txt", seed=i)
+
+        store = CrashingVectorStore(latency=0.0)
+        print(f"{'scenario':<10} {'time':>8} {'embed calls':>11} {'upserts':>8} {'deletes':>8} {'vectors':>8}  stats")
+        run("initial", data_dir, store, manifest_path)
+        run("no-change", data_dir, store, manifest_path)
+
+        write_book(data_dir, "book_000.txt", seed=1000)
+        os.remove(os.path.join(data_dir, "book_001.txt"))
+        write_book(data_dir, "book_new.txt", seed=2000)
+        run("edit", data_dir, store, manifest_path)
+
+        write_book(data_dir, "book_crash.txt", seed=3000, sentences=4000)
+        store.fail_on_upsert = store.upserts + 2
+        run("crash", data_dir, store, manifest_path, max_retries=0)
+        store.fail_on_upsert = 0
+        run("resume", data_dir, store, manifest_path)
+        run("no-change", data_dir, store, manifest_path)
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+
+"""
+Ingestion throughput for different batch sizes and embedding concurrency.
+
+Ingests a synthetic corpus into the fake vector store with a stub embedding
+model that takes `--embed-latency` seconds per request, and reports pages/sec,
+chunks/sec and embeddings/sec for each configuration.
+
+Usage (from backend/):
+    python benchmarks/ingest_throughput.py --files 40 --configs 10x1 100x1 100x4 100x8
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+# Add the project root and scripts/ to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+# Settings requires provider keys; the stubs never use them.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+os.environ.setdefault("PINECONE_API_KEY", "pc-benchmark")
+
+from ingest import ingest_incremental
+from benchmarks.ingest_incremental import write_book
+from benchmarks.stubs import StubEmbedding, StubVectorStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=40)
+    parser.add_argument("--workers", type=int, default=4, help="Parsing processes")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Seconds per embedding request")
+    parser.add_argument("--configs", nargs="+", default=["10x1", "100x1", "100x4", "100x8"],
+                        help="BATCHxCONCURRENCY pairs")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="ingest-throughput-")
+    data_dir = os.path.join(workdir, "data")
+    os.makedirs(data_dir)
+    try:
+        for i in range(args.files):
+            write_book(data_dir, f"book_{i:03d}.txt", seed=i)
+
+        print(f"{'batch':>6} {'conc':>5} {'seconds':>8} {'pages/s':>8} {'chunks/s':>9} {'embeds/s':>9} {'embed calls':>11}")
+        for config in args.configs:
+            batch_size, concurrency = (int(x) for x in config.split("x"))
+            embed_model = StubEmbedding(latency=args.embed_latency, embed_batch_size=batch_size)
+            store = StubVectorStore(latency=0.0)
+            manifest_path = os.path.join(workdir, f"manifest-{config}.json")
+            stats = ingest_incremental(
+                data_dir, store, embed_model, manifest_path, log=lambda *_: None,
+                workers=args.workers, batch_size=batch_size, embed_concurrency=concurrency,
+            )
+            seconds = stats["seconds"]
+            print(f"{batch_size:>6} {concurrency:>5} {seconds:>7.2f}s {stats['pages'] / seconds:>8.1f} "
+                  f"{stats['chunks_upserted'] / seconds:>9.1f} {stats['embeddings'] / seconds:>9.1f} "
+                  f"{embed_model.calls:>11}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+
+"""
+Recall@k and latency of the local vector index (`VECTOR_BACKEND=local`)
+against brute-force exact search.
+
+Builds a `LocalVectorStore` from synthetic clustered embeddings, then for each
+mode (exact, and IVF at several probe counts) reports recall@k against a
+float64 full-sort ground truth and per-query latency. Also times answering the
+fusion retriever's 3 generated queries as one batched matrix multiply.
+
+Usage (from backend/):
+    python benchmarks/local_index.py --nodes 5000 --dim 1536 --ivf-lists 64
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Add the project root to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Settings requires provider keys; the benchmark never uses them.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+from app.services.local_vector_store import LocalVectorStore
+from benchmarks.stubs import BOOKS
+
+
+def clustered_vectors(n, dim, clusters, rng):
+    centers = rng.standard_normal((clusters, dim))
+    vectors = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def percentile_ms(samples, q):
+    return 1000 * float(np.percentile(samples, q))
+
+
+def run_mode(label, store, queries, truth, k):
+    latencies, recalls = [], []
+    for vector, expected in zip(queries, truth):
+        start = time.perf_counter()
+        result = store.query(VectorStoreQuery(query_embedding=vector.tolist(), similarity_top_k=k))
+        latencies.append(time.perf_counter() - start)
+        recalls.append(len(set(result.ids) & expected) / k)
+    print(f"{label:<16} {np.mean(recalls):>9.3f} {percentile_ms(latencies, 50):>8.2f} {percentile_ms(latencies, 99):>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=5000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=15)
+    parser.add_argument("--ivf-lists", type=int, default=64)
+    parser.add_argument("--probes", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = clustered_vectors(args.nodes, args.dim, clusters=max(8, args.nodes // 100), rng=rng)
+    queries = vectors[rng.integers(0, args.nodes, args.queries)] + 0.05 * rng.standard_normal((args.queries, args.dim))
+    queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+    # Ground truth: float64 scores, full sort
+    ids = [f"chunk-{i}" for i in range(args.nodes)]
+    scores = queries.astype(np.float64) @ vectors.astype(np.float64).T
+    truth = [{ids[i] for i in np.argsort(-row)[:args.top_k]} for row in scores]
+
+    workdir = tempfile.mkdtemp(prefix="local-index-")
+    try:
+        store = LocalVectorStore(persist_dir=workdir, ivf_lists=args.ivf_lists)
+        nodes = [
+            TextNode(id_=ids[i], text=f"chunk {i}", embedding=vectors[i].tolist(),
+                     metadata={"file_name": BOOKS[i % len(BOOKS)]})
+            for i in range(args.nodes)
+        ]
+        start = time.perf_counter()
+        for i in range(0, len(nodes), 100):
+            store.add(nodes[i:i + 100])
+        build_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        store.compact()
+        compact_seconds = time.perf_counter() - start
+        print(f"{args.nodes} x {args.dim} vectors: add {build_seconds:.2f}s, "
+              f"compact + IVF({args.ivf_lists}) {compact_seconds:.2f}s")
+
+        print(f"{'mode':<16} {'recall@' + str(args.top_k):>9} {'p50 ms':>8} {'p99 ms':>8}")
+        exact = LocalVectorStore(persist_dir=workdir)  # reopened from disk, IVF off
+        run_mode("exact", exact, queries, truth, args.top_k)
+        for probes in args.probes:
+            store.ivf_probes = probes
+            run_mode(f"ivf probes={probes}", store, queries, truth, args.top_k)
+
+        # The fusion retriever issues 3 queries per turn
+        batches = [queries[i:i + 3] for i in range(0, len(queries) - 2, 3)]
+        start = time.perf_counter()
+        for batch in batches:
+            for vector in batch:
+                exact.query(VectorStoreQuery(query_embedding=vector.tolist(), similarity_top_k=args.top_k))
+        separate = (time.perf_counter() - start) / len(batches)
+        start = time.perf_counter()
+        for batch in batches:
+            exact.batch_query([VectorStoreQuery(query_embedding=v.tolist(), similarity_top_k=args.top_k)
+                               for v in batch])
+        batched = (time.perf_counter() - start) / len(batches)
+        print(f"3 queries/turn, exact: {1000 * separate:.2f} ms separately, {1000 * batched:.2f} ms batched")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Overhead of the hot-path instrumentation behind GET /api/v1/metrics.
+
+1. Per-operation cost (microseconds) of what a chat turn does for metrics:
+   a histogram observation, a `stage_timer.stage` block with METRICS_ENABLED
+   on and off, token counting of one LLM call with provider-reported usage and
+   with the local tokenizer fallback, and rendering the exposition text.
+2. Per turn: how many of those operations one chat turn performs (stage
+   records, LLM end events, other instrumentation events seen by the token
+   handler) and the resulting instrumentation time per turn.
+3. End-to-end: sequential turns through `ChatService.astream_chat` against
+   zero-latency stubs (so the instrumentation is the largest possible share of
+   a turn), with METRICS_ENABLED on and off, interleaved in rounds. On a busy
+   machine the run-to-run noise of this comparison is larger than (2).
+
+Usage (from backend/):
+    python benchmarks/metrics_overhead.py --turns 50 --rounds 10
+"""
+
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import statistics
+import sys
+import time
+import timeit
+from contextlib import redirect_stdout
+from io import StringIO
+
+# Add the project root to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Settings requires provider keys; the stubs never use them.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from llama_index.core.base.llms.types import ChatMessage, ChatResponse, MessageRole
+from llama_index.core.instrumentation import get_dispatcher
+from llama_index.core.instrumentation.event_handlers import BaseEventHandler
+from llama_index.core.instrumentation.events.llm import LLMChatEndEvent, LLMChatInProgressEvent
+
+from app.core.config import settings
+from app.core.metrics import REGISTRY, STAGE_SECONDS
+from app.services import stage_timer
+from app.services.token_usage import TokenUsageHandler
+from benchmarks.stubs import WORDS, build_stub_service
+
+
+class EventCounter(BaseEventHandler):
+    events: int = 0
+    llm_ends: int = 0
+
+    def handle(self, event, **kwargs):
+        self.events += 1
+        self.llm_ends += type(event).__name__ in ("LLMChatEndEvent", "LLMCompletionEndEvent")
+
+
+def per_call_us(stmt, number):
+    return 1e6 * min(timeit.repeat(stmt, number=number, repeat=5)) / number
+
+
+def micro(number):
+    def timed_stage():
+        with stage_timer.stage("embedding"):
+            pass
+
+    prompt = " ".join(WORDS[i % len(WORDS)] for i in range(3000))  # ~3k-token RAG prompt
+    answer = " ".join(WORDS[i % len(WORDS)] for i in range(400))
+    messages = [ChatMessage(role=MessageRole.SYSTEM, content="You are a sage."), ChatMessage(role=MessageRole.USER, content=prompt)]
+    response = ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=answer))
+    reported = ChatResponse(
+        message=ChatMessage(role=MessageRole.ASSISTANT, content=answer),
+        raw={"usage": {"prompt_tokens": 3000, "completion_tokens": 400}},
+    )
+    handler = TokenUsageHandler()
+    with_usage = LLMChatEndEvent(messages=messages, response=reported)
+    without_usage = LLMChatEndEvent(messages=messages, response=response)
+    other_event = LLMChatInProgressEvent(messages=messages, response=response)
+
+    stage_timer.start_turn()
+    rows = [("histogram observe", per_call_us(lambda: STAGE_SECONDS.observe(0.012, "embedding"), number))]
+    settings.METRICS_ENABLED = False
+    rows.append(("stage() metrics off", per_call_us(timed_stage, number)))
+    settings.METRICS_ENABLED = True
+    rows.append(("stage() metrics on", per_call_us(timed_stage, number)))
+    rows.append(("tokens, usage reported", per_call_us(lambda: handler.handle(with_usage), number // 10)))
+    rows.append(("tokens, tokenizer fallback", per_call_us(lambda: handler.handle(without_usage), 20)))
+    rows.append(("token handler, other event", per_call_us(lambda: handler.handle(other_event), number)))
+    rows.append(("render /metrics", per_call_us(REGISTRY.render, 200)))
+
+    print(f"{'operation':<28} {'us/call':>9}")
+    for name, us in rows:
+        print(f"{name:<28} {us:>9.2f}")
+    return dict(rows)
+
+
+def per_turn(service, costs):
+    counter = EventCounter()
+    get_dispatcher().add_event_handler(counter)
+    with redirect_stdout(StringIO()):
+        asyncio.run(run_turns(service, 1, 10_000))  # one uncached turn
+    get_dispatcher().event_handlers.remove(counter)
+    records = len(service.stage_stats.snapshot())
+    other_events = counter.events - counter.llm_ends
+    instrumentation_us = (
+        records * (costs["stage() metrics on"] - costs["stage() metrics off"])
+        + counter.llm_ends * costs["tokens, usage reported"]
+        + other_events * costs["token handler, other event"]
+    )
+    print(f"\nper turn: {records} stage records, {counter.llm_ends} LLM calls, {other_events} other events "
+          f"-> {instrumentation_us:.0f} us of instrumentation")
+    return instrumentation_us
+
+
+async def run_turns(service, turns, offset):
+    durations = []
+    for i in range(turns):
+        start = time.perf_counter()
+        async for _ in service.astream_chat(f"Question {offset + i}: how do habits shape identity?"):
+            pass
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def end_to_end(service, turns, rounds):
+    # Median turn time of each round; rounds alternate so drift hits both settings
+    results = {True: [], False: []}
+    with redirect_stdout(StringIO()):  # the fusion retriever prints its generated queries
+        asyncio.run(run_turns(service, 20, -20))  # warm up
+        for r in range(rounds):
+            for enabled in ((False, True) if r % 2 else (True, False)):
+                settings.METRICS_ENABLED = enabled
+                gc.collect()
+                results[enabled].append(statistics.median(asyncio.run(run_turns(service, turns, r * turns))))
+    settings.METRICS_ENABLED = True
+
+    print(f"\n{'end-to-end (stub, 0 latency)':<28} {'p50 ms':>9}  (median over {rounds} rounds of {turns} turns)")
+    for enabled in (False, True):
+        print(f"{'metrics ' + ('on' if enabled else 'off'):<28} {1000 * statistics.median(results[enabled]):>9.3f}")
+    off = statistics.median(results[False])
+    delta = statistics.median(results[True]) - off
+    print(f"overhead per turn: {1000 * delta:.3f} ms ({100 * delta / off:.1f}% of a zero-latency turn)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=100000, help="Iterations per micro measurement")
+    parser.add_argument("--turns", type=int, default=50, help="Turns per round and setting")
+    parser.add_argument("--rounds", type=int, default=10)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    settings.RESPONSE_CACHE_ENABLED = False  # every turn runs the full pipeline
+    settings.ADMISSION_CONTROL_ENABLED = False  # the stubs have no rate limits to budget for
+    service = build_stub_service(
+        num_nodes=2000, llm_first_token=0, llm_token=0, query_gen=0, embed=0, search=0, rerank=0,
+    )
+    costs = micro(args.number)
+    per_turn(service, costs)
+    end_to_end(service, args.turns, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Perspective coverage and latency of one global search vs partitioned retrieval
+(RETRIEVAL_PARTITIONED): the spiritual and modern sources searched concurrently
+as separate partitions and reranked separately.
+
+Builds a synthetic library over the four stub books (one spiritual, three
+modern): chunks about one of `--topics` topics, written in their perspective's
+register (its own set of words, like the Gita's "dharma" and "Arjuna" next to
+the modern books' "habit loop" and "system"). Most questions are asked in the
+modern register, like the golden set; the same topic is covered by both
+perspectives, but the modern chunks match the question's words better.
+
+Turns run through the real ChatService (hybrid retrieval over the real
+LocalVectorStore and SparseIndex, local query expansion, the stub LLM) with
+a stand-in reranker that scores chunks by embedding similarity after a
+simulated round trip of `--rerank-latency` plus `--rerank-per-doc` per
+candidate, like Cohere. The "network" backend puts a `--search-latency` round
+trip in front of every vector search, like Pinecone; "local" searches in process.
+Reported per configuration:
+    candidates    chunks sent to the reranker per turn (and rerank calls)
+    spiritual     spiritual / modern chunks kept after reranking, per turn
+    coverage      turns whose kept chunks can back the prompt's 2-3 Gita and
+                  3-4 modern citations (>= 2 spiritual and >= 3 modern)
+    on topic      kept chunks about the question's topic
+    retrieval     query expansion to fusion, p50 per turn
+    rerank        rerank stage, p50 per turn
+
+Usage (from backend/):
+    python benchmarks/partitioned_retrieval.py --chunks 5000 --questions 200
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from io import StringIO
+from typing import Any, List, Optional
+
+import numpy as np
+
+# Add the project root to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Settings requires provider keys; the benchmark never uses them.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle, TextNode
+from llama_index.core.vector_stores.types import BasePydanticVectorStore, VectorStoreQuery, VectorStoreQueryResult
+
+from app.core.config import settings
+from app.services.local_vector_store import LocalVectorStore
+from app.services.perspectives import SPIRITUAL, perspective_of, tag_perspectives
+from app.services.rag_engine import ChatService, StageTimedPostprocessor
+from app.services.sparse_index import SparseIndex, SparseRetriever
+from benchmarks.hybrid_retrieval import FILLER, BagOfWordsEmbedding, pseudo_words
+from benchmarks.stubs import BOOKS, StubLLM
+
+RETRIEVAL_STAGES = ("query_expansion", "embedding", "search", "sparse", "fusion")
+
+
+def build_library(num_chunks: int, num_topics: int, seed: int = 0):
+    """(nodes, topic words per topic, register words per perspective)."""
+    rng = random.Random(seed)
+    vocabulary = pseudo_words(3000, rng, 3)
+    topics = [rng.sample(vocabulary[:1200], 20) for _ in range(num_topics)]
+    registers = {"spiritual": vocabulary[1200:1260], "modern": vocabulary[1260:1320]}
+    general = vocabulary[1320:]
+    zipf = [1.0 / (rank + 1) for rank in range(len(general))]
+
+    nodes = []
+    for i in range(num_chunks):
+        book = BOOKS[i % len(BOOKS)]
+        topic = rng.randrange(num_topics)
+        register = registers[SPIRITUAL if "Gita" in book else "modern"]
+        words = (rng.choices(topics[topic], k=50) + rng.choices(register, k=30)
+                 + rng.choices(general, weights=zipf, k=40) + rng.choices(FILLER, k=40))
+        rng.shuffle(words)
+        nodes.append(TextNode(id_=f"chunk-{i}", text=" ".join(words),
+                              metadata={"file_name": book, "page_label": str(i // 4 + 1), "topic": topic}))
+    tag_perspectives(nodes)
+    return nodes, topics, registers
+
+
+def questions_for(topics, registers, count: int, seed: int = 1):
+    """(question, topic): three topic words and three register words, 3 in 4 in the modern register."""
+    rng = random.Random(seed)
+    questions = {}
+    while len(questions) < count:
+        topic = rng.randrange(len(topics))
+        register = registers[SPIRITUAL if rng.random() < 0.25 else "modern"]
+        words = rng.sample(topics[topic], 3) + rng.sample(register, 3)
+        rng.shuffle(words)
+        questions[f"How do {words[0]} and {words[1]} relate to {' '.join(words[2:])}?"] = topic
+    return list(questions.items())
+
+
+class NetworkVectorStore(BasePydanticVectorStore):
+    """A LocalVectorStore behind a simulated round trip per query, like Pinecone (no batch_query)."""
+
+    stores_text: bool = True
+    store: LocalVectorStore
+    latency: float = 0.08
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    def add(self, nodes, **add_kwargs: Any) -> List[str]:
+        return self.store.add(nodes)
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self.store.delete(ref_doc_id)
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        return self.store.query(query)
+
+    async def aquery(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        await asyncio.sleep(self.latency)
+        return self.store.query(query)
+
+
+class SimilarityReranker(BaseNodePostprocessor):
+    """Scores candidates by embedding similarity to the question after a simulated Cohere round trip."""
+
+    embed_model: Any
+    top_n: int = 10
+    latency: float = 0.1
+    per_doc_latency: float = 0.004
+    calls: int = 0
+    candidates: int = 0
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "SimilarityReranker"
+
+    def _postprocess_nodes(self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle] = None):
+        query = np.asarray(self.embed_model._vector(query_bundle.query_str))
+        scored = [NodeWithScore(node=n.node, score=float(
+            query @ np.asarray(self.embed_model._vector(n.node.get_content(metadata_mode=MetadataMode.NONE)))))
+            for n in nodes]
+        return sorted(scored, key=lambda n: n.score, reverse=True)[: self.top_n]
+
+    async def _apostprocess_nodes(self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle] = None):
+        self.calls += 1
+        self.candidates += len(nodes)
+        await asyncio.sleep(self.latency + self.per_doc_latency * len(nodes))
+        return self._postprocess_nodes(nodes, query_bundle)
+
+
+class KeptRecorder(BaseNodePostprocessor):
+    """Remembers the chunks kept after reranking, per question."""
+
+    kept: dict = {}
+
+    def _postprocess_nodes(self, nodes, query_bundle=None):
+        self.kept[query_bundle.query_str] = list(nodes)
+        return nodes
+
+
+async def run_turns(service, questions, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def turn(question):
+        async with semaphore:
+            breakdown = {}
+            async for _ in service.astream_chat(question, breakdown=breakdown):
+                pass
+            return breakdown["stages_ms"]
+
+    return await asyncio.gather(*(turn(q) for q, _ in questions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=5000)
+    parser.add_argument("--topics", type=int, default=30)
+    parser.add_argument("--questions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--search-latency", type=float, default=0.08, help="Network vector search round trip (s)")
+    parser.add_argument("--rerank-latency", type=float, default=0.1, help="Rerank round trip (s)")
+    parser.add_argument("--rerank-per-doc", type=float, default=0.004, help="Rerank time per candidate (s)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    settings.RESPONSE_CACHE_ENABLED = False
+    settings.QUERY_ROUTER_ENABLED = False
+    settings.QUERY_EXPANSION_MODE = "local"
+    settings.CONTEXT_PACKING_ENABLED = False  # coverage is measured on the reranked chunks
+    settings.ADMISSION_CONTROL_ENABLED = False  # the stubs have no rate limits to budget for
+
+    nodes, topics, registers = build_library(args.chunks, args.topics)
+    questions = questions_for(topics, registers, args.questions)
+    topic_of = dict(questions)
+    embed_model = BagOfWordsEmbedding(latency=0.02)
+    for node, embedding in zip(nodes, embed_model._get_text_embeddings([n.get_content() for n in nodes])):
+        node.embedding = embedding
+
+    workdir = tempfile.mkdtemp(prefix="partitions-")
+    try:
+        local_store = LocalVectorStore(persist_dir=os.path.join(workdir, "vectors"))
+        local_store.add(nodes)
+        sparse = SparseIndex(os.path.join(workdir, "sparse"))
+        sparse.add(nodes)
+        sparse.compact()
+
+        print(f"{args.chunks} chunks ({sum(perspective_of(NodeWithScore(node=n)) == SPIRITUAL for n in nodes)} "
+              f"spiritual), {len(questions)} questions, {args.concurrency} in flight")
+        print(f"{'backend':<8} {'retrieval':<12} {'candidates':>10} {'calls':>5} {'spiritual':>9} {'modern':>6} "
+              f"{'coverage':>8} {'on topic':>8} {'retrieval ms':>12} {'rerank ms':>9}")
+        for backend in ("local", "network"):
+            for partitioned in (False, True):
+                settings.RETRIEVAL_PARTITIONED = partitioned
+                vector_store = (local_store if backend == "local"
+                                else NetworkVectorStore(store=local_store, latency=args.search_latency))
+                reranker = SimilarityReranker(embed_model=embed_model, latency=args.rerank_latency,
+                                              per_doc_latency=args.rerank_per_doc)
+                llm = StubLLM(first_token_latency=0, token_latency=0, num_tokens=5)
+                service = ChatService.from_components(llm, embed_model, vector_store, reranker,
+                                                      SparseRetriever(sparse, similarity_top_k=settings.SPARSE_TOP_K))
+                recorder = KeptRecorder(kept={})
+                position = next(i for i, p in enumerate(service._node_postprocessors)
+                                if isinstance(p, StageTimedPostprocessor) and p.stage == "rerank")
+                service._node_postprocessors.insert(position + 1, recorder)
+
+                with redirect_stdout(StringIO()):  # the fusion retriever prints its generated queries
+                    stages = asyncio.run(run_turns(service, questions, args.concurrency))
+                kept = [recorder.kept[q] for q, _ in questions]
+                spiritual = [sum(perspective_of(n) == SPIRITUAL for n in nodes) for nodes in kept]
+                modern = [len(nodes) - s for nodes, s in zip(kept, spiritual)]
+                covered = np.mean([s >= 2 and m >= 3 for s, m in zip(spiritual, modern)])
+                on_topic = np.mean([n.node.metadata["topic"] == topic_of[q]
+                                    for q, _ in questions for n in recorder.kept[q]])
+                retrieval = [sum(s.get(name, 0.0) for name in RETRIEVAL_STAGES) for s in stages]
+                rerank = [s.get("rerank", 0.0) for s in stages]
+                print(f"{backend:<8} {'partitioned' if partitioned else 'global':<12} "
+                      f"{reranker.candidates / len(questions):>10.1f} {reranker.calls / len(questions):>5.1f} "
+                      f"{np.mean(spiritual):>9.2f} {np.mean(modern):>6.2f} {covered:>8.1%} {on_topic:>8.1%} "
+                      f"{np.percentile(retrieval, 50):>12.1f} {np.percentile(rerank, 50):>9.1f}")
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
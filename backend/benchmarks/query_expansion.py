@@ -0,0 +1,98 @@
+
+"""
+Per-stage latency of a chat turn for each query expansion mode, with and
+without the conversational pre-classifier.
+
+Runs `ChatService.astream_chat` over stub backends (see stubs.py) on a workload
+of repeated book questions (with casing/spacing variations) mixed with small
+talk. The response cache is disabled so every turn runs the pipeline. Reports the
+mean of each stage recorded by `stage_timer` and the share of turns that skipped
+retrieval.
+
+Usage (from backend/):
+    python benchmarks/query_expansion.py --turns 60 --query-gen 0.5
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from contextlib import redirect_stdout
+from io import StringIO
+
+# Add the project root to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Settings requires provider keys; the stubs never use them.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from app.core.config import settings
+from benchmarks.stubs import build_stub_service
+
+QUESTIONS = [
+    "How do I build better habits?",
+    "What does the Gita say about doing my duty without attachment?",
+    "How can I stop procrastinating?",
+    "How do I find my purpose in life?",
+    "How should I deal with anxiety about results?",
+    "Why do small habits compound over time?",
+    "How do I stay disciplined when motivation fades?",
+    "What is the role of identity in behavior change?",
+]
+SMALL_TALK = ["Hi", "Who are you?", "thanks!", "Write a Python script to sort a list"]
+STAGES = ["routing", "query_expansion", "embedding", "search", "fusion", "rerank", "first_token", "total"]
+
+
+def workload(turns):
+    messages = []
+    for i in range(turns):
+        if i % 5 == 4:
+            messages.append(SMALL_TALK[(i // 5) % len(SMALL_TALK)])
+        else:
+            question = QUESTIONS[i % len(QUESTIONS)]
+            messages.append(question.upper() if i % 3 == 0 else f"  {question} ")
+    return messages
+
+
+async def run(mode, router, messages, latencies):
+    settings.QUERY_EXPANSION_MODE = mode
+    settings.QUERY_ROUTER_ENABLED = router
+    service = build_stub_service(**latencies)
+    for message in messages:
+        async for _ in service.astream_chat(message):
+            pass
+    return service.stage_stats.snapshot()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--query-gen", type=float, default=0.5, help="Seconds per query generation completion")
+    parser.add_argument("--modes", nargs="+", default=["llm", "cached", "local", "off"])
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    settings.RESPONSE_CACHE_ENABLED = False
+    settings.ADMISSION_CONTROL_ENABLED = False  # the stubs have no rate limits to budget for
+    latencies = dict(query_gen=args.query_gen, llm_token=0.0)
+    messages = workload(args.turns)
+
+    header = f"{'mode':<8} {'router':<6} {'no-retr':>7} " + " ".join(f"{stage:>15}" for stage in STAGES)
+    print("mean milliseconds per turn that ran the stage")
+    print(header)
+    for mode in args.modes:
+        for router in (False, True):
+            # QueryFusionRetriever(verbose=True) prints the generated queries
+            with redirect_stdout(StringIO()):
+                stats = asyncio.run(run(mode, router, messages, latencies))
+            skipped = 1 - stats.get("search", {"count": 0})["count"] / len(messages)
+            cells = " ".join(
+                f"{1000 * stats[stage]['mean_seconds']:>15.1f}" if stage in stats else f"{'-':>15}"
+                for stage in STAGES
+            )
+            print(f"{mode:<8} {'on' if router else 'off':<6} {skipped:>7.0%} {cells}")
+
+
+if __name__ == "__main__":
+    main()
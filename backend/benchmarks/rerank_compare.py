@@ -0,0 +1,121 @@
+
+"""
+Latency and ranking agreement of the local cross-encoder reranker
+(`RERANKER=local`) against the current pipeline on the eval question set.
+
+For every question in evals/results/eval_results.csv the real fusion retriever
+produces the candidates once (needs OPENAI_API_KEY and the vector index), then:
+    reference   CohereRerank(top_n=10) when COHERE_API_KEY is set, otherwise
+                the fusion order (what the pipeline serves without a reranker)
+    local cold  LocalCrossEncoderRerank with an empty score cache
+    local warm  the same question again, served from the score cache
+Agreement is overlap@10 with the reference top 10 and Kendall tau over the
+passages both rankings kept. Requires `pip install sentence-transformers`.
+
+Usage (from backend/):
+    python benchmarks/rerank_compare.py --model cross-encoder/ms-marco-MiniLM-L-6-v2
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+
+# Add the project root to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from llama_index.core.schema import QueryBundle
+
+from app.core.clients import cohere_rerank
+from app.core.config import settings
+from app.services.rag_engine import get_chat_service
+from app.services.reranker import LocalCrossEncoderRerank
+
+EVAL_QUESTIONS = os.path.join(os.path.dirname(__file__), '..', 'evals', 'results', 'eval_results.csv')
+
+
+def kendall_tau(reference, candidate):
+    """Kendall tau between two rankings, over the items they share."""
+    shared = [item for item in reference if item in candidate]
+    position = {item: i for i, item in enumerate(candidate)}
+    concordant = discordant = 0
+    for i in range(len(shared)):
+        for j in range(i + 1, len(shared)):
+            if position[shared[i]] < position[shared[j]]:
+                concordant += 1
+            else:
+                discordant += 1
+    pairs = concordant + discordant
+    return (concordant - discordant) / pairs if pairs else float("nan")
+
+
+async def main_async(args):
+    questions = pd.read_csv(EVAL_QUESTIONS)["Question"].tolist()
+    service = get_chat_service()
+
+    reference = None
+    if settings.COHERE_API_KEY:
+        reference = cohere_rerank(top_n=10)
+    local = LocalCrossEncoderRerank(model=args.model, batch_size=args.batch_size, max_length=args.max_length)
+
+    rows = []
+    for question in questions:
+        bundle = QueryBundle(question)
+        with redirect_stdout(StringIO()):  # the fusion retriever prints its generated queries
+            candidates = await service._retriever.aretrieve(bundle)
+
+        start = time.perf_counter()
+        if reference is not None:
+            expected = await reference.apostprocess_nodes(candidates, query_bundle=bundle)
+        else:
+            expected = candidates[:10]
+        reference_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cold = await local.apostprocess_nodes(candidates, query_bundle=bundle)
+        cold_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        await local.apostprocess_nodes(candidates, query_bundle=bundle)
+        warm_seconds = time.perf_counter() - start
+
+        expected_ids = [n.node.node_id for n in expected]
+        actual_ids = [n.node.node_id for n in cold]
+        rows.append({
+            "candidates": len(candidates),
+            "reference_ms": 1000 * reference_seconds,
+            "local_cold_ms": 1000 * cold_seconds,
+            "local_warm_ms": 1000 * warm_seconds,
+            "overlap@10": len(set(expected_ids) & set(actual_ids)) / max(1, len(expected_ids)),
+            "kendall_tau": kendall_tau(expected_ids, actual_ids),
+        })
+
+    df = pd.DataFrame(rows)
+    print(f"reference: {'CohereRerank' if reference is not None else 'fusion order (no reranker)'}; "
+          f"local: {args.model} (batch {args.batch_size}, max_length {args.max_length})")
+    print(df.round(3).to_string())
+    print("\nmean:")
+    print(df.mean(numeric_only=True).round(3).to_string())
+    print(f"p50 local cold {np.percentile(df['local_cold_ms'], 50):.1f} ms, "
+          f"p50 reference {np.percentile(df['reference_ms'], 50):.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default=settings.LOCAL_RERANK_MODEL)
+    parser.add_argument("--batch-size", type=int, default=settings.LOCAL_RERANK_BATCH_SIZE)
+    parser.add_argument("--max-length", type=int, default=settings.LOCAL_RERANK_MAX_LENGTH)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
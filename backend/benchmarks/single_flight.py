@@ -0,0 +1,125 @@
+"""
+Upstream calls and latency for a burst of duplicate chat requests, with and
+without single-flight coalescing (SINGLE_FLIGHT_ENABLED).
+
+`--burst` clients send the same question at once through the real FastAPI app
+(in process, over httpx's ASGI transport) with the stub pipeline: a network
+vector store, the embedding cache over the stub embedding model, and cached
+LLM query expansion.
+    first turn  the same question with no history: whole turns are shared
+    follow-up   the same question after a different first turn per client: the
+                turns run separately, their identical embedding, query
+                expansion and search calls are shared
+Reported per scenario: upstream calls made for the burst, median and slowest
+time to the complete answer (the ASGI transport delivers bodies whole), CPU
+seconds for the burst (server and clients share the process), and whether every
+client got the same answer.
+
+Usage (from backend/):
+    python benchmarks/single_flight.py --burst 50
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from io import StringIO
+
+import httpx
+
+# Add the project root to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Settings requires provider keys; the stubs never use them.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from app.core.config import settings
+from app.main import app
+from app.services.embedding_cache import wrap_with_cache
+from app.services.rag_engine import ChatService
+from app.services.warmup import readiness
+from benchmarks.stubs import StubEmbedding, StubLLM, StubReranker, StubVectorStore, fake_corpus
+
+QUESTION = "How do small habits shape who I become?"
+
+
+def build_service(cache_dir):
+    llm = StubLLM(first_token_latency=0.3, token_latency=0.01, query_gen_latency=0.5, num_tokens=100)
+    embed_model = StubEmbedding(latency=0.05)
+    vector_store = StubVectorStore(latency=0.08, nodes=fake_corpus(2000))
+    reranker = StubReranker(latency=0.15)
+    service = ChatService.from_components(llm, wrap_with_cache(embed_model, cache_dir), vector_store, reranker)
+    return service, {"answer": lambda: llm.calls, "query gen": lambda: llm.query_gen_calls,
+                     "embed": lambda: embed_model.calls, "search": lambda: vector_store.queries,
+                     "rerank": lambda: reranker.calls}
+
+
+async def ask(client, messages):
+    start = time.perf_counter()
+    response = await client.post("/api/v1/chat", json={"messages": messages})
+    response.raise_for_status()
+    answer = "".join(json.loads(line[2:]) for line in response.text.splitlines() if line.startswith("0:"))
+    return time.perf_counter() - start, answer
+
+
+async def burst(client, scenario, size):
+    if scenario == "first turn":
+        conversations = [[{"role": "user", "content": QUESTION}] for _ in range(size)]
+    else:
+        conversations = [[{"role": "user", "content": f"Hello, I am reader {i}"},
+                          {"role": "assistant", "content": f"Welcome, reader {i}."},
+                          {"role": "user", "content": QUESTION}] for i in range(size)]
+    return await asyncio.gather(*(ask(client, messages) for messages in conversations))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--burst", type=int, default=50, help="Duplicate requests sent at once")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    settings.RESPONSE_CACHE_ENABLED = True  # a burst arrives before the first answer is cached
+    settings.CHAT_MAX_CONCURRENCY = args.burst + 1
+    settings.ADMISSION_CONTROL_ENABLED = False  # the stubs have no rate limits to budget for
+    settings.QUERY_EXPANSION_MODE = "cached"
+
+    print(f"burst of {args.burst} identical questions")
+    print(f"{'scenario':<11} {'single-flight':<13} {'answer':>6} {'query gen':>9} {'embed':>6} {'search':>6} "
+          f"{'rerank':>6} {'answer p50':>10} {'max':>6} {'cpu s':>6} {'same answer':>11}")
+    for scenario in ("first turn", "follow-up"):
+        for enabled in (False, True):
+            settings.SINGLE_FLIGHT_ENABLED = enabled
+            cache_dir = tempfile.mkdtemp(prefix="single-flight-")
+            try:
+                service, counters = build_service(cache_dir)
+                readiness.service = service  # skip the warm-up probe, which would count as upstream calls
+
+                async def run():
+                    transport = httpx.ASGITransport(app=app)
+                    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=300) as client:
+                        return await burst(client, scenario, args.burst)
+
+                cpu = time.process_time()
+                with redirect_stdout(StringIO()):  # the fusion retriever prints its generated queries
+                    results = asyncio.run(run())
+                cpu = time.process_time() - cpu
+            finally:
+                shutil.rmtree(cache_dir)
+
+            calls = {name: counter() for name, counter in counters.items()}
+            seconds = [r[0] for r in results]
+            print(f"{scenario:<11} {'on' if enabled else 'off':<13} {calls['answer']:>6} {calls['query gen']:>9} "
+                  f"{calls['embed']:>6} {calls['search']:>6} {calls['rerank']:>6} "
+                  f"{1000 * statistics.median(seconds):>8.0f}ms {1000 * max(seconds):>4.0f}ms {cpu:>6.2f} "
+                  f"{'yes' if len({r[1] for r in results}) == 1 else 'no':>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Startup cost of the API: import time, time until the liveness and readiness
+probes pass, and the latency of the first chat request.
+
+Each mode runs in a fresh interpreter (so imports are cold) serving the real
+app under uvicorn, with the stub pipeline built by the app's warm-up
+(`readiness.factory`). The factory imports llama_index like the real one.
+    warm-up   WARMUP_ON_STARTUP=true: the pipeline is built and probed at boot
+    lazy      WARMUP_ON_STARTUP=false: the first request builds the pipeline
+              (the old behaviour, minus the heavy imports on the app import path)
+Times are seconds since the interpreter started running this script.
+
+Usage (from backend/):
+    python benchmarks/startup.py
+"""
+
+import time
+
+STARTED = time.perf_counter()
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+
+# Add the project root to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Settings requires provider keys; the stubs never use them.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+
+def build_stub():
+    from benchmarks.stubs import build_stub_service
+
+    return build_stub_service()
+
+
+def chat(base_url, question):
+    """(time to first text, total) of one streamed chat request."""
+    import httpx
+
+    start = time.perf_counter()
+    first = None
+    with httpx.stream("POST", f"{base_url}/api/v1/chat", json={"messages": [{"role": "user", "content": question}]},
+                      timeout=120) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if first is None and line.startswith("0:"):  # after the sources frame
+                first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+def wait_for(url, status=200):
+    import httpx
+
+    while True:
+        try:
+            if httpx.get(url, timeout=5).status_code == status:
+                return time.perf_counter() - STARTED
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+
+
+def child(warm_up):
+    import logging
+
+    start = time.perf_counter()
+    from app.main import app
+    import_seconds = time.perf_counter() - start
+
+    import uvicorn
+
+    from app.core.config import settings
+    from app.services.warmup import readiness
+
+    logging.getLogger().setLevel(logging.WARNING)
+    settings.WARMUP_ON_STARTUP = warm_up
+    readiness.factory = build_stub
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    base_url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+
+    live = wait_for(f"{base_url}/api/v1/health/live")
+    ready = wait_for(f"{base_url}/api/v1/health/ready") if warm_up else None
+    first_ttft, first_total = chat(base_url, "How do small habits shape identity?")
+    warm_ttft, warm_total = chat(base_url, "What does the Gita say about duty?")
+    server.should_exit = True
+    thread.join(timeout=5)
+    print(json.dumps({
+        "import": import_seconds, "live": live, "ready": ready,
+        "first_ttft": first_ttft, "first_total": first_total, "warm_ttft": warm_ttft,
+    }))
+
+
+def run_child(mode):
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", mode], capture_output=True, text=True, check=True,
+        cwd=os.path.join(os.path.dirname(__file__), '..'),
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def import_seconds(module):
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.join(os.path.dirname(__file__), '..')).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--child", choices=["warm-up", "lazy"])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per mode (the median is reported)")
+    args = parser.parse_args()
+    if args.child:
+        child(args.child == "warm-up")
+        return
+
+    print(f"import app.services.rag_engine (was on the app import path): {import_seconds('app.services.rag_engine'):.2f}s")
+    print(f"{'mode':<8} {'import':>7} {'live':>7} {'ready':>7} {'1st ttft':>9} {'1st total':>10} {'warm ttft':>10}")
+    for mode in ("warm-up", "lazy"):
+        runs = [run_child(mode) for _ in range(args.repeat)]
+        median = {key: sorted(r[key] for r in runs)[len(runs) // 2] if runs[0][key] is not None else None for key in runs[0]}
+        ready = f"{median['ready']:>6.2f}s" if median["ready"] is not None else f"{'-':>7}"
+        print(f"{mode:<8} {median['import']:>6.2f}s {median['live']:>6.2f}s {ready} {median['first_ttft']:>8.2f}s "
+              f"{median['first_total']:>9.2f}s {median['warm_ttft']:>9.2f}s")
+
+
+if __name__ == "__main__":
+    main()
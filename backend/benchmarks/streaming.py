@@ -0,0 +1,156 @@
+"""
+Server CPU per streamed chat response and throughput under concurrent streams.
+
+The real app runs under uvicorn in a child process with the stub pipeline
+(`--tokens` answer tokens at `--token-rate` tokens/s per stream); the parent
+opens `--concurrency` streams at once, several rounds per level.
+    per-token  STREAM_FLUSH_INTERVAL_MS=0: one frame and one send per token
+    coalesced  the shipped STREAM_FLUSH_INTERVAL_MS / STREAM_FLUSH_CHARS
+Reported per level: server CPU ms per response (from /proc, so Linux only),
+responses and tokens per second, frames per response, and the median time to
+the first text frame and to the end of the stream.
+
+Usage (from backend/):
+    python benchmarks/streaming.py --concurrency 1,50,200
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+# Add the project root to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+# Settings requires provider keys; the stubs never use them.
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+QUESTION = "How do small habits shape who I become?"
+
+
+def child(port, tokens, token_rate):
+    import logging
+
+    import uvicorn
+
+    from app.core.config import settings
+    from app.main import app
+    from app.services.warmup import readiness
+    from benchmarks.stubs import build_stub_service
+
+    logging.getLogger().setLevel(logging.WARNING)
+    settings.RESPONSE_CACHE_ENABLED = False  # every stream runs the pipeline
+    service = build_stub_service(500, llm_first_token=0.2, llm_token=1 / token_rate, query_gen=0.05,
+                                 embed=0.02, search=0.02, rerank=0.02)
+    service._llm.num_tokens = tokens
+    readiness.factory = lambda: service
+    # Keep idle connections between rounds (streams that finish early wait for the slowest)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", access_log=False, timeout_keep_alive=300)
+
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def stream(client, url):
+    start = time.perf_counter()
+    first = None
+    frames = 0
+    async with client.stream("POST", url, json={"messages": [{"role": "user", "content": QUESTION}]}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            frames += 1
+            if first is None and line.startswith("0:"):
+                first = time.perf_counter() - start
+    return first, time.perf_counter() - start, frames
+
+
+async def level(url, pid, concurrency, rounds):
+    import httpx
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=300, limits=limits) as client:
+        await stream(client, url)  # open the pool, warm the pipeline
+        cpu, start = cpu_seconds(pid), time.perf_counter()
+        results = []
+        for _ in range(rounds):
+            results += await asyncio.gather(*(stream(client, url) for _ in range(concurrency)))
+        wall, cpu = time.perf_counter() - start, cpu_seconds(pid) - cpu
+    return {
+        "responses": len(results),
+        "cpu_ms": 1000 * cpu / len(results),
+        "responses_per_s": len(results) / wall,
+        "frames": statistics.mean(r[2] for r in results),
+        "first_text_ms": 1000 * statistics.median(r[0] for r in results),
+        "total_ms": 1000 * statistics.median(r[1] for r in results),
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(base_url):
+    import httpx
+
+    while True:
+        try:
+            if httpx.get(f"{base_url}/api/v1/health/ready", timeout=5).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--concurrency", default="1,50,200", help="Concurrent streams per level")
+    parser.add_argument("--rounds", type=int, default=3, help="Rounds of concurrent streams per level")
+    parser.add_argument("--tokens", type=int, default=300, help="Tokens per answer")
+    parser.add_argument("--token-rate", type=float, default=100, help="Tokens/s per stream")
+    parser.add_argument("--modes", default="per-token,coalesced")
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.tokens, args.token_rate)
+        return
+
+    levels = [int(c) for c in args.concurrency.split(",")]
+    modes = {"per-token": {"STREAM_FLUSH_INTERVAL_MS": "0"}, "coalesced": {}}
+    print(f"{args.tokens}-token answers at {args.token_rate:.0f} tokens/s per stream, {args.rounds} rounds per level")
+    print(f"{'mode':<10} {'streams':>7} {'cpu ms/resp':>11} {'resp/s':>7} {'tokens/s':>9} {'frames':>7} "
+          f"{'first text':>10} {'total':>8}")
+    for mode in args.modes.split(","):
+        port = free_port()
+        env = {**os.environ, "CHAT_MAX_CONCURRENCY": str(max(levels) + 1), "ADMISSION_CONTROL_ENABLED": "false",
+               "WARMUP_ON_STARTUP": "true", **modes[mode]}
+        process = subprocess.Popen([sys.executable, __file__, "--child", str(port), "--tokens", str(args.tokens),
+                                    "--token-rate", str(args.token_rate)],
+                                   cwd=os.path.join(os.path.dirname(__file__), '..'), env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        base_url = f"http://127.0.0.1:{port}"
+        try:
+            wait_ready(base_url)
+            for concurrency in levels:
+                r = asyncio.run(level(f"{base_url}/api/v1/chat", process.pid, concurrency, args.rounds))
+                print(f"{mode:<10} {concurrency:>7} {r['cpu_ms']:>11.1f} {r['responses_per_s']:>7.1f} "
+                      f"{r['responses_per_s'] * args.tokens:>9.0f} {r['frames']:>7.1f} "
+                      f"{r['first_text_ms']:>8.0f}ms {r['total_ms']:>6.0f}ms")
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+"""
+Local stand-ins for the OpenAI, Pinecone and Cohere APIs, for running the real
+provider SDKs (and so the real app) without network access or keys.
+
+    POST /v1/embeddings         OpenAI embeddings (deterministic pseudo-vectors)
+    POST /v1/chat/completions   OpenAI chat, plain or streamed (SSE, usage on the last chunk)
+    POST /v2/rerank             Cohere v2 rerank
+    POST /query                 Pinecone query over a synthetic corpus, with metadata filters
+
+Every request takes `--service-time` seconds before it answers; streamed answers
+then take `--first-token` seconds to the first token and `--token-latency`
+between tokens. Point the app at it with:
+    OPENAI_API_BASE=http://127.0.0.1:8100/v1
+    PINECONE_INDEX_HOST=http://127.0.0.1:8100
+    COHERE_BASE_URL=http://127.0.0.1:8100
+plus any non-empty OPENAI_API_KEY, PINECONE_API_KEY and COHERE_API_KEY.
+
+Usage (from backend/):
+    python benchmarks/stub_server.py --port 8100 --first-token 0.3 --token-latency 0.01
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+# Add the project root to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+
+from benchmarks.stubs import WORDS, fake_corpus, fake_embedding
+
+SERVICE_TIME = 0.02  # server-side processing per request (s)
+
+
+def _matches(metadata, condition) -> bool:
+    """Pinecone filter semantics for equality, $eq/$ne/$in/$nin, $and and $or."""
+    for key, value in condition.items():
+        if key == "$and":
+            if not all(_matches(metadata, c) for c in value):
+                return False
+        elif key == "$or":
+            if not any(_matches(metadata, c) for c in value):
+                return False
+        elif isinstance(value, dict):
+            actual = metadata.get(key)
+            for op, operand in value.items():
+                if op == "$eq" and actual != operand or op == "$ne" and actual == operand:
+                    return False
+                if op == "$in" and actual not in operand or op == "$nin" and actual in operand:
+                    return False
+        elif metadata.get(key) != value:
+            return False
+    return True
+
+
+def stub_upstream_app(num_nodes=500, dim=256, service_time=SERVICE_TIME,
+                      first_token_latency=0.0, token_latency=0.0, answer_tokens=50) -> FastAPI:
+    """OpenAI chat/embeddings, Cohere v2 rerank and Pinecone query, in one app.
+
+    `app.state.calls` counts requests per endpoint.
+    """
+    app = FastAPI()
+    app.state.calls = Counter()
+    nodes = fake_corpus(num_nodes)
+    metadata = [node_to_metadata_dict(node, remove_text=False, flat_metadata=False) for node in nodes]
+    candidates = {}  # filter (as JSON) -> indices of the matching nodes
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", "calls": dict(app.state.calls)}
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        app.state.calls["embeddings"] += 1
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(service_time)
+        return {
+            "object": "list", "model": body["model"],
+            "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(str(text), dim)}
+                     for i, text in enumerate(inputs)],
+            "usage": {"prompt_tokens": 10, "total_tokens": 10},
+        }
+
+    @app.post("/v1/chat/completions")
+    async def chat(request: Request):
+        app.state.calls["chat"] += 1
+        body = await request.json()
+        prompt = " ".join(str(m.get("content")) for m in body["messages"])
+        query_gen = "search queries" in prompt
+        text = "\n".join(" ".join(WORDS[(k * 5 + j) % len(WORDS)] for j in range(4)) for k in range(3)) if query_gen \
+            else " ".join(WORDS[i % len(WORDS)] for i in range(answer_tokens))
+        usage = {"prompt_tokens": len(prompt.split()), "completion_tokens": len(text.split()),
+                 "total_tokens": len(prompt.split()) + len(text.split())}
+        base = {"id": "chatcmpl-stub", "created": int(time.time()), "model": body["model"]}
+        await asyncio.sleep(service_time)
+        if not body.get("stream"):
+            await asyncio.sleep(first_token_latency + token_latency * len(text.split()))
+            return {**base, "object": "chat.completion", "usage": usage, "choices": [
+                {"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}]}
+
+        async def events():
+            await asyncio.sleep(first_token_latency)
+            for i, word in enumerate(text.split(" ")):
+                if i and token_latency:
+                    await asyncio.sleep(token_latency)
+                delta = {"role": "assistant", "content": word + " "} if i == 0 else {"content": word + " "}
+                chunk = {**base, "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v2/rerank")
+    async def rerank(request: Request):
+        app.state.calls["rerank"] += 1
+        body = await request.json()
+        await asyncio.sleep(service_time)
+        top_n = min(body.get("top_n") or len(body["documents"]), len(body["documents"]))
+        return {"id": "rerank-stub", "results": [
+            {"index": i, "relevance_score": 1.0 - i / (top_n + 1)} for i in range(top_n)
+        ], "meta": {"api_version": {"version": "2"}}}
+
+    @app.post("/query")
+    async def query(request: Request):
+        app.state.calls["query"] += 1
+        body = await request.json()
+        await asyncio.sleep(service_time)
+        key = json.dumps(body.get("filter") or {}, sort_keys=True)
+        if key not in candidates:
+            candidates[key] = [i for i, m in enumerate(metadata) if _matches(m, body.get("filter") or {})]
+        pool = candidates[key]
+        start = int(abs(sum(body["vector"][:8])) * 1000) % max(1, len(pool))
+        matches = [
+            {"id": nodes[pool[(start + i) % len(pool)]].node_id, "score": 1.0 - i / 100,
+             "metadata": metadata[pool[(start + i) % len(pool)]]}
+            for i in range(min(body["topK"], len(pool)))
+        ]
+        return JSONResponse({"matches": matches, "namespace": body.get("namespace", ""), "usage": {"readUnits": 1}})
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--nodes", type=int, default=2000, help="Size of the synthetic corpus")
+    parser.add_argument("--dim", type=int, default=256, help="Embedding dimension")
+    parser.add_argument("--service-time", type=float, default=SERVICE_TIME, help="Seconds per request")
+    parser.add_argument("--first-token", type=float, default=0.3, help="Seconds to the first streamed token")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="Seconds between streamed tokens")
+    parser.add_argument("--answer-tokens", type=int, default=200, help="Tokens per answer")
+    args = parser.parse_args()
+
+    app = stub_upstream_app(args.nodes, args.dim, args.service_time, args.first_token,
+                            args.token_latency, args.answer_tokens)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+
+"""
+Local stand-ins for the upstream providers (OpenAI, Pinecone, Cohere).
+
+They implement the same llama_index interfaces as the real clients and simulate
+network latency with sleeps, so the real pipeline in `ChatService` can be load
+tested without API keys or network access. Sync methods block with `time.sleep`
+(like a blocking HTTP client); async methods yield with `asyncio.sleep`. Async
+calls can also be held to a provider rate limit (see `StubRateLimiter`).
+"""
+
+import asyncio
+import hashlib
+import time
+from typing import Any, List, Optional, Sequence
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    ChatResponseGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    LLMMetadata,
+    MessageRole,
+)
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from llama_index.core.llms.custom import CustomLLM
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle, TextNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+
+from app.services.admission import TokenBucket
+from app.services.perspectives import tag_perspectives
+
+BOOKS = [
+    "Bhagavad Gita.pdf",
+    "Atomic Habits.pdf",
+    "The 7 Habits of Highly Effective People.pdf",
+    "Ikigai.pdf",
+]
+
+WORDS = (
+    "duty action habit identity attention discipline purpose karma detachment "
+    "system goal craving reward cue routine mind focus wisdom practice change"
+).split()
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def fake_embedding(text: str, dim: int) -> List[float]:
+    """Deterministic unit-length pseudo-embedding for a piece of text."""
+    state = _seed(text) or 1
+    values = []
+    for _ in range(dim):
+        # xorshift64
+        state ^= (state << 13) & 0xFFFFFFFFFFFFFFFF
+        state ^= state >> 7
+        state ^= (state << 17) & 0xFFFFFFFFFFFFFFFF
+        values.append((state / 0xFFFFFFFFFFFFFFFF) - 0.5)
+    norm = sum(v * v for v in values) ** 0.5 or 1.0
+    return [v / norm for v in values]
+
+
+def fake_corpus(num_nodes: int) -> List[TextNode]:
+    """Synthetic book chunks spread round-robin over the library, tagged with their perspective like ingested ones."""
+    nodes = []
+    for i in range(num_nodes):
+        words = [WORDS[(i * 7 + j * 3) % len(WORDS)] for j in range(60)]
+        nodes.append(
+            TextNode(
+                id_=f"chunk-{i}",
+                text=" ".join(words),
+                metadata={"file_name": BOOKS[i % len(BOOKS)], "page_label": str(i // 4 + 1)},
+            )
+        )
+    tag_perspectives(nodes)
+    return nodes
+
+
+class StubRateLimitError(Exception):
+    """A 429 from a stub upstream after its retries, shaped like the SDK errors (`status_code`)."""
+
+    status_code = 429
+
+
+class StubRateLimiter:
+    """
+    A provider's rate limit: `requests_per_minute` and `tokens_per_minute`
+    (0 = no limit), with `burst_seconds` of the rate available at once. A call
+    over the limit is retried with exponential backoff from `backoff` seconds,
+    like the SDKs do, and fails with a 429 after `max_retries` retries.
+
+    The error class is named after the provider's SDK module (`module`), which
+    is how admission control tells upstreams apart.
+    """
+
+    def __init__(self, module: str, requests_per_minute: float, tokens_per_minute: float = 0,
+                 burst_seconds: float = 10.0, max_retries: int = 3, backoff: float = 0.5):
+        self.requests = TokenBucket(requests_per_minute, burst_seconds)
+        self.tokens = TokenBucket(tokens_per_minute, burst_seconds)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.error = type("RateLimitError", (StubRateLimitError,), {"__module__": module})
+        self.calls = 0  # requests let through
+        self.retries = 0  # attempts answered with a 429 and retried
+        self.rejected = 0  # calls failed with a 429
+
+    async def acquire(self, tokens: int = 0) -> None:
+        for attempt in range(self.max_retries + 1):
+            if not self.requests.wait_time(1) and not self.tokens.wait_time(tokens):
+                self.requests.take(1)
+                self.tokens.take(tokens)
+                self.calls += 1
+                return
+            if attempt < self.max_retries:
+                self.retries += 1
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+        self.rejected += 1
+        raise self.error("Rate limit reached")
+
+
+class StubLLM(CustomLLM):
+    """Streams canned tokens after a simulated time-to-first-token."""
+
+    first_token_latency: float = 0.3
+    token_latency: float = 0.01
+    num_tokens: int = 50
+    query_gen_latency: float = 0.5
+    calls: int = 0  # simulated answer requests
+    query_gen_calls: int = 0  # simulated query generation requests
+    limiter: Any = None  # StubRateLimiter applied to async calls
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(context_window=128000, num_output=1024, model_name="stub-llm")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "StubLLM"
+
+    def _is_query_gen(self, prompt: str) -> bool:
+        return "search queries" in prompt
+
+    def _query_gen_text(self, prompt: str) -> str:
+        seed = _seed(prompt)
+        return "\n".join(
+            " ".join(WORDS[(seed >> (k * 4 + j)) % len(WORDS)] for j in range(4)) for k in range(3)
+        )
+
+    def _tokens(self) -> List[str]:
+        return [WORDS[i % len(WORDS)] + " " for i in range(self.num_tokens)]
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        if self._is_query_gen(prompt):
+            self.query_gen_calls += 1
+            time.sleep(self.query_gen_latency)
+            return CompletionResponse(text=self._query_gen_text(prompt))
+        self.calls += 1
+        time.sleep(self.first_token_latency + self.token_latency * self.num_tokens)
+        return CompletionResponse(text="".join(self._tokens()))
+
+    @llm_completion_callback()
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        self.calls += 1
+
+        def gen() -> CompletionResponseGen:
+            time.sleep(self.first_token_latency)
+            text = ""
+            for token in self._tokens():
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+                time.sleep(self.token_latency)
+
+        return gen()
+
+    async def _acomplete_text(self, prompt: str) -> str:
+        if self.limiter is not None:
+            await self.limiter.acquire(len(prompt.split()) + self.num_tokens)
+        if self._is_query_gen(prompt):
+            self.query_gen_calls += 1
+            await asyncio.sleep(self.query_gen_latency)
+            return self._query_gen_text(prompt)
+        self.calls += 1
+        await asyncio.sleep(self.first_token_latency + self.token_latency * self.num_tokens)
+        return "".join(self._tokens())
+
+    async def _astream_tokens(self, prompt: str = ""):
+        if self.limiter is not None:
+            await self.limiter.acquire(len(prompt.split()) + self.num_tokens)
+        self.calls += 1
+        await asyncio.sleep(self.first_token_latency)
+        for token in self._tokens():
+            yield token
+            await asyncio.sleep(self.token_latency)
+
+    def _usage(self, prompt: str, completion: str) -> dict:
+        """Token usage as OpenAI reports it (one token per word here)."""
+        return {"usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(completion.split())}}
+
+    @llm_completion_callback()
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        text = await self._acomplete_text(prompt)
+        return CompletionResponse(text=text, raw=self._usage(prompt, text))
+
+    @llm_completion_callback()
+    async def astream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseAsyncGen:
+        async def gen() -> CompletionResponseAsyncGen:
+            text = ""
+            async for token in self._astream_tokens(prompt):
+                text += token
+                yield CompletionResponse(text=text, delta=token, raw=self._usage(prompt, text))
+
+        return gen()
+
+    # The chat methods call the undecorated helpers (like the OpenAI client does),
+    # so each call emits one LLM end event and token usage is counted once.
+    @llm_chat_callback()
+    async def achat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        prompt = self.messages_to_prompt(messages)
+        text = await self._acomplete_text(prompt)
+        return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=text), raw=self._usage(prompt, text))
+
+    @llm_chat_callback()
+    async def astream_chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponseAsyncGen:
+        prompt = self.messages_to_prompt(messages)
+
+        async def gen() -> ChatResponseAsyncGen:
+            text = ""
+            async for token in self._astream_tokens(prompt):
+                text += token
+                yield ChatResponse(
+                    message=ChatMessage(role=MessageRole.ASSISTANT, content=text),
+                    delta=token,
+                    raw=self._usage(prompt, text),
+                )
+
+        return gen()
+
+
+class StubEmbedding(BaseEmbedding):
+    """Deterministic pseudo-embeddings after a simulated round trip."""
+
+    dim: int = 256
+    latency: float = 0.05
+    calls: int = 0  # simulated upstream requests
+    limiter: Any = None  # StubRateLimiter applied to async calls
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "StubEmbedding"
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return fake_embedding(query, self.dim)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        if self.limiter is not None:
+            await self.limiter.acquire()
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return fake_embedding(query, self.dim)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return fake_embedding(text, self.dim)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return [fake_embedding(text, self.dim) for text in texts]
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        if self.limiter is not None:
+            await self.limiter.acquire()
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return [fake_embedding(text, self.dim) for text in texts]
+
+
+class StubVectorStore(BasePydanticVectorStore):
+    """In-memory store that returns a deterministic top-k after a simulated round trip."""
+
+    stores_text: bool = True
+    latency: float = 0.08
+    nodes: List[BaseNode] = []
+    upserts: int = 0  # simulated upsert requests
+    deletes: int = 0  # simulated delete requests
+    queries: int = 0  # simulated search requests
+    limiter: Any = None  # StubRateLimiter applied to async calls
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        self.upserts += 1
+        replaced = {node.node_id for node in nodes}
+        self.nodes = [node for node in self.nodes if node.node_id not in replaced] + list(nodes)
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self.deletes += 1
+        self.nodes = [node for node in self.nodes if node.ref_doc_id != ref_doc_id]
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters: Any = None, **delete_kwargs: Any) -> None:
+        self.deletes += 1
+        removed = set(node_ids or [])
+        self.nodes = [node for node in self.nodes if node.node_id not in removed]
+
+    def clear(self) -> None:
+        self.deletes += 1
+        self.nodes = []
+
+    def _top_k(self, query: VectorStoreQuery) -> VectorStoreQueryResult:
+        nodes = self.nodes
+        if query.filters:
+            # Equality filters only, as used for perspective partitions
+            nodes = [node for node in nodes if all(node.metadata.get(f.key) == f.value for f in query.filters.filters)]
+        if not nodes:
+            return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+        seed = _seed(query.query_str or "")
+        k = min(query.similarity_top_k, len(nodes))
+        picked = [nodes[(seed + i * 7919) % len(nodes)] for i in range(k)]
+        return VectorStoreQueryResult(
+            nodes=picked,
+            similarities=[1.0 - i / (k + 1) for i in range(k)],
+            ids=[node.node_id for node in picked],
+        )
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        self.queries += 1
+        time.sleep(self.latency)
+        return self._top_k(query)
+
+    async def aquery(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if self.limiter is not None:
+            await self.limiter.acquire()
+        self.queries += 1
+        await asyncio.sleep(self.latency)
+        return self._top_k(query)
+
+
+class StubReranker(BaseNodePostprocessor):
+    """Keeps the first `top_n` candidates after a simulated round trip."""
+
+    top_n: int = 10
+    latency: float = 0.15
+    calls: int = 0  # simulated rerank requests
+    limiter: Any = None  # StubRateLimiter applied to async calls
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "StubReranker"
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        self.calls += 1
+        time.sleep(self.latency)
+        return nodes[: self.top_n]
+
+    async def _apostprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if self.limiter is not None:
+            await self.limiter.acquire()
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return nodes[: self.top_n]
+
+
+def build_stub_service(num_nodes: int = 2000, **latencies: float):
+    """A `ChatService` wired to stub backends.
+
+    `latencies` may override: llm_first_token, llm_token, query_gen, embed, search, rerank.
+    """
+    from app.services.rag_engine import ChatService
+
+    llm = StubLLM(
+        first_token_latency=latencies.get("llm_first_token", 0.3),
+        token_latency=latencies.get("llm_token", 0.01),
+        query_gen_latency=latencies.get("query_gen", 0.5),
+    )
+    embed_model = StubEmbedding(latency=latencies.get("embed", 0.05))
+    vector_store = StubVectorStore(latency=latencies.get("search", 0.08), nodes=fake_corpus(num_nodes))
+    reranker = StubReranker(latency=latencies.get("rerank", 0.15))
+    return ChatService.from_components(llm, embed_model, vector_store, reranker=reranker)
@@ -0,0 +1,312 @@
+"""
+Offline benchmark suite: chat, ingestion and eval scenarios against local
+stand-ins for every upstream, with results written as JSON so a regression in
+throughput, p99 latency or memory shows up on a laptop without network or keys.
+
+Scenarios:
+    chat            the real app (app.main, ChatService built from settings) under
+                    uvicorn, its OpenAI, Pinecone and Cohere SDKs pointed at
+                    benchmarks/stub_server.py in its own process; a sweep over
+                    `--concurrency` conversations of `--turns` turns
+    chat-history    the same with every conversation `--history` turns deep
+    ingest          scripts/ingest.py on `--files` synthetic books per run, with the
+                    stub embedding model and fake vector store
+    evals           evals/evaluate.py over `--questions` golden-set questions per
+                    `--eval-concurrency` level, against the stub chat service
+Each scenario runs in a fresh subprocess, so `peak_rss_mb` (the running peak
+after each row) is its own. The output file holds:
+    {"meta": {commit, python, platform, cpus, started, args},
+     "scenarios": {name: [{"key": ..., "throughput": ..., "total_p99": ..., "peak_rss_mb": ..., ...}]}}
+
+With `--baseline`, rows are matched by scenario and key against an earlier
+results file: throughput lower, any *_p99 or peak_rss_mb higher by more than
+`--tolerance` (a fraction), or more errors, is a regression and the suite exits 1.
+
+Usage (from backend/):
+    python benchmarks/suite.py --output bench.json
+    python benchmarks/suite.py --output new.json --baseline bench.json --tolerance 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from io import StringIO
+
+# Add the project root and scripts/ to sys.path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+
+SCENARIOS = ("chat", "chat-history", "ingest", "evals")
+STUB_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_server.py")
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub_server(args):
+    """benchmarks/stub_server.py in its own process, so its CPU and memory aren't the app's."""
+    import httpx
+
+    port = free_port()
+    process = subprocess.Popen([
+        sys.executable, STUB_SERVER, "--port", str(port), "--nodes", str(args.nodes),
+        "--service-time", str(args.service_time), "--first-token", str(args.first_token),
+        "--token-latency", str(args.token_latency), "--answer-tokens", str(args.answer_tokens),
+    ])
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            httpx.get(f"{base_url}/health").raise_for_status()
+            return process, base_url
+        except httpx.HTTPError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("stub server did not start")
+            time.sleep(0.1)
+
+
+def run_chat(args, history):
+    import httpx
+
+    stub, base_url = start_stub_server(args)
+    try:
+        # Read when app.core.config is first imported below
+        os.environ.update({
+            "OPENAI_API_KEY": "sk-benchmark", "PINECONE_API_KEY": "pc-benchmark", "COHERE_API_KEY": "co-benchmark",
+            "OPENAI_API_BASE": f"{base_url}/v1", "PINECONE_INDEX_HOST": base_url, "COHERE_BASE_URL": base_url,
+            "VECTOR_BACKEND": "pinecone", "RERANKER": "cohere",
+            "RETRIEVAL_MODE": "dense",  # no BM25 index is built offline
+            "EMBEDDING_CACHE_ENABLED": "false", "RESPONSE_CACHE_ENABLED": "false",
+            "ADMISSION_CONTROL_ENABLED": "false",  # the stub server has no rate limits to budget for
+        })
+        from benchmarks.chat_load import run_level, start_server
+
+        server, thread, app_url = start_server()
+        rows = []
+        try:
+            for concurrency in args.concurrency:
+                calls_before = httpx.get(f"{base_url}/health").json()["calls"]
+                with redirect_stdout(StringIO()):  # the fusion retriever prints its generated queries
+                    row = asyncio.run(run_level(app_url, concurrency, args.turns, history))
+                calls = httpx.get(f"{base_url}/health").json()["calls"]
+                row.update({
+                    "key": f"concurrency={concurrency}", "history": history,
+                    "upstream_calls": {name: n - calls_before.get(name, 0) for name, n in calls.items()},
+                    "peak_rss_mb": peak_rss_mb(),
+                })
+                rows.append(row)
+        finally:
+            server.should_exit = True
+            thread.join(timeout=5)
+        return rows
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+def run_ingest(args):
+    from app.core.config import settings
+    from benchmarks.ingest_incremental import write_book
+    from benchmarks.stubs import StubEmbedding, StubVectorStore
+    from ingest import ingest_incremental
+
+    rows = []
+    for files in args.files:
+        workdir = tempfile.mkdtemp(prefix="bench-suite-ingest-")
+        try:
+            data_dir = os.path.join(workdir, "data")
+            os.makedirs(data_dir)
+            for i in range(files):
+                write_book(data_dir, f"book_{i:04d}.txt", seed=i)
+            embed_model = StubEmbedding(latency=args.embed_latency, embed_batch_size=settings.INGEST_BATCH_SIZE)
+            stats = ingest_incremental(
+                data_dir, StubVectorStore(latency=0.0), embed_model, os.path.join(workdir, "manifest.json"),
+                log=lambda *_: None, workers=settings.INGEST_WORKERS, batch_size=settings.INGEST_BATCH_SIZE,
+                embed_concurrency=settings.INGEST_EMBED_CONCURRENCY,
+            )
+        finally:
+            shutil.rmtree(workdir)
+        seconds = stats["seconds"]
+        rows.append({
+            "key": f"files={files}", "files": files, "pages": stats["pages"], "chunks": stats["chunks_upserted"],
+            "seconds": round(seconds, 3), "throughput": stats["chunks_upserted"] / seconds if seconds else 0.0,
+            "embed_calls": embed_model.calls, "peak_rss_mb": peak_rss_mb(),
+        })
+    return rows
+
+
+def run_evals(args):
+    from benchmarks.stubs import StubLLM, build_stub_service
+    from evals.evaluate import run_evals as run_eval_harness
+    from evals.golden_set import GoldenSet, question_id
+    from evals.judge_cache import JudgeCache
+
+    workdir = tempfile.mkdtemp(prefix="bench-suite-evals-")
+    rows = []
+    try:
+        golden_set = GoldenSet(os.path.join(workdir, "golden_set.json"))
+        questions = [f"Question {i}: what do the books say about habit {i % 7} and duty?" for i in range(args.questions)]
+        golden_set.version = 1
+        golden_set.questions = [{"id": question_id(q), "question": q} for q in questions]
+        service = build_stub_service(llm_token=args.token_latency)
+        judge_llm = StubLLM(first_token_latency=args.first_token, token_latency=0.0)
+        for concurrency in args.eval_concurrency:
+            cache = JudgeCache(os.path.join(workdir, f"judge-{concurrency}.sqlite3"))
+            with redirect_stdout(StringIO()):
+                _, summary = asyncio.run(run_eval_harness(golden_set, service, judge_llm, concurrency, cache))
+            wall = summary["wall_seconds"]
+            rows.append({
+                "key": f"concurrency={concurrency}", "concurrency": concurrency, "questions": summary["questions"],
+                "errors": summary["errors"], "seconds": wall,
+                "throughput": summary["questions"] / wall if wall else 0.0,
+                "latency_ms": summary["latency_ms"], "peak_rss_mb": peak_rss_mb(),
+            })
+    finally:
+        shutil.rmtree(workdir)
+    return rows
+
+
+def run_child(args):
+    """Run one scenario in this (fresh) process and write its rows to `--result-file`."""
+    logging.getLogger().setLevel(logging.WARNING)
+    if args.child == "chat":
+        rows = run_chat(args, history=0)
+    elif args.child == "chat-history":
+        rows = run_chat(args, history=args.history)
+    elif args.child == "ingest":
+        rows = run_ingest(args)
+    else:
+        rows = run_evals(args)
+    with open(args.result_file, "w") as f:
+        json.dump(rows, f)
+
+
+def run_scenario(name, argv):
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+        result_file = f.name
+    try:
+        subprocess.run([sys.executable, os.path.abspath(__file__), *argv, "--child", name,
+                        "--result-file", result_file], check=True)
+        with open(result_file) as f:
+            return json.load(f)
+    finally:
+        os.remove(result_file)
+
+
+def metadata(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "args": {k: v for k, v in vars(args).items() if k not in ("output", "baseline", "child", "result_file")},
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Regressions of `results` against `baseline`, as printable lines."""
+    regressions = []
+    for name, rows in results["scenarios"].items():
+        before = {row["key"]: row for row in baseline.get("scenarios", {}).get(name, [])}
+        for row in rows:
+            old = before.get(row["key"])
+            if old is None:
+                continue
+            for metric, value in row.items():
+                if not isinstance(value, (int, float)) or not isinstance(old.get(metric), (int, float)):
+                    continue
+                previous = old[metric]
+                if metric == "throughput":
+                    worse = value < previous * (1 - tolerance)
+                elif metric.endswith("_p99") or metric == "peak_rss_mb":
+                    worse = value > previous * (1 + tolerance)
+                elif metric == "errors":
+                    worse = value > previous
+                else:
+                    continue
+                if worse:
+                    regressions.append(f"{name} {row['key']}: {metric} {previous:.4g} -> {value:.4g}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--output", default="benchmark-results.json", help="Where to write the JSON results")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative change before a regression")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Chat conversations at once")
+    parser.add_argument("--turns", type=int, default=3, help="Sequential turns per conversation")
+    parser.add_argument("--history", type=int, default=20, help="Earlier turns per conversation in chat-history")
+    parser.add_argument("--files", type=int, nargs="+", default=[10, 40, 160], help="Corpus sizes to ingest")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="Seconds per embedding request (ingest)")
+    parser.add_argument("--questions", type=int, default=32, help="Golden-set questions (evals)")
+    parser.add_argument("--eval-concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--nodes", type=int, default=2000, help="Size of the stub corpus")
+    parser.add_argument("--service-time", type=float, default=0.02, help="Stub seconds per upstream request")
+    parser.add_argument("--first-token", type=float, default=0.3, help="Stub seconds to the first streamed token")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="Stub seconds between streamed tokens")
+    parser.add_argument("--answer-tokens", type=int, default=200, help="Stub tokens per answer")
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    results = {"meta": metadata(args), "scenarios": {}}
+    for name in args.scenarios:
+        start = time.perf_counter()
+        rows = run_scenario(name, sys.argv[1:])
+        results["scenarios"][name] = rows
+        print(f"{name:<13} {time.perf_counter() - start:>6.1f}s  " + "  ".join(
+            f"{row['key']}: {row['throughput']:.1f}/s"
+            + (f" p99 {row['total_p99']:.3f}s" if "total_p99" in row else "")
+            + f" {row['peak_rss_mb']:.0f} MB"
+            for row in rows
+        ))
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,118 +1,204 @@
-
+import argparse
+import asyncio
+import json
 import os
 import sys
-import asyncio
+import time
+
+import numpy as np
 import pandas as pd
-from llama_index.core import VectorStoreIndex
-from llama_index.vector_stores.pinecone import PineconeVectorStore
-from pinecone import Pinecone
-from llama_index.core.evaluation import (
-    FaithfulnessEvaluator,
-    RelevancyEvaluator,
-    DatasetGenerator,
-)
-from llama_index.llms.openai import OpenAI
+from llama_index.core.evaluation import FaithfulnessEvaluator, RelevancyEvaluator
+from llama_index.core.utils import get_tokenizer
 
 # Add project root to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
+from app.core.clients import openai_llm
 from app.core.config import settings
-from app.services.rag_engine import get_chat_service
+from app.services import stage_timer
+from app.services.perspectives import SPIRITUAL, perspective_of
+from app.services.rag_engine import build_vector_store, get_chat_service
+from evals.golden_set import MIN_QUESTIONS, GoldenSet, generate_golden_set
+from evals.judge_cache import JudgeCache, verdict_key
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+STAGES = ["query_expansion", "embedding", "search", "sparse", "fusion", "rerank", "total"]
+
+
+async def judge(name, evaluator, model, cache, question, answer, contexts):
+    """One judge verdict, served from the judge cache when the inputs are unchanged."""
+    key = verdict_key(name, model, question, answer, contexts)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return {**cached, "cached": True}
+    result = await evaluator.aevaluate(query=question, response=answer, contexts=contexts)
+    if cache is not None:
+        cache.put(key, result.passing, result.score, result.feedback)
+    return {"passing": result.passing, "score": result.score, "feedback": result.feedback, "cached": False}
+
+
+async def evaluate_question(item, chat_service, judges, judge_model, cache, semaphore, tokenizer):
+    """Run one golden question through the pipeline and both judges."""
+    async with semaphore:
+        row = {"id": item["id"], "Question": item["question"]}
+        timings = stage_timer.start_turn()
+        start = time.perf_counter()
+        try:
+            # Fresh engine so other questions don't leak into memory
+            chat_engine = chat_service.create_chat_engine()
+            response = await chat_engine.achat(item["question"])
+        except Exception as e:
+            return {**row, "error": str(e)}
+        stage_timer.record("total", time.perf_counter() - start)
+
+        answer = str(response)
+        contexts = [node.node.get_content() for node in response.source_nodes]
+        spiritual_sources = sum(perspective_of(node) == SPIRITUAL for node in response.source_nodes)
+        packing = stage_timer.turn_tokens()
+
+        judge_start = time.perf_counter()
+        faith, relevancy = await asyncio.gather(*(
+            judge(name, evaluator, judge_model, cache, item["question"], answer, contexts)
+            for name, evaluator in judges
+        ))
+        judge_seconds = time.perf_counter() - judge_start
+
+    row.update({
+        "Answer": answer,
+        "Faithful": faith["passing"],
+        "Relevant": relevancy["passing"],
+        "Faith_Score": faith["score"],
+        "Rel_Score": relevancy["score"],
+        "judge_cached": faith["cached"] and relevancy["cached"],
+        "judge_ms": 1000 * judge_seconds,
+        "question_tokens": len(tokenizer(item["question"])),
+        "context_tokens": sum(len(tokenizer(context)) for context in contexts),
+        "answer_tokens": len(tokenizer(answer)),
+        # Source chunks per perspective: the prompt asks for 2-3 Gita and 3-4 modern citations
+        "spiritual_sources": spiritual_sources,
+        "modern_sources": len(response.source_nodes) - spiritual_sources,
+        # Retrieved context before and after the context packer (equal when packing is off)
+        "candidate_context_tokens": packing.get("context_candidate", packing.get("context_packed")),
+        "packed_context_tokens": packing.get("context_packed"),
+    })
+    for name in STAGES:
+        row[f"{name}_ms"] = 1000 * timings[name] if name in timings else None
+    return row
+
+
+async def run_evals(golden_set, chat_service, judge_llm, concurrency=8, cache=None, limit=None):
+    """Evaluate the golden set with up to `concurrency` questions in flight. Returns (results, summary)."""
+    judge_model = getattr(judge_llm, "model", judge_llm.metadata.model_name)
+    judges = [
+        ("faithfulness", FaithfulnessEvaluator(llm=judge_llm)),
+        ("relevancy", RelevancyEvaluator(llm=judge_llm)),
+    ]
+    questions = golden_set.questions[:limit] if limit else golden_set.questions
+    semaphore = asyncio.Semaphore(concurrency)
+    tokenizer = get_tokenizer()
 
-async def run_evals():
+    start = time.perf_counter()
+    rows = await asyncio.gather(*(
+        evaluate_question(item, chat_service, judges, judge_model, cache, semaphore, tokenizer)
+        for item in questions
+    ))
+    wall_seconds = time.perf_counter() - start
+
+    df = pd.DataFrame(rows)
+    ok = df[df["error"].isna()] if "error" in df else df
+    latency, tokens = {}, {}
+    if len(ok):
+        for name in STAGES:
+            values = ok[f"{name}_ms"].dropna()
+            if len(values):
+                latency[name] = {"p50": float(np.percentile(values, 50)), "p95": float(np.percentile(values, 95))}
+        tokens = {name: int(ok[name].sum()) for name in ("question_tokens", "context_tokens", "answer_tokens")}
+        packed = ok["packed_context_tokens"].dropna()
+        if len(packed):
+            saved = ok.loc[packed.index, "candidate_context_tokens"] - packed
+            tokens["context_tokens_saved_per_turn"] = float(saved.mean())
+
+    summary = {
+        "golden_set_version": golden_set.version,
+        "questions": len(df),
+        "errors": len(df) - len(ok),
+        "concurrency": concurrency,
+        "wall_seconds": round(wall_seconds, 2),
+        "faithfulness_rate": float(ok["Faithful"].mean()) if len(ok) else None,
+        "relevancy_rate": float(ok["Relevant"].mean()) if len(ok) else None,
+        # Turns whose sources can back the prompt's citations from both perspectives
+        "citation_coverage_rate": (
+            float(((ok["spiritual_sources"] >= 2) & (ok["modern_sources"] >= 3)).mean()) if len(ok) else None
+        ),
+        "judge_cache_hits": cache.hits if cache is not None else 0,
+        "judge_cache_misses": cache.misses if cache is not None else 0,
+        "tokens": tokens,
+        "latency_ms": latency,
+        "config": {
+            "vector_backend": settings.VECTOR_BACKEND,
+            "retrieval_mode": settings.RETRIEVAL_MODE,
+            "retrieval_num_queries": settings.RETRIEVAL_NUM_QUERIES,
+            "query_expansion_mode": settings.QUERY_EXPANSION_MODE,
+            "reranker": settings.RERANKER,
+            "retrieval_partitioned": settings.RETRIEVAL_PARTITIONED,
+            "context_token_budget": settings.CONTEXT_TOKEN_BUDGET if settings.CONTEXT_PACKING_ENABLED else None,
+            "judge_model": judge_model,
+        },
+    }
+    return df, summary
+
+
+def save_results(df, summary, output_dir=RESULTS_DIR):
+    os.makedirs(output_dir, exist_ok=True)
+    csv_path = os.path.join(output_dir, "eval_results.csv")
+    summary_path = os.path.join(output_dir, "eval_summary.json")
+    df.to_csv(csv_path, index=False)
+    with open(summary_path, "w") as f:
+        json.dump(summary, f, indent=2)
+    return csv_path, summary_path
+
+
+async def main(args):
     print("--- Starting RAG Evaluation ---")
-    
-    if not settings.PINECONE_API_KEY:
-         raise ValueError("PINECONE_API_KEY not found in settings")
-
-    # 1. Setup Infrastructure
-    # 1. Setup Infrastructure
-    print("1. Connecting to Index...")
-    pc = Pinecone(api_key=settings.PINECONE_API_KEY)
-    pinecone_index = pc.Index(settings.INDEX_NAME)
-    vector_store = PineconeVectorStore(pinecone_index=pinecone_index)
-    
-    # Initialize Embedding Model explicitly
-    from llama_index.embeddings.openai import OpenAIEmbedding
-    import llama_index.core
-    
-    embed_model = OpenAIEmbedding(api_key=settings.OPENAI_API_KEY)
-    # Set global settings to avoid default init errors
-    llama_index.core.Settings.embed_model = embed_model
-    llama_index.core.Settings.llm = OpenAI(model="gpt-4o", api_key=settings.OPENAI_API_KEY)
-
-    index = VectorStoreIndex.from_vector_store(vector_store=vector_store, embed_model=embed_model)
-    
-    # Init Evaluators (GPT-4 as Judge)
-    eval_llm = OpenAI(model="gpt-4o", api_key=settings.OPENAI_API_KEY)
-    faithfulness_evaluator = FaithfulnessEvaluator(llm=eval_llm)
-    relevancy_evaluator = RelevancyEvaluator(llm=eval_llm)
-    
-    # 2. Generate Synthetic Dataset (The "Golden" Set)
-    print("2. Generating Synthetic Test Questions (This may take a moment)...")
-    # We retrieve random nodes to generate questions from
-    retriever = index.as_retriever(similarity_top_k=5)
-    nodes = retriever.retrieve("context") # Dummy query to fetch random nodes if we don't scan full DB
-    # Note: efficient way is to just fetch top-k for a generic query to sample content.
-    
-    # Create questions
-    dataset_generator = DatasetGenerator(
-        nodes,
-        llm=eval_llm,
-        show_progress=True,
-        num_questions_per_chunk=1
-    )
-    eval_questions = await dataset_generator.agenerate_questions_from_nodes(num=5)
-    print(f"   Generated {len(eval_questions)} Test Questions.")
-
-    # 3. Run Evaluation Loop
-    results = []
-    
-    # Get Chat Engine from Service
+
+    # 1. Setup Infrastructure (the chat service configures the shared embedding cache and LLM)
+    print("1. Initializing chat service...")
     chat_service = get_chat_service()
-    chat_engine = chat_service.get_chat_engine()
-    
-    print("3. Running Evaluation Loop...")
-    for i, question in enumerate(eval_questions):
-        print(f"   [{i+1}/{len(eval_questions)}] Testing: '{question}'")
-        
-        # Get RAG Response
-        response = chat_engine.chat(question)
-        
-        # Evaluate
-        faith_result = faithfulness_evaluator.evaluate_response(response=response)
-        relevancy_result = relevancy_evaluator.evaluate_response(query=question, response=response)
-        
-        results.append({
-            "Question": question,
-            "Answer": str(response)[:100] + "...", # Truncate for display
-            "Faithful": faith_result.passing,
-            "Relevant": relevancy_result.passing,
-            "Faith_Score": faith_result.score,
-            "Rel_Score": relevancy_result.score
-        })
+    eval_llm = openai_llm("gpt-4o")
+
+    # 2. Load (or generate) the persisted golden set
+    golden_set = GoldenSet()
+    if args.generate or len(golden_set) < args.min_questions:
+        # Too few questions to tell a change from noise; replace them with a larger set
+        num_questions = args.generate or args.min_questions
+        print(f"2. Generating golden set v{golden_set.version + 1} ({num_questions} questions, "
+              f"{len(golden_set)} before)...")
+        await generate_golden_set(golden_set, build_vector_store(), chat_service._embed_model, eval_llm, num_questions)
+    print(f"2. Golden set v{golden_set.version}: {len(golden_set)} questions ({golden_set.path})")
+
+    # 3. Run questions and judges concurrently
+    print(f"3. Running evaluation (concurrency {args.concurrency})...")
+    cache = None if args.no_judge_cache else JudgeCache()
+    df, summary = await run_evals(golden_set, chat_service, eval_llm, args.concurrency, cache, args.limit)
 
     # 4. Report
-    df = pd.DataFrame(results)
-    
     print("\n--- EVALUATION RESULTS ---")
-    print(df[["Question", "Faithful", "Relevant", "Faith_Score"]])
-    
-    overall_faith = df["Faithful"].mean()
-    overall_rel = df["Relevant"].mean()
-    
+    print(df[[c for c in ("Question", "Faithful", "Relevant", "Faith_Score", "total_ms") if c in df]])
     print("\n--- SUMMARY ---")
-    print(f"Faithfulness Rate: {overall_faith:.2%}")
-    print(f"Relevancy Rate:    {overall_rel:.2%}")
-    
-    # Save to CSV in results directory
-    output_dir = os.path.join(os.path.dirname(__file__), 'results')
-    os.makedirs(output_dir, exist_ok=True)
-    output_path = os.path.join(output_dir, "eval_results.csv")
-    
-    df.to_csv(output_path, index=False)
-    print(f"\nResults saved to '{output_path}'")
+    print(json.dumps(summary, indent=2))
+
+    csv_path, summary_path = save_results(df, summary)
+    print(f"\nResults saved to '{csv_path}' and '{summary_path}'")
+
 
 if __name__ == "__main__":
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(run_evals())
+    parser = argparse.ArgumentParser(description="Evaluate the RAG pipeline on the persisted golden set.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Questions in flight")
+    parser.add_argument("--generate", type=int, default=0, metavar="N",
+                        help="Regenerate the golden set with N questions (bumps its version)")
+    parser.add_argument("--min-questions", type=int, default=MIN_QUESTIONS, metavar="N",
+                        help="Regenerate the golden set with N questions if it has fewer (0 never does)")
+    parser.add_argument("--limit", type=int, default=None, help="Only evaluate the first N questions")
+    parser.add_argument("--no-judge-cache", action="store_true", help="Always call the judges")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import random
+import time
+from typing import List, Optional
+
+from llama_index.core import VectorStoreIndex
+from llama_index.core.evaluation import DatasetGenerator
+
+from app.services.local_vector_store import LocalVectorStore
+
+GOLDEN_SET_PATH = os.path.join(os.path.dirname(__file__), "golden_set.json")
+# A default run regenerates a golden set smaller than this (evaluate.py --min-questions)
+MIN_QUESTIONS = 100
+
+# Seed queries used to sample chunks from stores that cannot be scanned (Pinecone)
+SEED_TOPICS = [
+    "habits", "identity", "environment design", "motivation", "discipline", "duty", "karma",
+    "detachment from results", "the mind", "meditation", "purpose", "ikigai", "longevity",
+    "flow", "proactivity", "priorities", "relationships", "trust", "fear", "anger", "desire",
+    "the self", "knowledge", "devotion", "time management", "goals and systems", "craving",
+    "reward", "change", "death",
+]
+
+
+def question_id(question: str) -> str:
+    return hashlib.sha256(question.strip().encode("utf-8")).hexdigest()[:12]
+
+
+class GoldenSet:
+    """
+    Versioned eval questions persisted to evals/golden_set.json.
+
+    {"version": N, "created_at": "...", "questions": [{"id": "...", "question": "..."}]}
+
+    Every run evaluates the same questions; regenerating bumps the version, which
+    is recorded next to the results.
+    """
+
+    def __init__(self, path: str = GOLDEN_SET_PATH):
+        self.path = path
+        self.version = 0
+        self.created_at: Optional[str] = None
+        self.questions: List[dict] = []
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            self.version = data["version"]
+            self.created_at = data.get("created_at")
+            self.questions = data["questions"]
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": self.version, "created_at": self.created_at, "questions": self.questions},
+                      f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def sample_nodes(vector_store, embed_model, num_nodes: int, seed: int = 0) -> list:
+    """A spread of chunks across the corpus to generate questions from."""
+    rng = random.Random(seed)
+    if isinstance(vector_store, LocalVectorStore):
+        nodes = vector_store.get_nodes()
+    else:
+        index = VectorStoreIndex.from_vector_store(vector_store=vector_store, embed_model=embed_model)
+        retriever = index.as_retriever(similarity_top_k=max(1, -(-num_nodes // len(SEED_TOPICS))))
+        by_id = {}
+        for topic in SEED_TOPICS:
+            for result in retriever.retrieve(topic):
+                by_id.setdefault(result.node.node_id, result.node)
+        nodes = list(by_id.values())
+    return rng.sample(nodes, min(num_nodes, len(nodes)))
+
+
+async def generate_golden_set(golden_set: GoldenSet, vector_store, embed_model, llm, num_questions: int) -> GoldenSet:
+    """Replace the questions with `num_questions` new ones (one per sampled chunk) and bump the version."""
+    nodes = sample_nodes(vector_store, embed_model, num_questions)
+    generator = DatasetGenerator(nodes, llm=llm, show_progress=True, num_questions_per_chunk=1)
+    generated = await generator.agenerate_questions_from_nodes(num=num_questions)
+
+    questions, seen = [], set()
+    for question in generated:
+        qid = question_id(question)
+        if qid in seen:
+            continue
+        seen.add(qid)
+        questions.append({"id": qid, "question": question})
+
+    golden_set.version += 1
+    golden_set.created_at = time.strftime("%Y-%m-%dT%H:%M:%S")
+    golden_set.questions = questions
+    golden_set.save()
+    return golden_set
@@ -0,0 +1,57 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Sequence
+
+JUDGE_CACHE_PATH = ".cache/eval_judge_cache.sqlite3"
+
+
+def verdict_key(judge: str, model: str, question: str, answer: str, contexts: Sequence[str]) -> str:
+    payload = json.dumps([judge, model, question, answer, list(contexts)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class JudgeCache:
+    """
+    Judge verdicts keyed by (judge, judge model, question, answer, contexts), in sqlite.
+
+    Re-running the evals only calls the judges for answers or contexts that changed.
+    """
+
+    def __init__(self, path: str = JUDGE_CACHE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            "key TEXT PRIMARY KEY, passing INTEGER, score REAL, feedback TEXT, created_at REAL)"
+        )
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT passing, score, feedback FROM verdicts WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        passing, score, feedback = row
+        return {"passing": None if passing is None else bool(passing), "score": score, "feedback": feedback}
+
+    def put(self, key: str, passing: Optional[bool], score: Optional[float], feedback: Optional[str]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?)",
+                (key, None if passing is None else int(passing), score, feedback, time.time()),
+            )
+            self._conn.commit()
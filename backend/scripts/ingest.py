@@ -1,38 +1,372 @@
-
+import argparse
+import hashlib
+import json
+import logging
 import os
+import random
 import sys
+import threading
 import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from typing import Any, List
 
 # Add the project root to sys.path to allow imports from app
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, StorageContext
-from llama_index.vector_stores.pinecone import PineconeVectorStore
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.base.embeddings.base import BaseEmbedding
 from llama_index.core.node_parser import SemanticSplitterNodeParser
-from llama_index.embeddings.openai import OpenAIEmbedding
-from pinecone import Pinecone, ServerlessSpec
+from llama_index.core.schema import MetadataMode
+from llama_index.vector_stores.pinecone import PineconeVectorStore
+from pinecone import ServerlessSpec
+from pydantic import Field, PrivateAttr
 
+from app.core.clients import pinecone_client, pinecone_index
 from app.core.config import settings
+from app.services.embedding_cache import build_embed_model
+from app.services.local_vector_store import LocalVectorStore
+from app.services.perspectives import tag_perspectives
+from app.services.sparse_index import SparseIndex
+
+logger = logging.getLogger("scripts.ingest")
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data')
+# 2: chunks carry a perspective tag (see app/services/perspectives.py)
+MANIFEST_VERSION = 2
+
+
+class IngestManifest:
+    """
+    Local record of what is in the vector store, per source file.
+
+    {"version": 2, "files": {"<relative path>": {
+        "sha256": "...", "status": "pending" | "done",
+        "num_chunks": N, "vector_ids": [...]}}}
+
+    Written atomically after every batch, so a crashed run resumes where it stopped.
+    A version 1 manifest is loaded with `untagged` set: its chunks predate
+    perspective tags and are re-indexed under the same IDs.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files = {}
+        self.untagged = False
+        self.exists = os.path.exists(path)
+        if self.exists:
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("version") in (1, MANIFEST_VERSION):
+                self.files = data["files"]
+                self.untagged = data["version"] == 1
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, f)
+        os.replace(tmp_path, self.path)
+
+
+class UnmanagedVectorsError(RuntimeError):
+    """The vector store holds vectors that no manifest accounts for."""
+
+
+def count_vectors(vector_store):
+    """Vectors in the store, or None if the store can't tell."""
+    if isinstance(vector_store, PineconeVectorStore):
+        return vector_store.client.describe_index_stats().total_vector_count
+    try:
+        return len(vector_store)
+    except TypeError:
+        return None
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_data_dir(data_dir: str) -> dict:
+    """Map of relative path -> content hash for every file under data_dir."""
+    files = {}
+    for root, _, names in os.walk(data_dir):
+        for name in sorted(names):
+            if name.startswith("."):
+                continue
+            path = os.path.join(root, name)
+            files[os.path.relpath(path, data_dir)] = file_sha256(path)
+    return files
+
+
+def ingest_incremental(
+    data_dir,
+    vector_store,
+    embed_model,
+    manifest_path,
+    rebuild=False,
+    log=print,
+    workers=None,
+    batch_size=None,
+    embed_concurrency=None,
+    max_retries=None,
+    sparse_index=None,
+):
+    """
+    Bring the vector store in line with data_dir, touching only what changed.
+
+    New files are chunked, embedded and upserted; changed files have their old
+    vectors deleted first; deleted files have their vectors removed. Unchanged
+    files are skipped without being read. Chunk IDs are derived from the file
+    hash, so re-running after a crash overwrites rather than duplicates. A
+    store that already holds vectors but has no manifest raises
+    UnmanagedVectorsError unless `rebuild` clears it.
+
+    Files stream through the pipeline in order: parsed ahead in a process pool of
+    `workers`, split a few files ahead in threads, then embedded and upserted in
+    batches of `batch_size`. Splitting embeds too, so a single limit of
+    `embed_concurrency` requests in flight covers both stages. Memory holds that
+    window of files, never the whole corpus. Unset options fall back to the
+    INGEST_* settings.
+
+    A `sparse_index` (BM25, see sparse_index.py) receives the same chunks and
+    deletions as the vector store; the caller compacts it afterwards. Every
+    chunk is tagged with its perspective (spiritual or modern, see
+    perspectives.py) for partitioned retrieval.
+    """
+    workers = settings.INGEST_WORKERS if workers is None else workers
+    batch_size = batch_size or settings.INGEST_BATCH_SIZE
+    embed_concurrency = embed_concurrency or settings.INGEST_EMBED_CONCURRENCY
+    max_retries = settings.INGEST_MAX_RETRIES if max_retries is None else max_retries
+
+    run_start = time.perf_counter()
+    stats = {"new": 0, "changed": 0, "deleted": 0, "unchanged": 0, "resumed": 0,
+             "pages": 0, "embeddings": 0, "chunks_upserted": 0, "vectors_deleted": 0,
+             "upsert_seconds": 0.0, "seconds": 0.0}
+    manifest = IngestManifest(manifest_path)
+
+    if not rebuild and not manifest.exists:
+        # Without a manifest, every chunk would be upserted next to the vectors already
+        # there (e.g. written by the old delete-and-recreate script), duplicating them
+        existing = count_vectors(vector_store)
+        if existing:
+            raise UnmanagedVectorsError(
+                f"The vector store already holds {existing} vectors but there is no manifest at "
+                f"'{manifest_path}'. Run with --rebuild to replace them."
+            )
+
+    if rebuild:
+        log("Rebuild requested: clearing vector store and manifest...")
+        vector_store.clear()
+        if sparse_index is not None:
+            sparse_index.clear()
+        manifest.files = {}
+        manifest.save()
+
+    current = scan_data_dir(data_dir)
+
+    # 1. Remove vectors for deleted and changed files
+    changed = set()
+    for rel_path, entry in list(manifest.files.items()):
+        if rel_path in current and current[rel_path] == entry["sha256"]:
+            continue
+        if entry["vector_ids"]:
+            with_retries(vector_store.delete_nodes, entry["vector_ids"], max_retries=max_retries)
+            if sparse_index is not None:
+                sparse_index.delete_nodes(entry["vector_ids"])
+            stats["vectors_deleted"] += len(entry["vector_ids"])
+        del manifest.files[rel_path]
+        manifest.save()
+        if rel_path not in current:
+            log(f"  - removed {rel_path} ({len(entry['vector_ids'])} vectors)")
+            stats["deleted"] += 1
+        else:
+            changed.add(rel_path)
+            stats["changed"] += 1
+
+    # Chunks ingested before perspective tags: upserting them again under the same IDs
+    # replaces them with tagged ones (embeddings come from the embedding cache)
+    if manifest.untagged:
+        log(f"Re-indexing {len(manifest.files)} files to tag their chunks with a perspective...")
+        for entry in manifest.files.values():
+            entry.update(status="pending", vector_ids=[])
+        manifest.untagged = False
+        manifest.save()
+
+    # 2. Parse, chunk, embed and upsert new, changed and interrupted files
+    todo = []
+    for rel_path, sha in current.items():
+        entry = manifest.files.get(rel_path)
+        if entry is not None and entry["status"] == "done":
+            stats["unchanged"] += 1
+            continue
+        if entry is None:
+            if rel_path not in changed:
+                stats["new"] += 1
+            manifest.files[rel_path] = {"sha256": sha, "status": "pending", "num_chunks": 0, "vector_ids": []}
+        else:
+            stats["resumed"] += 1
+        todo.append(rel_path)
+
+    # Splitting and indexing both embed; one limit covers the two pools together
+    embed_model = BoundedEmbedding(embed_model, embed_concurrency)
+    splitter = SemanticSplitterNodeParser(
+        buffer_size=1,
+        breakpoint_percentile_threshold=95,
+        embed_model=embed_model
+    )
+
+    def index_file(rel_path, page_futures):
+        entry = manifest.files[rel_path]
+        nodes = [node for future in page_futures for node in future.result()]
+        for i, node in enumerate(nodes):
+            node.id_ = f"{entry['sha256'][:16]}-{i}"
+        tag_perspectives(nodes)
+        entry["num_chunks"] = len(nodes)
+        manifest.save()
+
+        # Split order is deterministic, so already-upserted chunks can be skipped on resume.
+        # Batches are embedded concurrently but upserted in order as they complete,
+        # which keeps the manifest's upserted prefix exact.
+        done = len(entry["vector_ids"])
+        batches = [nodes[i:i + batch_size] for i in range(done, len(nodes), batch_size)]
+        embedded = embed_pool.map(lambda batch: embed_batch(embed_model, batch, max_retries), batches)
+        for batch in embedded:
+            upsert_start = time.perf_counter()
+            entry["vector_ids"].extend(with_retries(vector_store.add, batch, max_retries=max_retries))
+            if sparse_index is not None:
+                sparse_index.add(batch)
+            stats["upsert_seconds"] += time.perf_counter() - upsert_start
+            stats["embeddings"] += len(batch)
+            stats["chunks_upserted"] += len(batch)
+            manifest.save()
 
-def ingest_data():
-    if not settings.PINECONE_API_KEY or not settings.OPENAI_API_KEY:
-        print("Error: Please set PINECONE_API_KEY and OPENAI_API_KEY in .env")
+        entry["status"] = "done"
+        manifest.save()
+        log(f"  + indexed {rel_path} ({len(nodes)} chunks)")
+
+    # Semantic splitting embeds every sentence, so it is I/O-bound: pages of the
+    # next few files are split in threads while the current file is indexed.
+    paths = [os.path.join(data_dir, rel_path) for rel_path in todo]
+    concurrency = max(1, embed_concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency) as split_pool, \
+            ThreadPoolExecutor(max_workers=concurrency) as embed_pool:
+        window = deque()
+        for rel_path, documents in zip(todo, parse_files(paths, workers)):
+            stats["pages"] += len(documents)
+            window.append((rel_path, [split_pool.submit(splitter.get_nodes_from_documents, [doc])
+                                      for doc in documents]))
+            if len(window) > concurrency:
+                index_file(*window.popleft())
+        while window:
+            index_file(*window.popleft())
+
+    stats["seconds"] = time.perf_counter() - run_start
+    return stats
+
+
+def load_file(path: str) -> list:
+    """Parse one file into page Documents (runs in a worker process)."""
+    return SimpleDirectoryReader(input_files=[path], filename_as_id=True).load_data()
+
+
+def parse_files(paths, workers: int):
+    """
+    Yield parsed Documents per file, in order.
+
+    Parsing runs in a process pool with at most `workers` files in flight, so
+    memory holds a bounded window of files rather than the whole corpus.
+    """
+    if workers <= 1:
+        for path in paths:
+            yield load_file(path)
         return
 
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        remaining = iter(paths)
+        for path in islice(remaining, workers):
+            pending.append(pool.submit(load_file, path))
+        while pending:
+            documents = pending.popleft().result()
+            next_path = next(remaining, None)
+            if next_path is not None:
+                pending.append(pool.submit(load_file, next_path))
+            yield documents
+
+
+def with_retries(fn, *args, max_retries: int = 5, base_delay: float = 1.0, **kwargs):
+    """Call fn, retrying failures with exponential backoff and full jitter."""
+    for attempt in range(max_retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = random.uniform(0, base_delay * 2 ** attempt)
+            logger.warning("%s failed (%s); retrying in %.1fs", getattr(fn, "__name__", "call"), e, delay)
+            time.sleep(delay)
+
+
+class BoundedEmbedding(BaseEmbedding):
+    """BaseEmbedding that allows at most `limit` requests to the wrapped model at once, across threads."""
+
+    embed_model: BaseEmbedding = Field(description="The wrapped embedding model.")
+    _slots: threading.BoundedSemaphore = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, limit: int, **kwargs: Any):
+        kwargs.setdefault("model_name", embed_model.model_name)
+        kwargs.setdefault("embed_batch_size", embed_model.embed_batch_size)
+        super().__init__(embed_model=embed_model, **kwargs)
+        self._slots = threading.BoundedSemaphore(max(1, limit))
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "BoundedEmbedding"
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        with self._slots:
+            return self.embed_model.get_text_embedding_batch(texts)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        with self._slots:
+            return self.embed_model.get_text_embedding(text)
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        with self._slots:
+            return self.embed_model.get_query_embedding(query)
+
+    # Ingest only embeds from worker threads
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._get_text_embeddings(texts)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+
+def embed_batch(embed_model, nodes, max_retries: int):
+    """Embed one batch of nodes in a single request, attaching the vectors."""
+    texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+    embeddings = with_retries(embed_model.get_text_embedding_batch, texts, max_retries=max_retries)
+    for node, embedding in zip(nodes, embeddings):
+        node.embedding = embedding
+    return nodes
+
+
+def get_pinecone_vector_store() -> PineconeVectorStore:
+    """Connect to the Pinecone index, creating it if it does not exist yet."""
     print("Initializing Pinecone...")
-    pc = Pinecone(api_key=settings.PINECONE_API_KEY)
+    pc = pinecone_client()
 
-    # Delete index if it exists to start fresh (Semantic Chunking replacement)
-    try:
-        if settings.INDEX_NAME in pc.list_indexes().names():
-            print(f"Deleting existing index '{settings.INDEX_NAME}' to re-ingest with Semantic Chunking...")
-            pc.delete_index(settings.INDEX_NAME)
-            time.sleep(5) # Wait for deletion to propagate
-    except Exception as e:
-        print(f"Error checking/deleting index: {e}")
-
-    print(f"Creating index '{settings.INDEX_NAME}'...")
-    try:
+    if settings.INDEX_NAME not in pc.list_indexes().names():
+        print(f"Creating index '{settings.INDEX_NAME}'...")
         pc.create_index(
             name=settings.INDEX_NAME,
             dimension=1536,
@@ -42,35 +376,76 @@ def ingest_data():
                 region="us-east-1"
             )
         )
-    except Exception as e:
-        print(f"Index creation might have failed (or already exists): {e}")
 
-    print("Loading documents...")
-    # Adjust path to data directory
-    data_dir = os.path.join(os.path.dirname(__file__), '..', 'data')
-    documents = SimpleDirectoryReader(data_dir).load_data()
-    print(f"Loaded {len(documents)} document pages.")
+    return PineconeVectorStore(pinecone_index=pinecone_index(settings.INDEX_NAME))
 
-    print("Setting up Semantic Chunking...")
-    embed_model = OpenAIEmbedding(api_key=settings.OPENAI_API_KEY)
-    splitter = SemanticSplitterNodeParser(
-        buffer_size=1, 
-        breakpoint_percentile_threshold=95, 
-        embed_model=embed_model
-    )
 
-    print("Setting up storage context...")
-    vector_store = PineconeVectorStore(pinecone_index=pc.Index(settings.INDEX_NAME))
-    storage_context = StorageContext.from_defaults(vector_store=vector_store)
+def ingest_data(rebuild: bool = False, **options):
+    local = settings.VECTOR_BACKEND == "local"
+    if not settings.OPENAI_API_KEY or not (local or settings.PINECONE_API_KEY):
+        print("Error: Please set OPENAI_API_KEY (and PINECONE_API_KEY unless VECTOR_BACKEND=local) in .env")
+        return
+
+    vector_store = LocalVectorStore.from_settings() if local else get_pinecone_vector_store()
+    embed_model = build_embed_model()
+    # Each backend keeps its own record of what it holds
+    index_name = f"local-{settings.INDEX_NAME}" if local else settings.INDEX_NAME
+    manifest_path = settings.INGEST_MANIFEST_PATH.format(index_name=index_name)
+    sparse_index = SparseIndex.from_settings()
+
+    ingested = sum(entry["num_chunks"] for entry in IngestManifest(manifest_path).files.values())
+    if not rebuild and ingested and not len(sparse_index):
+        # Chunks ingested before the sparse index existed
+        if local:
+            print("Backfilling sparse index from the local vector index...")
+            sparse_index.add(vector_store.get_nodes())
+        else:
+            print("Warning: the sparse index is empty but chunks were already ingested; "
+                  "run with --rebuild to build it (embeddings come from the embedding cache).")
+
+    print(f"Syncing '{DATA_DIR}' into {settings.VECTOR_BACKEND} index '{settings.INDEX_NAME}' "
+          f"(manifest: {manifest_path})...")
+    try:
+        stats = ingest_incremental(DATA_DIR, vector_store, embed_model, manifest_path, rebuild=rebuild,
+                                   sparse_index=sparse_index, **options)
+    except UnmanagedVectorsError as e:
+        print(f"Error: {e}")
+        return
+    if local:
+        print("Compacting local index...")
+        vector_store.compact()
+    print("Compacting sparse index...")
+    sparse_index.compact()
+
+    print_report(stats)
+    if hasattr(embed_model, "stats"):
+        print(f"Embedding cache: {embed_model.stats()}")
+
+
+def print_report(stats: dict):
+    seconds = stats["seconds"] or 1e-9
+    print(f"Done in {stats['seconds']:.1f}s: {stats['new']} new, {stats['changed']} changed, "
+          f"{stats['deleted']} deleted, {stats['unchanged']} unchanged, {stats['resumed']} resumed")
+    print(f"  pages/sec:      {stats['pages'] / seconds:8.1f}  ({stats['pages']} pages)")
+    print(f"  chunks/sec:     {stats['chunks_upserted'] / seconds:8.1f}  ({stats['chunks_upserted']} chunks upserted)")
+    print(f"  embeddings/sec: {stats['embeddings'] / seconds:8.1f}  ({stats['embeddings']} chunk embeddings)")
+    print(f"  upserts:        {stats['upsert_seconds']:8.1f}s")
 
-    print("Indexing documents with Semantic Splitting (this will take longer due to embedding calculation)...")
-    index = VectorStoreIndex.from_documents(
-        documents,
-        storage_context=storage_context,
-        transformations=[splitter]
-    )
-    
-    print("Success! Documents indexed with Semantic Chunking.")
 
 if __name__ == "__main__":
-    ingest_data()
+    parser = argparse.ArgumentParser(description="Incrementally ingest data/ into the vector index.")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Clear the index and manifest and re-ingest everything")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes parsing files (default: INGEST_WORKERS)")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="Chunks per embedding request and upsert (default: INGEST_BATCH_SIZE)")
+    parser.add_argument("--embed-concurrency", type=int, default=None,
+                        help="Embedding requests in flight (default: INGEST_EMBED_CONCURRENCY)")
+    args = parser.parse_args()
+    ingest_data(
+        rebuild=args.rebuild,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        embed_concurrency=args.embed_concurrency,
+    )
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Add the project root and scripts/ to sys.path to allow imports from app, benchmarks and ingest
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'scripts'))
@@ -0,0 +1,224 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.core.exceptions import ServiceOverloadedError
+from app.services.admission import (
+    COHERE,
+    FULL,
+    NO_EXPANSION,
+    NO_RERANK,
+    OPENAI,
+    OPENAI_EMBEDDING,
+    PINECONE,
+    AdmissionController,
+    TokenBucket,
+    UpstreamBudget,
+    rate_limit_retry_after,
+)
+from app.services.query_expansion import CachedQueryExpander, LLMQueryExpander, LocalQueryExpander, QueryExpander
+from benchmarks.stubs import StubLLM, StubRateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def no_metrics(monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_ENABLED", False)
+
+
+def test_bucket_starts_full_and_refills():
+    clock = FakeClock()
+    bucket = TokenBucket(60, burst_seconds=10, clock=clock)  # 1/s, 10 saved up
+    assert bucket.available() == 10
+    assert bucket.wait_time(10) == 0
+
+    bucket.take(10)
+    assert bucket.wait_time(1) == 1.0
+    clock.now += 4
+    assert bucket.available() == 4
+    clock.now += 100
+    assert bucket.available() == 10
+
+
+def test_bucket_overdraw_queues_later_callers():
+    clock = FakeClock()
+    bucket = TokenBucket(60, burst_seconds=10, clock=clock)
+    bucket.take(15)
+    assert bucket.wait_time(1) == 6.0
+    # More than the whole bucket only waits for it to be full
+    assert bucket.wait_time(50) == 15.0
+
+
+def test_bucket_give_back_is_capped():
+    clock = FakeClock()
+    bucket = TokenBucket(60, burst_seconds=10, clock=clock)
+    bucket.take(3)
+    bucket.give_back(5)
+    assert bucket.available() == 10
+    bucket.give_back(-4)
+    assert bucket.available() == 6
+
+
+def test_zero_rate_is_unlimited():
+    bucket = TokenBucket(0, clock=FakeClock())
+    bucket.take(10 ** 9)
+    assert bucket.wait_time(10 ** 9) == 0
+    assert bucket.available() == float("inf")
+
+
+def test_budget_block_delays_every_request():
+    clock = FakeClock()
+    budget = UpstreamBudget(OPENAI, requests_per_minute=600, tokens_per_minute=0, clock=clock)
+    budget.block(5)
+    budget.block(2)  # never shortens a longer block
+    assert budget.wait_time(1, 0) == 5
+    clock.now += 5
+    assert budget.wait_time(1, 0) == 0
+
+
+def rate_limited(status=429, headers=None, on_response=True):
+    if on_response:
+        return SimpleNamespace(status_code=status, response=SimpleNamespace(headers=headers or {}))
+    return SimpleNamespace(status=status, headers=headers or {})
+
+
+@pytest.mark.parametrize("exc, expected", [
+    (rate_limited(headers={"retry-after": "7"}), 7.0),
+    (rate_limited(headers={"retry-after": "0.2"}), 1.0),
+    (rate_limited(headers={"retry-after": "Wed, 21 Oct 2026 07:28:00 GMT"}), 1.0),
+    (rate_limited(), 1.0),
+    (rate_limited(headers={"retry-after": "3"}, on_response=False), 3.0),
+    (rate_limited(status=500, headers={"retry-after": "7"}), None),
+    (ValueError("not an HTTP error"), None),
+])
+def test_retry_after(exc, expected):
+    assert rate_limit_retry_after(exc) == expected
+
+
+def budgets(clock, rpm=600):
+    return {name: UpstreamBudget(name, rpm, clock=clock) for name in (OPENAI, OPENAI_EMBEDDING, PINECONE, COHERE)}
+
+
+def test_upstream_429_blocks_only_that_provider():
+    clock = FakeClock()
+    controller = AdmissionController(budgets(clock), max_concurrency=4, queue_timeout=5)
+    error = StubRateLimiter("cohere.errors", 60).error("Rate limit reached")
+    error.headers = {"retry-after": "12"}
+
+    overloaded = controller.upstream_rate_limited(error)
+    assert overloaded.status_code == 429
+    assert overloaded.retry_after == 12
+    assert controller.budgets[COHERE].wait_time(1, 0) == 12
+    assert controller.budgets[OPENAI].wait_time(1, 0) == 0
+    assert controller.upstream_rate_limited(ValueError("boom")) is None
+
+
+def test_plan_degrades_to_what_the_budget_covers():
+    clock = FakeClock()
+    controller = AdmissionController(budgets(clock), max_concurrency=4, queue_timeout=5,
+                                     num_queries=3, searches_per_query=1, rerank_calls=1)
+    assert controller.plan(retrieval=True, prompt_tokens=100)[0].level == FULL
+
+    # Pinecone has room for one search but not three: drop expansion
+    pinecone = controller.budgets[PINECONE].requests
+    pinecone.take(pinecone.available() - 1)
+    plan, wait = controller.plan(retrieval=True, prompt_tokens=100)
+    assert (plan.level, wait) == (NO_EXPANSION, 0)
+
+    # Cohere is out as well: drop reranking
+    controller.budgets[COHERE].block(30)
+    plan, wait = controller.plan(retrieval=True, prompt_tokens=100)
+    assert (plan.level, wait) == (NO_RERANK, 0)
+
+
+def test_admit_sheds_when_the_budget_wait_outlasts_the_queue():
+    clock = FakeClock()
+    controller = AdmissionController(budgets(clock), max_concurrency=4, queue_timeout=5)
+    controller.budgets[OPENAI].block(60)
+
+    async def turn():
+        async with controller.admit(retrieval=False, prompt_tokens=100):
+            pass
+
+    with pytest.raises(ServiceOverloadedError) as raised:
+        asyncio.run(turn())
+    assert raised.value.status_code == 429
+    assert raised.value.retry_after == 60
+
+
+def test_admit_sheds_on_a_full_queue_and_releases_slots():
+    controller = AdmissionController({}, max_concurrency=1, queue_timeout=4, queue_depth=1)
+
+    async def scenario():
+        inside, leave = asyncio.Event(), asyncio.Event()
+
+        async def holder():
+            async with controller.admit(retrieval=False, prompt_tokens=10):
+                inside.set()
+                await leave.wait()
+
+        async def waiter():
+            async with controller.admit(retrieval=False, prompt_tokens=10):
+                pass
+
+        first = asyncio.create_task(holder())
+        await inside.wait()
+        second = asyncio.create_task(waiter())
+        await asyncio.sleep(0)
+        assert controller.stats() == {"waiting": 1, "in_flight": 1}
+        with pytest.raises(ServiceOverloadedError) as raised:
+            async with controller.admit(retrieval=False, prompt_tokens=10):
+                pass
+        leave.set()
+        await asyncio.gather(first, second)
+        return raised.value
+
+    shed = asyncio.run(scenario())
+    assert (shed.status_code, shed.retry_after) == (429, 2)
+    assert controller.stats() == {"waiting": 0, "in_flight": 0}
+
+
+def test_settle_returns_unused_requests_and_tokens():
+    clock = FakeClock()
+    budget = UpstreamBudget(OPENAI, requests_per_minute=60, tokens_per_minute=6000, clock=clock)
+    controller = AdmissionController({OPENAI: budget}, max_concurrency=1, queue_timeout=5, num_queries=3,
+                                     answer_tokens=1000, expansion_tokens=250)
+    plan, _ = controller.plan(retrieval=True, prompt_tokens=500)
+    controller._reserve(plan)
+    assert (budget.requests.available(), budget.tokens.available()) == (58, 4250)
+    # The expansion came from the cache: one LLM call instead of two
+    controller.settle(plan, llm_calls=1, llm_tokens=700)
+    assert (budget.requests.available(), budget.tokens.available()) == (59, 5300)
+
+
+def test_expansion_without_the_llm_costs_no_llm_request():
+    controller = AdmissionController({}, max_concurrency=1, queue_timeout=5, num_queries=3, searches_per_query=1,
+                                     answer_tokens=1000, expansion_tokens=250)
+    llm = controller.cost(FULL, retrieval=True, prompt_tokens=500)
+    local = controller.cost(FULL, retrieval=True, prompt_tokens=500, expansion_llm=False)
+    assert llm[OPENAI] == (2, 1750)
+    assert local[OPENAI] == (1, 1500)
+    # The generated queries are still searched
+    assert llm[PINECONE] == local[PINECONE] == (3, 0)
+
+
+def test_expanders_report_llm_calls():
+    llm_expander = LLMQueryExpander(StubLLM(query_gen_latency=0.0), "Generate {num_queries} search queries: {query}")
+    cached = CachedQueryExpander(llm_expander)
+    assert llm_expander.calls_llm("What is dharma?", 2)
+    assert not LocalQueryExpander().calls_llm("What is dharma?", 2)
+    assert not QueryExpander().calls_llm("What is dharma?", 2)
+
+    assert cached.calls_llm("What is dharma?", 2)
+    asyncio.run(cached.aexpand("What is dharma?", 2))
+    assert not cached.calls_llm("what is  Dharma?", 2)
+    assert cached.calls_llm("What is dharma?", 3)
@@ -0,0 +1,52 @@
+import asyncio
+
+from app.services.embedding_cache import EmbeddingStore, embedding_key, wrap_with_cache
+from benchmarks.stubs import StubEmbedding
+
+
+def stub(model_name, dim):
+    return StubEmbedding(latency=0.0, dim=dim, model_name=model_name)
+
+
+def test_hits_skip_the_model(tmp_path):
+    cached = wrap_with_cache(stub("small", 8), str(tmp_path))
+    first = cached.get_text_embedding_batch(["duty", "habit", "duty"])
+    again = wrap_with_cache(stub("small", 8), str(tmp_path))
+    assert again.get_text_embedding_batch(["duty", "habit"]) == first[:2]
+    assert again.embed_model.calls == 0
+    assert again.stats()["hits"] == 2
+
+
+def test_model_change_starts_a_fresh_store(tmp_path):
+    wrap_with_cache(stub("small", 8), str(tmp_path)).get_text_embedding_batch(["duty"])
+    # Another model with another dimension in the same EMBEDDING_CACHE_DIR
+    assert len(wrap_with_cache(stub("large", 16), str(tmp_path)).get_text_embedding("duty")) == 16
+    assert wrap_with_cache(stub("small", 8), str(tmp_path)).stats()["entries"] == 1
+
+
+def test_store_recovers_a_torn_append(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put_many([embedding_key("m", "a")], [[1.0, 2.0]])
+    with open(tmp_path / "vectors.f32", "ab") as f:
+        f.write(b"\x00" * 5)  # a writer crashed mid-row
+    reopened = EmbeddingStore(str(tmp_path))
+    assert len(reopened) == 1
+    assert reopened.get_many([embedding_key("m", "a")]) == [[1.0, 2.0]]
+
+
+def test_lookups_see_rows_appended_by_another_process(tmp_path):
+    reader = EmbeddingStore(str(tmp_path))
+    writer = EmbeddingStore(str(tmp_path))  # e.g. an ingest run next to the server
+    writer.put_many([embedding_key("m", "a")], [[1.0, 2.0]])
+    assert reader.get_many([embedding_key("m", "a"), embedding_key("m", "b")]) == [[1.0, 2.0], None]
+    assert len(reader) == 1
+
+
+def test_async_misses_are_stored(tmp_path):
+    cached = wrap_with_cache(stub("small", 8), str(tmp_path))
+    first = asyncio.run(cached.aget_text_embedding_batch(["duty", "habit"]))
+    query = asyncio.run(cached.aget_query_embedding("dharma"))
+    again = wrap_with_cache(stub("small", 8), str(tmp_path))
+    assert again.get_text_embedding_batch(["duty", "habit"]) == first
+    assert again.get_query_embedding("dharma") == query
+    assert again.embed_model.calls == 0
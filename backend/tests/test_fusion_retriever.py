@@ -0,0 +1,50 @@
+import random
+
+from llama_index.core import VectorStoreIndex
+from llama_index.core.retrievers import QueryFusionRetriever
+from llama_index.core.schema import NodeWithScore
+
+from app.services.fusion_retriever import reciprocal_rank_fusion
+from benchmarks.stubs import StubEmbedding, StubLLM, StubVectorStore, fake_corpus
+
+
+def result_lists(seed, num_lists=6, size=15):
+    rng = random.Random(seed)
+    corpus = fake_corpus(40)
+    lists = []
+    for _ in range(num_lists):
+        nodes = rng.sample(corpus, size)
+        # Repeated scores exercise the tie order; not every list comes sorted
+        lists.append([NodeWithScore(node=node, score=round(rng.random(), 1)) for node in nodes])
+    return lists
+
+
+def copies(lists):
+    return [[NodeWithScore(node=n.node, score=n.score) for n in nodes] for nodes in lists]
+
+
+def test_matches_upstream_rrf():
+    # Upstream needs at least one retriever to build; fusion itself never calls it
+    index = VectorStoreIndex.from_vector_store(StubVectorStore(latency=0.0), embed_model=StubEmbedding(latency=0.0))
+    upstream = QueryFusionRetriever([index.as_retriever()], llm=StubLLM())
+    for seed in range(20):
+        lists = result_lists(seed)
+        expected = upstream._reciprocal_rerank_fusion({(f"q{i}", 0): nodes for i, nodes in enumerate(copies(lists))})
+        fused = reciprocal_rank_fusion(copies(lists))
+        assert [n.node.node_id for n in fused] == [n.node.node_id for n in expected]
+        assert [n.score for n in fused] == [n.score for n in expected]
+
+
+def test_deduplicates_and_sums_ranks():
+    a, b, c = fake_corpus(3)
+    fused = reciprocal_rank_fusion([
+        [NodeWithScore(node=a, score=0.9), NodeWithScore(node=b, score=0.5)],
+        [NodeWithScore(node=c, score=0.2), NodeWithScore(node=b, score=0.8)],
+    ])
+    assert [n.node.node_id for n in fused] == [b.node_id, a.node_id, c.node_id]
+    assert fused[0].score == 1 / 61 + 1 / 60
+
+
+def test_empty():
+    assert reciprocal_rank_fusion([]) == []
+    assert reciprocal_rank_fusion([[], []]) == []
@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+
+import pytest
+
+from app.services.perspectives import PERSPECTIVE_KEY
+from benchmarks.ingest_incremental import write_book
+from benchmarks.stubs import StubEmbedding, StubVectorStore, fake_corpus, fake_embedding
+from ingest import MANIFEST_VERSION, UnmanagedVectorsError, ingest_incremental
+
+
+def ingest(data_dir, store, manifest_path, **options):
+    return ingest_incremental(str(data_dir), store, StubEmbedding(latency=0.0), str(manifest_path),
+                              log=lambda *_: None, workers=1, **options)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    directory = tmp_path / "data"
+    directory.mkdir()
+    for i in range(3):
+        write_book(str(directory), f"book_{i}.txt", seed=i, sentences=40)
+    return directory
+
+
+def test_refuses_vectors_without_a_manifest(tmp_path, data_dir):
+    # An index written by the old delete-and-recreate script: vectors, no manifest
+    store = StubVectorStore(latency=0.0, nodes=fake_corpus(10))
+    with pytest.raises(UnmanagedVectorsError):
+        ingest(data_dir, store, tmp_path / "manifest.json")
+    assert store.upserts == 0
+
+    stats = ingest(data_dir, store, tmp_path / "manifest.json", rebuild=True)
+    assert stats["new"] == 3
+    assert not any(node.node_id.startswith("chunk-") for node in store.nodes)
+
+
+def test_empty_store_needs_no_manifest(tmp_path, data_dir):
+    store = StubVectorStore(latency=0.0)
+    stats = ingest(data_dir, store, tmp_path / "manifest.json")
+    assert stats["new"] == 3
+    assert len(store) == stats["chunks_upserted"]
+
+
+def test_version_1_manifest_is_retagged_in_place(tmp_path, data_dir):
+    store = StubVectorStore(latency=0.0)
+    manifest_path = tmp_path / "manifest.json"
+    first = ingest(data_dir, store, manifest_path)
+
+    # What a run before perspective tags left behind: untagged chunks, a version 1 manifest
+    for node in store.nodes:
+        del node.metadata[PERSPECTIVE_KEY]
+    manifest = json.loads(manifest_path.read_text())
+    manifest_path.write_text(json.dumps({**manifest, "version": 1}))
+    ids = sorted(node.node_id for node in store.nodes)
+
+    stats = ingest(data_dir, store, manifest_path)
+    assert (stats["new"], stats["changed"], stats["deleted"], stats["resumed"]) == (0, 0, 0, 3)
+    assert stats["vectors_deleted"] == 0
+    assert stats["chunks_upserted"] == first["chunks_upserted"]
+    # Replaced under the same IDs, now tagged
+    assert sorted(node.node_id for node in store.nodes) == ids
+    assert all(PERSPECTIVE_KEY in node.metadata for node in store.nodes)
+    assert json.loads(manifest_path.read_text())["version"] == MANIFEST_VERSION
+
+    upserts = store.upserts
+    stats = ingest(data_dir, store, manifest_path)
+    assert stats["unchanged"] == 3
+    assert store.upserts == upserts
+
+
+lock = threading.Lock()
+
+
+class PeakEmbedding(StubEmbedding):
+    """Records the most embedding requests ever in flight at once."""
+
+    in_flight: int = 0
+    peak: int = 0
+
+    def _get_text_embeddings(self, texts):
+        with lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        time.sleep(self.latency)
+        with lock:
+            self.in_flight -= 1
+        return [fake_embedding(text, self.dim) for text in texts]
+
+
+def test_split_and_embed_share_the_concurrency_limit(tmp_path, data_dir):
+    for i in range(3, 8):
+        write_book(str(data_dir), f"book_{i}.txt", seed=i, sentences=40)
+    embed_model = PeakEmbedding(latency=0.02)
+    stats = ingest_incremental(str(data_dir), StubVectorStore(latency=0.0), embed_model,
+                               str(tmp_path / "manifest.json"), log=lambda *_: None, workers=1,
+                               batch_size=2, embed_concurrency=2)
+    assert stats["chunks_upserted"]
+    assert embed_model.peak == 2
@@ -0,0 +1,22 @@
+from app.services.local_vector_store import LocalVectorStore
+from app.services.perspectives import partition_filters, source_perspective
+from benchmarks.stubs import fake_corpus, fake_embedding
+
+
+def test_get_nodes_by_id_keeps_the_cached_filter_mask(tmp_path):
+    store = LocalVectorStore(persist_dir=str(tmp_path))
+    nodes = fake_corpus(12)
+    for node in nodes:
+        node.embedding = fake_embedding(node.text, 16)
+    store.add(nodes)
+
+    perspective = source_perspective(nodes[0].metadata)
+    filters = partition_filters(perspective)
+    partition = {node.node_id for node in nodes if source_perspective(node.metadata) == perspective}
+    assert len(store.get_nodes(filters=filters)) == len(partition)
+
+    assert [n.node_id for n in store.get_nodes(node_ids=[nodes[0].node_id], filters=filters)] == [nodes[0].node_id]
+    # A later partition read still sees every row
+    assert {n.node_id for n in store.get_nodes(filters=filters)} == partition
+    assert len(store.get_nodes(node_ids=[nodes[0].node_id])) == 1
+    assert len(store.get_nodes()) == len(nodes)
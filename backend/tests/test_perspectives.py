@@ -0,0 +1,30 @@
+import asyncio
+
+from app.services.perspectives import MODERN, PERSPECTIVE_KEY, SPIRITUAL, perspective_of
+from app.services.rag_engine import ChatService
+from benchmarks.stubs import StubEmbedding, StubLLM, StubVectorStore, fake_corpus
+
+
+def build_retriever(nodes):
+    llm = StubLLM(first_token_latency=0.0, token_latency=0.0, query_gen_latency=0.0)
+    store = StubVectorStore(latency=0.0, nodes=nodes)
+    return ChatService.from_components(llm, StubEmbedding(latency=0.0), store)._retriever
+
+
+def test_tagged_index_is_searched_per_partition():
+    retriever = build_retriever(fake_corpus(200))
+    nodes = asyncio.run(retriever.aretrieve("How do I build better habits?"))
+    assert {perspective_of(node) for node in nodes} == {SPIRITUAL, MODERN}
+
+
+def test_untagged_index_falls_back_to_a_global_search():
+    # An index ingested before chunks were tagged: every partition filter matches nothing
+    nodes = fake_corpus(200)
+    for node in nodes:
+        del node.metadata[PERSPECTIVE_KEY]
+    retriever = build_retriever(nodes)
+    assert retriever.partitions
+
+    results = asyncio.run(retriever.aretrieve("How do I build better habits?"))
+    assert results
+    assert retriever._warned_untagged
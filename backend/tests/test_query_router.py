@@ -0,0 +1,37 @@
+import pytest
+
+from app.services.query_router import CONVERSATIONAL, OUT_OF_SCOPE, RETRIEVAL, classify_query
+
+
+@pytest.mark.parametrize("message, route", [
+    # Small talk
+    ("Hi!", CONVERSATIONAL),
+    ("thanks a lot", CONVERSATIONAL),
+    ("Who are you?", CONVERSATIONAL),
+    ("", CONVERSATIONAL),
+    # In scope, even with words that also name out-of-scope topics
+    ("What's the recipe for lasting habits?", RETRIEVAL),
+    ("How do I debug my procrastination?", RETRIEVAL),
+    ("How do I compile a morning routine?", RETRIEVAL),
+    ("How do I bake discipline into my day?", RETRIEVAL),
+    ("How do I make breakfast a habit?", RETRIEVAL),
+    ("Is Python a good metaphor for craving?", RETRIEVAL),
+    ("What is the function of a craving in the habit loop?", RETRIEVAL),
+    ("How do I stop overthinking my code reviews?", RETRIEVAL),
+    ("How do I fix my sleep schedule?", RETRIEVAL),
+    ("Hi, how do I stay calm at work?", RETRIEVAL),
+    ("What does the Gita say about duty?", RETRIEVAL),
+    # Out of scope
+    ("Write a Python script to rename files", OUT_OF_SCOPE),
+    ("write me a function that sorts numbers", OUT_OF_SCOPE),
+    ("Write a SQL query for my users table", OUT_OF_SCOPE),
+    ("How do I reverse a list in Python?", OUT_OF_SCOPE),
+    ("Can you explain this stack trace?", OUT_OF_SCOPE),
+    ("Give me a recipe for chocolate cake", OUT_OF_SCOPE),
+    ("How do I bake bread?", OUT_OF_SCOPE),
+    ("How to cook chicken curry?", OUT_OF_SCOPE),
+    ("What's the weather forecast for tomorrow?", OUT_OF_SCOPE),
+    ("What is the bitcoin price today?", OUT_OF_SCOPE),
+])
+def test_classify_query(message, route):
+    assert classify_query(message) == route
@@ -0,0 +1,23 @@
+import pytest
+
+from app.services.rag_engine import ChatService
+
+
+def test_failed_build_leaves_no_singleton(monkeypatch):
+    built = []
+
+    def initialize(self):
+        built.append(self)
+        if len(built) == 1:
+            raise RuntimeError("index unreachable")
+
+    monkeypatch.setattr(ChatService, "_initialize", initialize)
+    monkeypatch.setattr(ChatService, "_instance", None)
+
+    with pytest.raises(RuntimeError):
+        ChatService()
+    assert ChatService._instance is None
+
+    service = ChatService()
+    assert ChatService() is service
+    assert built == [built[0], service]
@@ -0,0 +1,56 @@
+import sqlite3
+
+from app.services import response_cache
+from app.services.response_cache import DiskCacheBackend, SemanticResponseCache
+
+SOURCES = [{"file_name": "Atomic Habits.pdf", "page_label": "12", "score": 0.91}]
+
+
+def test_hit_replays_the_sources():
+    cache = SemanticResponseCache()
+    cache.store([1.0, 0.0, 0.0], None, "Start small.", 1.5, SOURCES)
+    entry = cache.lookup([1.0, 0.01, 0.0])
+    assert entry.answer == "Start small."
+    assert entry.sources == SOURCES
+
+
+def test_threshold_rejects_merely_similar_questions():
+    cache = SemanticResponseCache()
+    cache.store([1.0, 0.0], None, "Start small.", 1.5, SOURCES)
+    # cosine ~0.95: close, but not the same question
+    assert cache.lookup([1.0, 0.33]) is None
+
+
+def test_disk_backend_keeps_sources(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    SemanticResponseCache(DiskCacheBackend(path)).store([0.0, 1.0], None, "Do your duty.", 2.0, SOURCES)
+    entry = SemanticResponseCache(DiskCacheBackend(path)).lookup([0.0, 1.0])
+    assert entry.sources == SOURCES
+
+
+def test_disk_backend_upgrades_a_file_without_sources(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE responses (entry_id TEXT PRIMARY KEY, history_key TEXT, embedding BLOB,"
+                 " answer TEXT, created_at REAL, last_access REAL, latency REAL)")
+    conn.commit()
+    conn.close()
+
+    cache = SemanticResponseCache(DiskCacheBackend(path))
+    cache.store([0.0, 1.0], None, "Do your duty.", 2.0)
+    assert SemanticResponseCache(DiskCacheBackend(path)).lookup([0.0, 1.0]).sources == []
+
+
+def test_disk_backend_keeps_the_lru_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_cache, "ACCESS_FLUSH_SECONDS", 0.0)
+    path = str(tmp_path / "cache.sqlite3")
+    cache = SemanticResponseCache(DiskCacheBackend(path), max_entries=2)
+    cache.store([1.0, 0.0, 0.0], None, "Start small.", 1.5)
+    cache.store([0.0, 1.0, 0.0], None, "Do your duty.", 2.0)
+    assert cache.lookup([1.0, 0.0, 0.0]).answer == "Start small."
+
+    # After a restart the least recently used entry is still the one evicted
+    restarted = SemanticResponseCache(DiskCacheBackend(path), max_entries=2)
+    restarted.store([0.0, 0.0, 1.0], None, "Be present.", 1.0)
+    assert restarted.lookup([1.0, 0.0, 0.0]) is not None
+    assert restarted.lookup([0.0, 1.0, 0.0]) is None
@@ -0,0 +1,114 @@
+import asyncio
+from types import SimpleNamespace
+
+from llama_index.core.llms import ChatMessage, MessageRole
+
+from app.services.sessions import DiskSessionBackend, Session, SessionStore
+from benchmarks.stubs import StubLLM
+
+
+def conversation(turns, tokens=10, **fields):
+    """`turns` user/assistant exchanges of `tokens` tokens per message."""
+    messages = []
+    for i in range(turns):
+        messages.append(ChatMessage(role=MessageRole.USER, content=f"question {i}"))
+        messages.append(ChatMessage(role=MessageRole.ASSISTANT, content=f"answer {i}"))
+    return Session(session_id="s", messages=messages, token_counts=[tokens] * len(messages), **fields)
+
+
+def test_history_keeps_the_latest_messages_from_a_user_turn():
+    session = conversation(3)
+    # 35 tokens fit the last three messages, but the first of them is an answer
+    history = session.history(35)
+    assert [m.content for m in history] == ["question 2", "answer 2"]
+    assert session.history(1000) == session.messages
+
+
+def test_history_puts_the_summary_first_and_counts_it():
+    session = conversation(3, summary="They asked about habits.", summary_tokens=5, summarized=2)
+    history = session.history(35)
+    assert history[0].role == MessageRole.SYSTEM
+    assert "They asked about habits." in history[0].content
+    assert [m.content for m in history[1:]] == ["question 2", "answer 2"]
+    # Summarized messages are never sent again
+    assert [m.content for m in session.history(1000)[1:]] == ["question 1", "answer 1", "question 2", "answer 2"]
+
+
+def summarize(store, session, llm, during=None):
+    async def run():
+        store.maybe_summarize(session, llm)
+        if during:
+            during()
+        await store.drain()
+
+    asyncio.run(run())
+
+
+def test_summarizes_older_messages_and_keeps_the_latest():
+    store = SessionStore(summary_trigger_tokens=50, summary_keep_tokens=25)
+    session = conversation(3)
+    llm = StubLLM(first_token_latency=0.0, token_latency=0.0, num_tokens=5)
+
+    summarize(store, session, llm)
+    assert llm.calls == 1
+    assert session.summarized == 4
+    assert session.summary == "".join(llm._tokens()).strip()
+    assert session.summary_tokens > 0
+    assert store.summaries == 1
+    assert not session.summarizing
+    assert [m.content for m in session.history(1000)[1:]] == ["question 2", "answer 2"]
+
+
+def test_no_summary_below_the_trigger():
+    store = SessionStore(summary_trigger_tokens=60, summary_keep_tokens=25)
+    session = conversation(3)
+    llm = StubLLM(first_token_latency=0.0, token_latency=0.0)
+
+    summarize(store, session, llm)
+    assert llm.calls == 0
+    assert session.summarized == 0
+
+
+def test_one_summary_at_a_time_and_turns_continue_meanwhile():
+    store = SessionStore(summary_trigger_tokens=50, summary_keep_tokens=25)
+    session = conversation(3)
+    llm = StubLLM(first_token_latency=0.01, token_latency=0.0, num_tokens=5)
+
+    def next_turn():
+        assert session.summarizing
+        store.maybe_summarize(session, llm)
+        store.append(session, [ChatMessage(role=MessageRole.USER, content="question 3"),
+                               ChatMessage(role=MessageRole.ASSISTANT, content="answer 3")])
+
+    summarize(store, session, llm, during=next_turn)
+    assert llm.calls == 1
+    # The summary covers what was there when it started; the new turn stays verbatim
+    assert session.summarized == 4
+    assert [m.content for m in session.history(1000)[1:]] == ["question 2", "answer 2", "question 3", "answer 3"]
+
+
+def test_failed_summary_leaves_the_history_alone():
+    store = SessionStore(summary_trigger_tokens=50, summary_keep_tokens=25)
+    session = conversation(3)
+
+    async def acomplete(prompt):
+        raise RuntimeError("upstream down")
+
+    summarize(store, session, SimpleNamespace(acomplete=acomplete))
+    assert (session.summary, session.summarized, session.summarizing) == ("", 0, False)
+
+
+def test_disk_backend_keeps_the_summary(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    store = SessionStore(backend=DiskSessionBackend(path), summary_trigger_tokens=10, summary_keep_tokens=5)
+    session = store.create()
+    store.append(session, [ChatMessage(role=MessageRole.USER, content="How do I build a habit? " * 5),
+                           ChatMessage(role=MessageRole.ASSISTANT, content="Start small. " * 5),
+                           ChatMessage(role=MessageRole.USER, content="And keep it?")])
+    summarize(store, session, StubLLM(first_token_latency=0.0, token_latency=0.0, num_tokens=5))
+
+    loaded = SessionStore(backend=DiskSessionBackend(path)).get(session.session_id)
+    assert loaded.summary == session.summary
+    assert loaded.summarized == session.summarized == 2
+    assert loaded.token_counts == session.token_counts
+    assert [m.content for m in loaded.history(1000)[1:]] == ["And keep it?"]
@@ -0,0 +1,231 @@
+import asyncio
+
+from app.services.single_flight import SingleFlight, StreamingSingleFlight
+
+
+class Upstream:
+    """An upstream call that records its runs and waits until `release` is set."""
+
+    def __init__(self, result="answer", error=None):
+        self.result = result
+        self.error = error
+        self.runs = 0
+        self.cancelled = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.runs += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def test_concurrent_calls_share_one_run():
+    async def run():
+        flight, upstream = SingleFlight(), Upstream()
+        callers = [asyncio.create_task(flight.do("q", upstream)) for _ in range(3)]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        results = await asyncio.gather(*callers)
+        return flight, upstream, results
+
+    flight, upstream, results = asyncio.run(run())
+    assert results == ["answer"] * 3
+    assert upstream.runs == 1
+    assert flight.stats() == {"entries": 0, "hits": 2, "misses": 1}
+
+
+def test_finished_calls_are_not_reused():
+    async def run():
+        flight, upstream = SingleFlight(), Upstream()
+        upstream.release.set()
+        await flight.do("q", upstream)
+        await flight.do("q", upstream)
+        return upstream
+
+    assert asyncio.run(run()).runs == 2
+
+
+def test_disabled_runs_every_call():
+    async def run():
+        flight, upstream = SingleFlight(enabled=False), Upstream()
+        upstream.release.set()
+        await asyncio.gather(flight.do("q", upstream), flight.do("q", upstream))
+        return upstream
+
+    assert asyncio.run(run()).runs == 2
+
+
+def test_error_reaches_every_caller():
+    async def run():
+        flight, upstream = SingleFlight(), Upstream(error=RuntimeError("upstream down"))
+        callers = [asyncio.create_task(flight.do("q", upstream)) for _ in range(2)]
+        await asyncio.sleep(0)
+        upstream.release.set()
+        return await asyncio.gather(*callers, return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert [str(r) for r in results] == ["upstream down"] * 2
+
+
+def test_one_caller_leaving_does_not_cancel_the_others():
+    async def run():
+        flight, upstream = SingleFlight(), Upstream()
+        leaving = asyncio.create_task(flight.do("q", upstream))
+        staying = asyncio.create_task(flight.do("q", upstream))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        await asyncio.sleep(0)
+        upstream.release.set()
+        return leaving, await staying, upstream
+
+    leaving, result, upstream = asyncio.run(run())
+    assert leaving.cancelled()
+    assert result == "answer"
+    assert upstream.cancelled == 0
+
+
+def test_last_caller_leaving_cancels_the_run():
+    async def run():
+        flight, upstream = SingleFlight(), Upstream()
+        callers = [asyncio.create_task(flight.do("q", upstream)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        return flight, upstream
+
+    flight, upstream = asyncio.run(run())
+    assert upstream.cancelled == 1
+    assert flight.stats()["entries"] == 0
+
+
+class TokenRun:
+    """A token stream started by StreamingSingleFlight; each token waits for a `step`."""
+
+    def __init__(self, tokens, sources=None, error=None):
+        self.tokens = tokens
+        self.sources = sources
+        self.error = error
+        self.starts = 0
+        self.closed = False
+        self.step = asyncio.Semaphore(0)
+
+    def __call__(self, publish_sources):
+        self.starts += 1
+        return self._run(publish_sources)
+
+    async def _run(self, publish_sources):
+        try:
+            if self.sources is not None:
+                publish_sources(self.sources)
+            for token in self.tokens:
+                await self.step.acquire()
+                yield token
+            if self.error is not None:
+                raise self.error
+        finally:
+            self.closed = True
+
+
+async def read(flight, key, run, sources=None, limit=None):
+    received = []
+    stream = flight.stream(key, run, on_sources=None if sources is None else sources.append)
+    try:
+        async for token in stream:
+            received.append(token)
+            if limit is not None and len(received) == limit:
+                break
+    finally:
+        await stream.aclose()
+    return received
+
+
+def test_subscribers_share_one_run_and_its_sources():
+    async def run():
+        flight = StreamingSingleFlight()
+        tokens = TokenRun(["a", "b", "c"], sources=[{"file_name": "Gita.pdf"}])
+        sources = [], []
+        readers = [asyncio.create_task(read(flight, "q", tokens, sources[i])) for i in range(2)]
+        await asyncio.sleep(0)
+        for _ in range(3):
+            tokens.step.release()
+        return flight, tokens, sources, await asyncio.gather(*readers)
+
+    flight, tokens, sources, results = asyncio.run(run())
+    assert results == [["a", "b", "c"]] * 2
+    assert sources == ([[{"file_name": "Gita.pdf"}]],) * 2
+    assert tokens.starts == 1
+    assert flight.stats() == {"entries": 0, "hits": 1, "misses": 1}
+
+
+def test_late_subscriber_replays_the_buffer():
+    async def run():
+        flight = StreamingSingleFlight()
+        tokens = TokenRun(["a", "b", "c"])
+        first = asyncio.create_task(read(flight, "q", tokens))
+        tokens.step.release()
+        tokens.step.release()
+        for _ in range(5):
+            await asyncio.sleep(0)
+        late = asyncio.create_task(read(flight, "q", tokens))
+        await asyncio.sleep(0)
+        tokens.step.release()
+        return await asyncio.gather(first, late), tokens
+
+    (first, late), tokens = asyncio.run(run())
+    assert first == late == ["a", "b", "c"]
+    assert tokens.starts == 1
+
+
+def test_run_continues_while_anyone_listens_and_stops_after():
+    async def run():
+        flight = StreamingSingleFlight()
+        tokens = TokenRun(["a", "b", "c", "d"])
+        leaving = asyncio.create_task(read(flight, "q", tokens, limit=1))
+        staying = asyncio.create_task(read(flight, "q", tokens, limit=2))
+        tokens.step.release()
+        left = await leaving
+        assert not tokens.closed
+        tokens.step.release()
+        stayed = await staying
+        return left, stayed, tokens, flight
+
+    left, stayed, tokens, flight = asyncio.run(run())
+    assert (left, stayed) == (["a"], ["a", "b"])
+    # The last subscriber left: the run was cancelled before its remaining tokens
+    assert tokens.closed
+    assert flight.stats()["entries"] == 0
+
+
+def test_error_reaches_every_subscriber():
+    async def run():
+        flight = StreamingSingleFlight()
+        tokens = TokenRun(["a"], error=RuntimeError("upstream down"))
+        readers = [asyncio.create_task(read(flight, "q", tokens)) for _ in range(2)]
+        await asyncio.sleep(0)
+        tokens.step.release()
+        return await asyncio.gather(*readers, return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert [str(r) for r in results] == ["upstream down"] * 2
+
+
+def test_different_keys_run_separately():
+    async def run():
+        flight = StreamingSingleFlight()
+        first, second = TokenRun(["a"]), TokenRun(["b"])
+        readers = [asyncio.create_task(read(flight, "q1", first)), asyncio.create_task(read(flight, "q2", second))]
+        await asyncio.sleep(0)
+        first.step.release()
+        second.step.release()
+        return await asyncio.gather(*readers)
+
+    assert asyncio.run(run()) == [["a"], ["b"]]
+
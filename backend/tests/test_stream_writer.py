@@ -0,0 +1,116 @@
+import asyncio
+import json
+
+import pytest
+
+from app.api.stream_writer import STREAM_ERROR_MESSAGE, ChatStreamWriter
+
+
+async def tokens(parts, delay=0.0, first_delay=0.01):
+    for i, part in enumerate(parts):
+        if i:
+            await asyncio.sleep(first_delay if i == 1 else delay)
+        yield part
+
+
+async def collect(writer):
+    await writer.start()
+    return [chunk async for chunk in writer.frames()]
+
+
+def text_of(chunks):
+    return "".join(json.loads(line[2:]) for chunk in chunks for line in chunk.splitlines() if line.startswith("0:"))
+
+
+def test_first_token_alone_then_one_frame():
+    parts = ["Hello"] + [f" word{i}" for i in range(50)]
+    writer = ChatStreamWriter(tokens(parts), flush_interval=10, flush_chars=10 ** 6)
+    chunks = asyncio.run(collect(writer))
+    assert chunks == ['0:"Hello"\n', f'0:{json.dumps("".join(parts[1:]))}\n']
+
+
+def test_frames_cut_at_flush_chars():
+    parts = ["start"] + ["abcde"] * 40
+    writer = ChatStreamWriter(tokens(parts), flush_interval=10, flush_chars=20)
+    chunks = asyncio.run(collect(writer))
+    assert text_of(chunks) == "".join(parts)
+    assert chunks[0] == '0:"start"\n'
+    assert all(len(text_of([chunk])) >= 20 for chunk in chunks[1:-1])
+    assert len(chunks) < len(parts)
+
+
+def test_frames_cut_at_flush_interval():
+    parts = ["start"] + ["x"] * 40
+    writer = ChatStreamWriter(tokens(parts, delay=0.005), flush_interval=0.02, flush_chars=10 ** 6)
+    chunks = asyncio.run(collect(writer))
+    assert text_of(chunks) == "".join(parts)
+    # About one frame per 20ms of a 200ms answer, not one per token nor one in all
+    assert 3 <= len(chunks) <= 30
+
+
+def test_data_parts_keep_their_place():
+    async def stream():
+        yield "Hello"
+        await asyncio.sleep(0)
+        yield " there"
+        writer.data({"timings": {"total": 1.5}})
+        yield "!"
+
+    writer = ChatStreamWriter(stream(), flush_interval=10, flush_chars=10 ** 6)
+
+    async def run():
+        writer.data({"sources": ["Atomic Habits.pdf"]})
+        return await collect(writer)
+
+    chunks = asyncio.run(run())
+    assert "".join(chunks) == (
+        '2:[{"sources":["Atomic Habits.pdf"]}]\n'
+        '0:"Hello"\n0:" there"\n'
+        '2:[{"timings":{"total":1.5}}]\n'
+        '0:"!"\n'
+    )
+
+
+def test_error_before_any_output_is_raised():
+    async def failing():
+        raise RuntimeError("upstream down")
+        yield ""
+
+    writer = ChatStreamWriter(failing())
+    with pytest.raises(RuntimeError, match="upstream down"):
+        asyncio.run(writer.start())
+
+
+def test_error_after_output_ends_the_stream():
+    async def failing():
+        yield "Partial"
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    chunks = asyncio.run(collect(ChatStreamWriter(failing(), flush_interval=10)))
+    assert chunks == ['0:"Partial"\n', f"3:{json.dumps(STREAM_ERROR_MESSAGE)}\n"]
+
+
+def test_disconnect_cancels_the_turn():
+    cancelled = []
+
+    async def endless():
+        try:
+            while True:
+                yield "token "
+                await asyncio.sleep(0.001)
+        finally:
+            cancelled.append(True)
+
+    async def run():
+        writer = ChatStreamWriter(endless(), flush_interval=0.01)
+        await writer.start()
+        frames = writer.frames()
+        first = await frames.__anext__()
+        await frames.aclose()  # the client went away
+        return first, writer._producer
+
+    first, producer = asyncio.run(run())
+    assert first == '0:"token "\n'
+    assert producer.cancelled()
+    assert cancelled == [True]
@@ -5,9 +5,34 @@ import { Send, User, Bot, BookOpen } from 'lucide-react';
 import { useRef, useEffect } from 'react';
 import clsx from 'clsx';
 
+const CHAT_API = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000/api/v1/chat';
+const SESSIONS_API = CHAT_API.replace(/\/chat$/, '/sessions');
+
 export default function ChatInterface() {
+    // Server-side session: once it holds the conversation, only the new message is sent
+    const session = useRef<{ id: string; messages: number } | null>(null);
+
+    const sessionFetch: typeof fetch = async (input, init) => {
+        const body = JSON.parse(init?.body as string);
+        const send = async (id: string, messages: unknown[]) => {
+            const response = await fetch(input, { ...init, body: JSON.stringify({ ...body, session_id: id, messages }) });
+            // The session records the question and its answer once the answer has streamed
+            session.current = response.ok ? { id, messages: body.messages.length + 1 } : null;
+            return response;
+        };
+        if (session.current && body.messages.length === session.current.messages + 1) {
+            const response = await send(session.current.id, body.messages.slice(-1));
+            if (response.status !== 404) return response;
+        }
+        // New, expired or out-of-step (e.g. a regenerated answer): start a session with the whole conversation
+        const created = await fetch(SESSIONS_API, { method: 'POST' });
+        if (!created.ok) return fetch(input, init);  // sessions disabled on the server
+        return send((await created.json()).session_id, body.messages);
+    };
+
     const { messages, input, handleInputChange, handleSubmit, isLoading, error } = useChat({
-        api: process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000/api/v1/chat',
+        api: CHAT_API,
+        fetch: sessionFetch,
         onError: (err) => console.error("Chat error:", err),
     });
 